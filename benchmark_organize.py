@@ -0,0 +1,462 @@
+"""媒体整理工具的性能基准
+
+生成可复现的合成语料（带EXIF的JPEG、缺失或损坏EXIF的JPEG、带mvhd的MP4/MOV、
+文件名带日期的视频，以及按比例制造的同名冲突和重复文件），
+然后分别计时扫描、去重、日期分析、移动各阶段，以JSON输出结果，便于跨提交、跨 --workers 设置比较。
+
+    python benchmark_organize.py --files 5000 --workers 1,4,8 --output bench.json
+"""
+import os
+import sys
+import io
+import json
+import time
+import random
+import builtins
+import threading
+import shutil
+import struct
+import logging
+import warnings
+import argparse
+import platform
+import datetime
+import tempfile
+import subprocess
+import importlib.util
+import concurrent.futures
+
+try:
+    import resource  # 仅Unix
+except ImportError:
+    resource = None
+
+from PIL import Image
+
+DEFAULT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'organize_v1.3.3.py')
+
+# 语料中各类文件的默认比例
+DEFAULT_MIX = {
+    'jpeg_exif': 0.50,          # 带EXIF拍摄日期的JPEG
+    'jpeg_no_exif': 0.10,       # 没有EXIF的JPEG（使用修改时间）
+    'jpeg_corrupt_exif': 0.05,  # EXIF损坏的JPEG
+    'mp4': 0.15,                # 带mvhd的MP4
+    'mov': 0.10,                # 带mvhd的MOV（moov在文件末尾）
+    'filename_dated': 0.10,     # 无有效元数据、文件名带日期的视频
+}
+MP4_EPOCH = datetime.datetime(1904, 1, 1)
+
+# 合成语料
+def _tiny_jpeg_body():
+    """8x8 JPEG（不含EXIF），生成语料时复用，每个文件只拼接不同的段"""
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), (120, 80, 40)).save(buffer, 'JPEG', quality=50)
+    return buffer.getvalue()
+
+def _jpeg_segment(marker, payload):
+    return struct.pack('>BBH', 0xFF, marker, len(payload) + 2) + payload
+
+def _exif_segment(dt):
+    """APP1 EXIF段：IFD0 DateTime + ExifIFD DateTimeOriginal（大端TIFF）"""
+    date_bytes = dt.strftime('%Y:%m:%d %H:%M:%S').encode('ascii') + b'\0'
+    tiff = b'MM\x00\x2a' + struct.pack('>I', 8)
+    # IFD0（偏移8）：2个条目，结束于38；ExifIFD（偏移38）：1个条目，结束于56；之后是两个日期字符串
+    tiff += struct.pack('>H', 2)
+    tiff += struct.pack('>HHII', 306, 2, 20, 56)
+    tiff += struct.pack('>HHII', 34665, 4, 1, 38)
+    tiff += struct.pack('>I', 0)
+    tiff += struct.pack('>H', 1)
+    tiff += struct.pack('>HHII', 36867, 2, 20, 76)
+    tiff += struct.pack('>I', 0)
+    tiff += date_bytes + date_bytes
+    return _jpeg_segment(0xE1, b'Exif\0\0' + tiff)
+
+def _corrupt_exif_segment(rng):
+    """APP1 EXIF段：TIFF头有效，但IFD偏移越界且内容随机"""
+    return _jpeg_segment(0xE1, b'Exif\0\0MM\x00\x2a\xff\xff\xff\xf0' + rng.randbytes(32))
+
+def _padding_segments(rng, size):
+    """用COM段把JPEG填充到指定大小（内容随机，保证每个文件不同）"""
+    segments = []
+    while size > 0:
+        chunk = min(size, 65000)
+        segments.append(_jpeg_segment(0xFE, rng.randbytes(chunk)))
+        size -= chunk
+    return b''.join(segments)
+
+def _box(box_type, payload):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+def _video_bytes(rng, dt, brand, moov_at_end, size):
+    """ftyp + moov(mvhd) + mdat 的最小MP4/MOV"""
+    seconds = int((dt - MP4_EPOCH).total_seconds())
+    mvhd = _box(b'mvhd', b'\0\0\0\0' + struct.pack('>II', seconds, seconds) + b'\0' * 88)
+    moov = _box(b'moov', mvhd)
+    ftyp = _box(b'ftyp', brand + b'\0\0\0\0' + brand)
+    mdat = _box(b'mdat', rng.randbytes(max(0, size - len(ftyp) - len(moov) - 8)))
+    return ftyp + (mdat + moov if moov_at_end else moov + mdat)
+
+def generate_corpus(root, count, seed=1, mix=None, collision_ratio=0.05, duplicate_ratio=0.05,
+                    file_kb=16, dirs=20, start=datetime.datetime(2015, 1, 1), days=3650):
+    """在root下生成count个媒体文件（分布在dirs个子目录中，dirs=0时不建子目录），返回语料统计
+
+    同样的参数和种子生成完全相同的语料。
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    jpeg_body = _tiny_jpeg_body()
+    if dirs > 0:
+        folders = [os.path.join(root, f"card{i // 5:02d}", f"DCIM{i % 5:03d}") for i in range(dirs)]
+    else:
+        folders = [root]  # 全部放在顶层（早期版本不递归子目录）
+    for folder in folders:
+        os.makedirs(folder, exist_ok=True)
+
+    generated = []  # (路径, 内容, 日期)
+    counts = {kind: 0 for kind in kinds}
+    counts.update(collision=0, duplicate=0)
+    total_bytes = 0
+    for i in range(count):
+        folder = rng.choice(folders)
+        dt = start + datetime.timedelta(seconds=rng.randrange(days * 86400))
+        size = max(1024, int(rng.uniform(0.5, 1.5) * file_kb * 1024))
+        roll = rng.random()
+        if generated and roll < duplicate_ratio:
+            # 其他目录中内容完全相同的副本
+            source_path, data, dt = rng.choice(generated)
+            path = os.path.join(folder, f"copy_{i:07d}{os.path.splitext(source_path)[1]}")
+            counts['duplicate'] += 1
+        else:
+            kind = rng.choices(kinds, weights)[0]
+            counts[kind] += 1
+            if kind.startswith('jpeg'):
+                if kind == 'jpeg_exif':
+                    extra = _exif_segment(dt)
+                elif kind == 'jpeg_corrupt_exif':
+                    extra = _corrupt_exif_segment(rng)
+                else:
+                    extra = b''
+                data = jpeg_body[:2] + extra + _padding_segments(rng, size - len(jpeg_body)) + jpeg_body[2:]
+                name = f"IMG_{i:07d}.jpg"
+            elif kind == 'filename_dated':
+                data = rng.randbytes(size)
+                name = f"VID_{dt:%Y%m%d_%H%M%S}_{i:07d}.mp4"
+            else:
+                data = _video_bytes(rng, dt, b'qt  ' if kind == 'mov' else b'isom', kind == 'mov', size)
+                name = f"MVI_{i:07d}.{kind}"
+            if generated and roll < duplicate_ratio + collision_ratio:
+                # 与已有文件同名、同日期但内容不同（整理到同一目录时产生名称冲突）
+                other_path, _, other_dt = rng.choice(generated)
+                other_ext = os.path.splitext(other_path)[1]
+                if other_ext == os.path.splitext(name)[1] and not kind == 'filename_dated':
+                    name = os.path.basename(other_path)
+                    dt = other_dt
+                    if kind == 'jpeg_exif':
+                        data = (jpeg_body[:2] + _exif_segment(dt) +
+                                _padding_segments(rng, size - len(jpeg_body)) + jpeg_body[2:])
+                    elif kind in ('mp4', 'mov'):
+                        data = _video_bytes(rng, dt, b'qt  ' if kind == 'mov' else b'isom', kind == 'mov', size)
+                    counts['collision'] += 1
+            path = os.path.join(folder, name)
+            if os.path.exists(path):
+                path = os.path.join(folder, f"{i:07d}_{name}")
+
+        with open(path, 'wb') as f:
+            f.write(data)
+        # 修改时间也由种子决定，没有元数据的文件在各版本间的归档位置可比较
+        mtime = (dt - datetime.datetime(1970, 1, 1)).total_seconds()
+        os.utime(path, (mtime, mtime))
+        generated.append((path, data, dt))
+        total_bytes += len(data)
+
+    return {'files': count, 'bytes': total_bytes, 'seed': seed, 'kinds': counts}
+
+# 阶段计时
+def _read_proc_io():
+    """读取 /proc/self/io 中的 syscr/syscw（仅Linux）
+
+    只统计read/write类调用（含读取文件内容和写日志），不包括stat、open、目录读取和重命名。
+    """
+    try:
+        with open('/proc/self/io') as f:
+            fields = dict(line.split(': ') for line in f.read().splitlines())
+        return int(fields['syscr']), int(fields['syscw'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+# 被计数的文件系统调用：类别 -> os模块中的函数名
+COUNTED_OS_CALLS = {
+    'stat': ('stat', 'lstat', 'fstat'),
+    'open': ('open',),
+    'listdir': ('scandir', 'listdir'),
+    'rename': ('rename', 'replace', 'link'),
+    'unlink': ('unlink', 'remove'),
+    'mkdir': ('mkdir',),
+    'xattr': ('getxattr', 'setxattr', 'listxattr', 'removexattr'),
+}
+
+class SyscallCounter:
+    """在本进程内包装os模块的文件系统函数、内置open和脚本的原生重命名，按类别计数
+
+    统计的是Python层的调用次数：os.path.exists/isdir等经由os.stat，会被计入；
+    DirEntry.is_file()/stat()、SQLite和PIL内部的C层调用不经过这些函数，不计入；
+    listdir按目录计一次（实际的getdents次数随目录大小增加）；进程池工作进程中的调用也不计入。
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.originals = []
+
+    def _wrap(self, category, func):
+        counts = self.counts
+        lock = self.lock
+        def counted(*args, **kwargs):
+            with lock:
+                counts[category] = counts.get(category, 0) + 1
+            return func(*args, **kwargs)
+        return counted
+
+    def _patch(self, owner, name, category):
+        original = getattr(owner, name, None)
+        if original is None:
+            return
+        self.originals.append((owner, name, original))
+        setattr(owner, name, self._wrap(category, original))
+
+    def install(self, org=None):
+        if self.originals:
+            return
+        for category, names in COUNTED_OS_CALLS.items():
+            for name in names:
+                self._patch(os, name, category)
+        self._patch(builtins, 'open', 'open')
+        native_rename = getattr(org, '_load_native_rename', None)
+        if native_rename is not None:
+            # renameat2/renamex_np 通过ctypes调用，不经过os模块
+            loader = native_rename
+            def load_counted():
+                func = loader()
+                return func and self._wrap('rename', func)
+            self.originals.append((org, '_load_native_rename', native_rename))
+            org._load_native_rename = load_counted
+
+    def uninstall(self):
+        for owner, name, original in reversed(self.originals):
+            setattr(owner, name, original)
+        self.originals = []
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+syscall_counter = SyscallCounter()
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak  # macOS单位为字节
+
+class PhaseMeter:
+    """统计单个阶段的耗时、吞吐量、系统调用和内存峰值"""
+    def __init__(self, name):
+        self.name = name
+        self.files = 0
+        self.bytes = 0
+
+    def __enter__(self):
+        self.io_start = _read_proc_io()
+        self.calls_start = syscall_counter.snapshot()
+        self.rusage_start = resource.getrusage(resource.RUSAGE_SELF) if resource else None
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        self.calls_end = syscall_counter.snapshot()
+        self.io_end = _read_proc_io()
+        self.rusage_end = resource.getrusage(resource.RUSAGE_SELF) if resource else None
+        return False
+
+    def result(self):
+        elapsed = max(self.seconds, 1e-9)
+        data = {
+            'seconds': round(self.seconds, 4),
+            'files': self.files,
+            'bytes': self.bytes,
+            'files_per_sec': round(self.files / elapsed, 1),
+            'mb_per_sec': round(self.bytes / 1024 / 1024 / elapsed, 2),
+            'syscalls': {category: self.calls_end.get(category, 0) - self.calls_start.get(category, 0)
+                         for category in COUNTED_OS_CALLS},
+            'read_calls': None,   # /proc/self/io 的 syscr
+            'write_calls': None,  # /proc/self/io 的 syscw
+            'cpu_user': None,
+            'cpu_sys': None,
+            'peak_rss_kb': _peak_rss_kb(),  # 进程启动以来的峰值（各阶段依次运行）
+        }
+        if self.io_start and self.io_end:
+            data['read_calls'] = self.io_end[0] - self.io_start[0]
+            data['write_calls'] = self.io_end[1] - self.io_start[1]
+        if self.rusage_start and self.rusage_end:
+            data['cpu_user'] = round(self.rusage_end.ru_utime - self.rusage_start.ru_utime, 4)
+            data['cpu_sys'] = round(self.rusage_end.ru_stime - self.rusage_start.ru_stime, 4)
+        return data
+
+def load_organizer(script_path):
+    """按文件路径加载整理脚本（注册到sys.modules，进程池可以序列化其中的函数）"""
+    name = 'organize_bench_' + os.path.splitext(os.path.basename(script_path))[0].replace('.', '_')
+    spec = importlib.util.spec_from_file_location(name, script_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def _clear_function_caches(org):
+    """清空模块内的lru_cache，每轮都从冷缓存开始"""
+    for value in vars(org).values():
+        if callable(getattr(value, 'cache_clear', None)):
+            value.cache_clear()
+
+def run_phases(org, source_dir, target_dir, workers, executor='thread', dedup=True):
+    """依次运行扫描、去重、日期分析、移动阶段（不使用持久化缓存），返回各阶段结果"""
+    _clear_function_caches(org)
+    syscall_counter.install(org)
+    try:
+        return _run_phases(org, source_dir, target_dir, workers, executor, dedup)
+    finally:
+        syscall_counter.uninstall()
+
+def _run_phases(org, source_dir, target_dir, workers, executor, dedup):
+    phases = {}
+
+    with PhaseMeter('scan') as meter:
+        records = list(org.iter_media_files(source_dir))
+    meter.files = len(records)
+    meter.bytes = sum(record.size for record in records)
+    phases['scan'] = meter.result()
+
+    if dedup:
+        with PhaseMeter('dedup') as meter:
+            duplicates = org.detect_duplicates(records, source_dir, target_dir, workers)
+        meter.files = len(records)
+        meter.bytes = sum(record.size for record in records)
+        phases['dedup'] = dict(meter.result(), duplicates=len(duplicates))
+
+    stats = org.ProcessingStats(total_files=len(records))
+    directory_index = org.TargetDirectoryIndex(target_dir)
+    with PhaseMeter('analyze') as meter:
+        if executor == 'process':
+            tasks = org.compute_targets_in_processes(records, target_dir, stats, None, None, workers)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+                tasks = list(pool.map(
+                    lambda record: org.calculate_target_path(record, target_dir, stats, None, None, directory_index),
+                    records
+                ))
+        tasks = [task for task in tasks if task]
+    meter.files = len(records)
+    meter.bytes = sum(record.size for record in records)
+    phases['analyze'] = dict(meter.result(), date_sources=_count_date_sources(tasks))
+
+    target_dev = os.stat(target_dir).st_dev
+    with PhaseMeter('move') as meter:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, 8)) as pool:
+            list(pool.map(lambda task: org.process_file(task, stats, None, target_dev), tasks))
+    meter.files = len(tasks)
+    meter.bytes = sum(task.size for task in tasks)
+    phases['move'] = meter.result()
+
+    phases['totals'] = stats.get_stats()
+    phases['totals'].pop('elapsed', None)
+    return phases
+
+def _count_date_sources(tasks):
+    counts = {}
+    for task in tasks:
+        counts[task.date_source] = counts.get(task.date_source, 0) + 1
+    return counts
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def parse_mix(text):
+    """解析 "jpeg_exif=0.5,mp4=0.2" 形式的文件比例"""
+    mix = dict(DEFAULT_MIX)
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        kind, _, weight = item.partition('=')
+        if kind not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"未知的文件类型: {kind}（可选: {', '.join(DEFAULT_MIX)}）")
+        mix[kind] = float(weight)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description="媒体整理工具分阶段性能基准（结果为JSON）")
+    parser.add_argument("--script", default=DEFAULT_SCRIPT, help="被测试的整理脚本", metavar="PATH")
+    parser.add_argument("--files", type=int, default=2000, help="语料文件数（默认2000）", metavar="N")
+    parser.add_argument("--file-kb", type=int, default=16, help="平均文件大小KB（默认16）", metavar="KB")
+    parser.add_argument("--dirs", type=int, default=20, help="源子目录数（默认20，0表示全部放在顶层）", metavar="N")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子（相同种子生成相同语料）")
+    parser.add_argument("--mix", type=parse_mix, default=dict(DEFAULT_MIX),
+                        help="各类文件比例，如 jpeg_exif=0.5,mp4=0.2", metavar="SPEC")
+    parser.add_argument("--collisions", type=float, default=0.05, help="同名冲突比例（默认0.05）")
+    parser.add_argument("--duplicates", type=float, default=0.05, help="重复文件比例（默认0.05）")
+    parser.add_argument("--workers", default="8", help="逗号分隔的线程数列表（默认8）", metavar="LIST")
+    parser.add_argument("--executor", choices=("thread", "process"), default="thread",
+                        help="日期分析阶段的并行方式")
+    parser.add_argument("--no-dedup", action="store_true", help="跳过全局去重阶段")
+    parser.add_argument("--repeat", type=int, default=1, help="每个线程数重复运行次数", metavar="N")
+    parser.add_argument("--workdir", default=None, help="语料所在目录（默认临时目录，结束后删除）", metavar="PATH")
+    parser.add_argument("--output", default=None, help="结果写入文件（默认输出到标准输出）", metavar="FILE")
+    args = parser.parse_args()
+
+    org = load_organizer(os.path.abspath(args.script))
+    org.logger.setLevel(logging.ERROR)  # 逐文件日志会显著影响计时
+    warnings.filterwarnings('ignore', category=UserWarning)  # 损坏EXIF的PIL警告
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='organize_bench_')
+    report = {
+        'script': os.path.basename(args.script),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'started': datetime.datetime.now().isoformat(timespec='seconds'),
+        'corpus': None,
+        'runs': [],
+    }
+    try:
+        for workers in [int(w) for w in args.workers.split(',') if w.strip()]:
+            for repeat in range(args.repeat):
+                # 每轮重新生成同样的语料（移动阶段会清空源目录）
+                source_dir = os.path.join(workdir, 'source')
+                target_dir = os.path.join(workdir, 'target')
+                shutil.rmtree(source_dir, ignore_errors=True)
+                shutil.rmtree(target_dir, ignore_errors=True)
+                os.makedirs(target_dir)
+                report['corpus'] = generate_corpus(
+                    source_dir, args.files, args.seed, args.mix, args.collisions, args.duplicates,
+                    args.file_kb, args.dirs
+                )
+                print(f"workers={workers} 第{repeat + 1}轮 ...", file=sys.stderr)
+                phases = run_phases(org, source_dir, target_dir, workers, args.executor, not args.no_dedup)
+                report['runs'].append({'workers': workers, 'repeat': repeat, 'phases': phases})
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        print(f"结果已写入 {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""各版本整理脚本的回归基准
+
+用同一份合成语料（见 benchmark_organize.py）依次运行 organize_v1.0 / v1.1 / v1.3.1 / v1.3.2 / v1.3.3，
+每个版本在独立的临时目录和子进程中运行，记录耗时、吞吐量、内存峰值和每个文件的归档位置。
+相邻版本比较：新版本慢于旧版本超过阈值，或归档位置不同的文件比例超过阈值时返回非零退出码。
+
+    python benchmark_versions.py --files 2000 --output versions.json
+"""
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import tempfile
+import platform
+import datetime
+import subprocess
+
+from benchmark_organize import generate_corpus, DEFAULT_MIX, _git_commit
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (版本, 脚本, 入口函数)，按发布顺序排列
+VERSIONS = [
+    ('1.0', 'organize_v1.0.py', 'organize_images'),
+    ('1.1', 'organize_v1.1.py', 'organize_media'),
+    ('1.3.1', 'organize_v1.3.1.py', 'organize_media'),
+    ('1.3.2', 'organize_v1.3.2.py', 'organize_media'),
+    ('1.3.3', 'organize_v1.3.3.py', 'organize_media'),
+]
+
+# 子进程中执行：加载脚本、关闭日志、调用入口函数并以JSON输出耗时和内存峰值
+RUNNER = r'''
+import sys, json, time, logging, importlib.util, warnings
+script, func, source, target = sys.argv[1:5]
+warnings.filterwarnings('ignore')
+spec = importlib.util.spec_from_file_location('organize_under_test', script)
+module = importlib.util.module_from_spec(spec)
+sys.modules['organize_under_test'] = module
+spec.loader.exec_module(module)
+logging.disable(logging.CRITICAL)
+start = time.perf_counter()
+getattr(module, func)(source, target)
+seconds = time.perf_counter() - start
+peak = None
+try:
+    # VmHWM 只统计本进程（ru_maxrss 在Linux上会继承父进程的峰值）
+    with open('/proc/self/status') as f:
+        peak = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+except (OSError, StopIteration):
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = peak // 1024 if sys.platform == 'darwin' else peak
+    except ImportError:
+        pass
+sys.__stdout__.write('\n' + json.dumps({'seconds': seconds, 'peak_rss_kb': peak}) + '\n')
+'''
+
+def _content_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+def index_tree(root):
+    """内容摘要 -> 相对路径列表（跳过隐藏文件，即各版本的缓存和日志文件）"""
+    index = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for filename in filenames:
+            if filename.startswith('.'):
+                continue
+            path = os.path.join(dirpath, filename)
+            index.setdefault(_content_digest(path), []).append(os.path.relpath(path, root))
+    return index
+
+def placement(target_index):
+    """每个内容摘要被归档到的日期文件夹集合（文件名后缀 _1/_2 受并发顺序影响，不参与比较）"""
+    return {digest: sorted({os.path.dirname(path) for path in paths}) for digest, paths in target_index.items()}
+
+def run_version(script, func, corpus_dir, workdir, timeout):
+    """在语料副本上运行一个版本，返回耗时、内存峰值和归档结果"""
+    source_dir = os.path.join(workdir, 'source')
+    target_dir = os.path.join(workdir, 'target')
+    shutil.rmtree(workdir, ignore_errors=True)
+    shutil.copytree(corpus_dir, source_dir, copy_function=shutil.copy2)
+    os.makedirs(target_dir)
+
+    proc = subprocess.run(
+        [sys.executable, '-c', RUNNER, script, func, source_dir, target_dir],
+        cwd=workdir, capture_output=True, text=True, timeout=timeout
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(script)} 运行失败:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    target_index = index_tree(target_dir)
+    result['placement'] = placement(target_index)
+    result['placed'] = sum(len(paths) for paths in target_index.values())
+    result['left_in_source'] = sum(len(paths) for paths in index_tree(source_dir).values())
+    return result
+
+def compare_placement(old, new):
+    """比较两个版本的归档位置，只统计两个版本都整理了的内容"""
+    common = old.keys() & new.keys()
+    differing = sorted(digest for digest in common if old[digest] != new[digest])
+    return {
+        'compared': len(common),
+        'differing': len(differing),
+        'fraction': len(differing) / len(common) if common else 0.0,
+        'only_old': len(old.keys() - new.keys()),
+        'only_new': len(new.keys() - old.keys()),
+        'examples': [{'old': old[d], 'new': new[d]} for d in differing[:5]],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="各版本整理脚本的回归基准（结果为JSON）")
+    parser.add_argument("--versions", default=','.join(v for v, _, _ in VERSIONS),
+                        help="逗号分隔的版本列表（默认全部）", metavar="LIST")
+    parser.add_argument("--files", type=int, default=1000, help="语料文件数（默认1000）", metavar="N")
+    parser.add_argument("--file-kb", type=int, default=16, help="平均文件大小KB（默认16）", metavar="KB")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    parser.add_argument("--dirs", type=int, default=0,
+                        help="源子目录数（默认0：v1.0和v1.1只整理顶层文件）", metavar="N")
+    parser.add_argument("--duplicates", type=float, default=0.0,
+                        help="重复文件比例（默认0，早期版本不去重）")
+    parser.add_argument("--collisions", type=float, default=0.05, help="同名冲突比例（默认0.05）")
+    parser.add_argument("--repeat", type=int, default=3, help="每个版本运行次数，取最短耗时（默认3）", metavar="N")
+    parser.add_argument("--time-threshold", type=float, default=0.10,
+                        help="新版本允许比上一版本慢的比例（默认0.10）", metavar="RATIO")
+    parser.add_argument("--placement-threshold", type=float, default=0.0,
+                        help="允许归档位置不同的文件比例（默认0）", metavar="RATIO")
+    parser.add_argument("--timeout", type=int, default=1800, help="单次运行超时秒数", metavar="SEC")
+    parser.add_argument("--output", default=None, help="结果写入文件（默认输出到标准输出）", metavar="FILE")
+    args = parser.parse_args()
+
+    wanted = [v.strip() for v in args.versions.split(',') if v.strip()]
+    known = {v: (script, func) for v, script, func in VERSIONS}
+    unknown = [v for v in wanted if v not in known]
+    if unknown:
+        parser.error(f"未知版本: {', '.join(unknown)}（可选: {', '.join(known)}）")
+    wanted = [v for v, _, _ in VERSIONS if v in wanted]
+
+    workdir = tempfile.mkdtemp(prefix='organize_versions_')
+    report = {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'started': datetime.datetime.now().isoformat(timespec='seconds'),
+        'corpus': None,
+        'versions': {},
+        'comparisons': [],
+        'failures': [],
+    }
+    placements = {}
+    try:
+        corpus_dir = os.path.join(workdir, 'corpus')
+        report['corpus'] = generate_corpus(corpus_dir, args.files, args.seed, dict(DEFAULT_MIX),
+                                           args.collisions, args.duplicates, args.file_kb, args.dirs)
+        for version in wanted:
+            script, func = known[version]
+            runs = []
+            for repeat in range(max(1, args.repeat)):
+                print(f"v{version} 第{repeat + 1}轮 ...", file=sys.stderr)
+                runs.append(run_version(os.path.join(SCRIPT_DIR, script), func, corpus_dir,
+                                        os.path.join(workdir, f"v{version}"), args.timeout))
+            best = min(runs, key=lambda run: run['seconds'])
+            placements[version] = best.pop('placement')
+            report['versions'][version] = {
+                'script': script,
+                'seconds': round(best['seconds'], 4),
+                'all_seconds': [round(run['seconds'], 4) for run in runs],
+                'files_per_sec': round(args.files / max(best['seconds'], 1e-9), 1),
+                'peak_rss_kb': max((run['peak_rss_kb'] or 0) for run in runs) or None,
+                'placed': best['placed'],
+                'left_in_source': best['left_in_source'],
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # 相邻版本比较
+    for old, new in zip(wanted, wanted[1:]):
+        old_time = report['versions'][old]['seconds']
+        new_time = report['versions'][new]['seconds']
+        comparison = {
+            'old': old,
+            'new': new,
+            'speedup': round(old_time / max(new_time, 1e-9), 3),
+            'placement': compare_placement(placements[old], placements[new]),
+        }
+        report['comparisons'].append(comparison)
+        if new_time > old_time * (1 + args.time_threshold):
+            report['failures'].append(f"v{new} 比 v{old} 慢 {new_time / old_time - 1:.1%}")
+        if comparison['placement']['fraction'] > args.placement_threshold:
+            report['failures'].append(
+                f"v{new} 与 v{old} 归档位置不同: {comparison['placement']['differing']}"
+                f"/{comparison['placement']['compared']} 个文件"
+            )
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    for failure in report['failures']:
+        print(f"❌ {failure}", file=sys.stderr)
+    sys.exit(1 if report['failures'] else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""全局内容去重（--dedup）的脚本级检查
+
+在临时目录中构造小型源目录和目标库，以子进程运行 organize_v1.3.3.py，检查去重不会丢失数据：
+内容相同但文件名不同、大小相同但内容不同、符号链接、目标库中的文件作为保留文件、--plan 不修改任何文件。
+任一检查失败时返回非零退出码。
+
+    python check_dedup.py
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import subprocess
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'organize_v1.3.3.py')
+
+def run_organizer(source, target, *options):
+    proc = subprocess.run([sys.executable, SCRIPT, '--source', source, '--target', target, *options],
+                          capture_output=True, text=True, timeout=300)
+    if proc.returncode != 0:
+        raise RuntimeError(f"organize_v1.3.3.py 运行失败:\n{proc.stderr[-2000:]}")
+
+def write_file(path, data, mtime=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+def digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+def snapshot(root):
+    """相对路径 -> (类型, 内容摘要或链接目标, mtime_ns, 扩展属性)；跳过整理工具自己的隐藏文件"""
+    result = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for name in dirnames + filenames:
+            if name.startswith('.'):
+                continue
+            path = os.path.join(dirpath, name)
+            st = os.lstat(path)
+            if os.path.islink(path):
+                entry = ('link', os.readlink(path), None, ())
+            elif os.path.isdir(path):
+                entry = ('dir', None, None, ())
+            else:
+                xattrs = tuple(sorted(os.listxattr(path))) if hasattr(os, 'listxattr') else ()
+                entry = ('file', digest(path), st.st_mtime_ns, xattrs)
+            result[os.path.relpath(path, root)] = entry
+    return result
+
+def regular_files(root):
+    """内容摘要 -> 文件名列表（只统计普通文件）"""
+    found = {}
+    for rel, (kind, value, _, _) in snapshot(root).items():
+        if kind == 'file':
+            found.setdefault(value, []).append(os.path.basename(rel))
+    return found
+
+# 各项检查：在 workdir 中构造目录并运行，返回失败说明列表
+def check_same_content_different_names(workdir):
+    source, target = os.path.join(workdir, 'src'), os.path.join(workdir, 'dst')
+    data = os.urandom(5000)
+    now = time.time()
+    write_file(os.path.join(source, 'IMG_0001.jpg'), data, now - 3600)
+    write_file(os.path.join(source, 'IMG_0001 (1).jpg'), data, now)
+    write_file(os.path.join(source, 'b', 'copy_IMG_0001.jpg'), data, now)
+    run_organizer(source, target, '--dedup')
+    kept = sorted(name for names in regular_files(target).values() for name in names)
+    errors = []
+    if kept != ['IMG_0001.jpg']:
+        errors.append(f"应只保留最早的原始文件 IMG_0001.jpg，实际目标目录中: {kept}")
+    if regular_files(source):
+        errors.append(f"源目录中仍有文件: {regular_files(source)}")
+    return errors
+
+def check_default_keeps_renamed_copies(workdir):
+    source, target = os.path.join(workdir, 'src'), os.path.join(workdir, 'dst')
+    data = os.urandom(5000)
+    write_file(os.path.join(source, 'a.jpg'), data)
+    write_file(os.path.join(source, 'b.jpg'), data)
+    run_organizer(source, target)
+    names = sorted(regular_files(target).get(hashlib.blake2b(data, digest_size=16).hexdigest(), []))
+    return [] if names == ['a.jpg', 'b.jpg'] else [f"未加 --dedup 时应保留两个文件，实际: {names}"]
+
+def check_same_size_different_content(workdir):
+    source, target = os.path.join(workdir, 'src'), os.path.join(workdir, 'dst')
+    # 头尾各64KB相同、中间不同：部分哈希相同，必须比较完整哈希
+    head, tail = os.urandom(64 * 1024), os.urandom(64 * 1024)
+    write_file(os.path.join(source, 'a.jpg'), head + os.urandom(4096) + tail)
+    write_file(os.path.join(source, 'b.jpg'), head + os.urandom(4096) + tail)
+    write_file(os.path.join(source, 'c.jpg'), os.urandom(5000))
+    write_file(os.path.join(source, 'd.jpg'), os.urandom(5000))
+    expected = {digest(os.path.join(source, name)) for name in ('a.jpg', 'b.jpg', 'c.jpg', 'd.jpg')}
+    run_organizer(source, target, '--dedup')
+    missing = expected - set(regular_files(target))
+    return [f"大小相同但内容不同的文件丢失了 {len(missing)} 个"] if missing else []
+
+def check_symlink(workdir):
+    source, target = os.path.join(workdir, 'src'), os.path.join(workdir, 'dst')
+    data = os.urandom(5000)
+    write_file(os.path.join(source, 'real', 'a.jpg'), data)
+    os.symlink(os.path.join('real', 'a.jpg'), os.path.join(source, '0link.jpg'))
+    run_organizer(source, target, '--dedup')
+    wanted = hashlib.blake2b(data, digest_size=16).hexdigest()
+    if wanted in regular_files(target) or wanted in regular_files(source):
+        return []
+    return ["符号链接指向的真实文件被删除"]
+
+def check_library_keeper(workdir):
+    source, target = os.path.join(workdir, 'src'), os.path.join(workdir, 'dst')
+    data = os.urandom(200 * 1024)
+    library_file = os.path.join(target, '2020-01-01', 'lib.jpg')
+    write_file(library_file, data, time.time())
+    write_file(os.path.join(source, 'older_copy.jpg'), data, time.time() - 86400)
+    before = snapshot(os.path.dirname(library_file))
+    run_organizer(source, target, '--dedup')
+    errors = []
+    if regular_files(source):
+        errors.append("与目标库中文件相同的源文件没有被去重")
+    names = sorted(name for names in regular_files(target).values() for name in names)
+    if names != ['lib.jpg']:
+        errors.append(f"目标库中应只有 lib.jpg，实际: {names}")
+    after = snapshot(os.path.dirname(library_file))
+    if {rel: entry[:3] for rel, entry in before.items()} != {rel: entry[:3] for rel, entry in after.items()}:
+        errors.append("目标库中作为保留文件的 lib.jpg 被修改")
+    return errors
+
+def check_plan_changes_nothing(workdir):
+    source, target = os.path.join(workdir, 'src'), os.path.join(workdir, 'dst')
+    data = os.urandom(200 * 1024)
+    write_file(os.path.join(target, '2020-01-01', 'lib.jpg'), data)
+    write_file(os.path.join(source, 'copy.jpg'), data)
+    same = os.urandom(5000)
+    write_file(os.path.join(source, 'x', 'a.jpg'), same)
+    write_file(os.path.join(source, 'y', 'b.jpg'), same)
+    write_file(os.path.join(source, 'c.jpg'), os.urandom(5000))
+    os.symlink('c.jpg', os.path.join(source, 'link.jpg'))
+    plan_path = os.path.join(workdir, 'plan.jsonl')
+    before = (snapshot(source), snapshot(target))
+    run_organizer(source, target, '--dedup', '--plan', plan_path)
+    after = (snapshot(source), snapshot(target))
+    errors = []
+    if before != after:
+        changed = sorted(set(before[0].items()) ^ set(after[0].items()) | set(before[1].items()) ^ set(after[1].items()))
+        errors.append(f"--plan 修改了文件: {changed[:5]}")
+    with open(plan_path, encoding='utf-8') as f:
+        verdicts = [entry.get('verdict') for entry in map(json.loads, f) if 'src' in entry]
+    if verdicts.count('duplicate') != 2:
+        errors.append(f"计划中应有2个重复文件，实际: {verdicts.count('duplicate')}")
+    return errors
+
+CHECKS = (
+    ('内容相同、文件名不同', check_same_content_different_names),
+    ('默认不做全局去重', check_default_keeps_renamed_copies),
+    ('大小相同、内容不同', check_same_size_different_content),
+    ('符号链接', check_symlink),
+    ('目标库中的文件作为保留文件', check_library_keeper),
+    ('--plan 不修改任何文件', check_plan_changes_nothing),
+)
+
+def main():
+    failures = 0
+    for title, check in CHECKS:
+        workdir = tempfile.mkdtemp(prefix='organize_dedup_check_')
+        try:
+            errors = check(workdir)
+        except Exception as e:
+            errors = [f"{type(e).__name__}: {e}"]
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        if errors:
+            failures += 1
+            print(f"❌ {title}")
+            for error in errors:
+                print(f"   {error}")
+        else:
+            print(f"✅ {title}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import errno
 import shutil
 from PIL import Image
 from PIL.ExifTags import TAGS
@@ -6,6 +7,7 @@ import datetime
 import subprocess
 import concurrent.futures
 import logging
+import logging.handlers
 import time
 from functools import lru_cache
 import sys
@@ -14,6 +16,15 @@ import threading
 import math
 from collections import deque
 import platform
+import signal
+import re
+import queue
+import sqlite3
+import struct
+import json
+import bisect
+import cProfile
+import pstats
 
 # ANSI颜色代码
 class Colors:
@@ -41,27 +52,77 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class ShardedCounter:
+    """按线程分片的计数器：每个线程只写自己的分片（不加锁也不会丢失计数），读取时求和"""
+    def __init__(self):
+        self.local = threading.local()
+        self.cells = []
+        self.lock = threading.Lock()  # 只在线程第一次计数时使用
+        
+    def add(self, num=1):
+        try:
+            self.local.cell[0] += num
+        except AttributeError:
+            cell = self.local.cell = [num]
+            with self.lock:
+                self.cells.append(cell)
+                
+    @property
+    def value(self):
+        return sum(cell[0] for cell in self.cells)
+
+# 终端大小变化（SIGWINCH）时递增，进度条据此重新获取终端大小
+_terminal_generation = [0]
+_winch_handler_installed = False
+
+def _install_winch_handler():
+    """安装SIGWINCH处理（只能在主线程安装；不支持的系统上终端大小保持首次获取的值）"""
+    global _winch_handler_installed
+    if _winch_handler_installed or not hasattr(signal, 'SIGWINCH'):
+        return
+    try:
+        previous = signal.getsignal(signal.SIGWINCH)
+        
+        def on_winch(signum, frame):
+            _terminal_generation[0] += 1
+            if callable(previous):
+                previous(signum, frame)
+        
+        signal.signal(signal.SIGWINCH, on_winch)
+        _winch_handler_installed = True
+    except ValueError:
+        pass
+
+PROGRESS_REFRESH_INTERVAL = 0.1  # 进度条刷新间隔（秒）
+
 # 高级进度条系统（固定位置）
 class FixedProgressBar:
     def __init__(self, total, desc="处理中", bar_length=50, unit='文件', position='bottom'):
         """
         固定位置的进度条
         position: 'bottom' 或 'top'
+        
+        工作线程只增加计数器，由单独的渲染线程按固定频率重绘。
         """
-        self.total = total
+        self.base_total = total
         self.desc = desc
         self.bar_length = bar_length
         self.unit = unit
         self.position = position
         self.start_time = time.time()
-        self.completed = 0
-        self.last_update = 0
+        self.done_counter = ShardedCounter()
+        self.total_counter = ShardedCounter()  # 流式处理时随扫描增长的总数
         self.speed_history = deque(maxlen=10)  # 速度历史（平滑显示）
         self.window_height = 25  # 默认控制台高度
         self.visible = False
         self.last_known_lines = 0
+        self.extra_text = ""  # 附加状态（如流式模式的队列深度）
+        self.render_lock = threading.Lock()
+        self.stop_event = threading.Event()
         
-        # 获取终端高度
+        # 获取终端高度（之后只在终端大小变化时重新获取）
+        _install_winch_handler()
+        self.terminal_generation = _terminal_generation[0]
         self._get_terminal_size()
         
         if platform.system() == 'Windows':
@@ -75,6 +136,16 @@ class FixedProgressBar:
         if total > 0:
             # 初始化显示
             self._show()
+        self.render_thread = threading.Thread(target=self._render_loop, name="progress-render", daemon=True)
+        self.render_thread.start()
+    
+    @property
+    def completed(self):
+        return self.done_counter.value
+    
+    @property
+    def total(self):
+        return self.base_total + self.total_counter.value
     
     def _get_terminal_size(self):
         """获取终端大小"""
@@ -89,25 +160,40 @@ class FixedProgressBar:
             return (80, 25)
     
     def update(self, num=1):
-        """更新进度"""
-        self.completed += num
-        current_time = time.time()
-        elapsed = current_time - self.last_update
-        
-        # 每0.1秒或当完成时更新一次
-        if elapsed >= 0.1 or self.completed >= self.total:
-            self._update_display()
-            self.last_update = current_time
+        """更新进度（只增加计数，显示由渲染线程负责）"""
+        self.done_counter.add(num)
     
     def increment(self):
         """增加一个完成项（简化方法）"""
-        self.update(1)
+        self.done_counter.add(1)
     
-    def _format_speed(self):
+    def add_total(self, num=1):
+        """增加总数（流式处理时总数随扫描增长）"""
+        self.total_counter.add(num)
+    
+    def _render_loop(self):
+        """渲染线程：按固定频率重绘，计数和状态没有变化时跳过"""
+        last_state = None
+        while not self.stop_event.wait(PROGRESS_REFRESH_INTERVAL):
+            if self.terminal_generation != _terminal_generation[0]:
+                self.terminal_generation = _terminal_generation[0]
+                self._get_terminal_size()
+                last_state = None
+            state = (self.completed, self.total, self.extra_text)
+            if not self.visible:
+                if state[1] > 0:
+                    self._show()
+                    last_state = state
+                continue
+            if state != last_state:
+                self._update_display()
+                last_state = state
+    
+    def _format_speed(self, completed):
         """计算并格式化处理速度"""
         total_elapsed = time.time() - self.start_time
-        if total_elapsed > 0 and self.completed > 0:
-            items_per_sec = self.completed / total_elapsed
+        if total_elapsed > 0 and completed > 0:
+            items_per_sec = completed / total_elapsed
             self.speed_history.append(items_per_sec)
             if self.speed_history:
                 avg_speed = sum(self.speed_history) / len(self.speed_history)
@@ -123,15 +209,15 @@ class FixedProgressBar:
                 return f"{avg_speed:.2f} {self.unit}/秒"
         return ""
     
-    def _calc_remaining(self):
+    def _calc_remaining(self, completed, total):
         """计算预计剩余时间"""
-        if self.completed <= 0:
+        if completed <= 0:
             return ""
         
         elapsed = time.time() - self.start_time
         if elapsed > 0:
-            time_per = elapsed / self.completed
-            remaining = time_per * (self.total - self.completed)
+            time_per = elapsed / completed
+            remaining = time_per * (total - completed)
             
             # 格式化剩余时间为用户友好的格式
             if remaining < 60:  # 秒级
@@ -148,35 +234,41 @@ class FixedProgressBar:
             # 移动到顶部
             print("\033[H", end='')
         else:
-            # 移动到底部
-            self._get_terminal_size()
+            # 移动到底部（使用缓存的终端高度）
             print(f"\033[{self.window_height};0H", end='')
     
     def _show(self):
         """首次显示进度条"""
-        self.visible = True
-        # 保存当前光标位置
-        if platform.system() != 'Windows':
-            print("\033[s", end='')
-        
-        # 在底部创建一个空白空间
-        if self.position == 'bottom':
-            self._get_terminal_size()
-            for _ in range(self.window_height - 1):
-                print()
-        
-        # 移动到进度条位置
-        self._move_to_position()
+        with self.render_lock:
+            if self.visible:
+                return
+            self.visible = True
+            # 保存当前光标位置
+            if platform.system() != 'Windows':
+                print("\033[s", end='')
+            
+            # 在底部创建一个空白空间
+            if self.position == 'bottom':
+                for _ in range(self.window_height - 1):
+                    print()
+            
+            # 移动到进度条位置
+            self._move_to_position()
         
         # 打印空的进度条以预留空间
         self._update_display()
         
     def _update_display(self):
         """更新进度条显示"""
-        if not self.visible:
-            return
+        with self.render_lock:
+            if not self.visible:
+                return
+            self._render()
             
-        progress = min(1.0, self.completed / self.total if self.total > 0 else 0)
+    def _render(self):
+        completed = self.completed
+        total = self.total
+        progress = min(1.0, completed / total if total > 0 else 0)
         filled_length = int(round(self.bar_length * progress))
         bar_length = max(1, self.bar_length)
         
@@ -190,9 +282,9 @@ class FixedProgressBar:
         # 构建完整输出行
         desc = f"{self.desc}:"
         progress_text = f"{percent:5.1f}% [{bar}]"
-        stats_text = f"{self.completed}/{self.total}"
-        speed_text = self._format_speed()
-        remaining_text = self._calc_remaining()
+        stats_text = f"{completed}/{total}"
+        speed_text = self._format_speed(completed)
+        remaining_text = self._calc_remaining(completed, total)
         
         # 组装完整的行
         progress_line = f"{Colors.PROGRESS_TEXT}{desc} {Colors.PROGRESS_VALUE}{progress_text}{Colors.ENDC} "
@@ -202,6 +294,8 @@ class FixedProgressBar:
             stats_line += f" | {Colors.PROGRESS_TEXT}速度: {Colors.PROGRESS_VALUE}{speed_text}{Colors.ENDC}"
         if remaining_text:
             stats_line += f" | {Colors.PROGRESS_TEXT}剩余: {Colors.PROGRESS_REMAINING}{remaining_text}{Colors.ENDC}"
+        if self.extra_text:
+            stats_line += f" | {Colors.PROGRESS_TEXT}{self.extra_text}{Colors.ENDC}"
         
         # 移动到进度条位置
         self._move_to_position()
@@ -219,55 +313,119 @@ class FixedProgressBar:
         sys.stdout.flush()
         
     def close(self):
-        """关闭进度条（在最终位置显示完成信息）"""
-        if not self.visible:
-            return
+        """停止渲染线程，关闭进度条（在最终位置显示完成信息）"""
+        self.stop_event.set()
+        if self.render_thread is not threading.current_thread():
+            self.render_thread.join()
+        with self.render_lock:
+            if not self.visible:
+                return
             
-        self.visible = False
-        self._move_to_position()
-        
-        if self.completed >= self.total:
-            # 完成状态
-            print("\033[K", end='')  # 清除行
-            print(f"{Colors.OKGREEN}✓ {self.desc} 完成! {self.completed}/{self.total}{Colors.ENDC}")
-        else:
-            # 未完成状态
-            print("\033[K", end='')  # 清除行
-            print(f"{Colors.WARNING}⚠ {self.desc} 中断! 完成 {self.completed}/{self.total}{Colors.ENDC}")
-        
-        # 在Windows上需要多打印换行来调整布局
-        if platform.system() == 'Windows':
-            print("\n")
+            # 最后一帧显示最终计数
+            self._render()
+            self.visible = False
+            self._move_to_position()
+            
+            completed = self.completed
+            total = self.total
+            if completed >= total:
+                # 完成状态
+                print("\033[K", end='')  # 清除行
+                print(f"{Colors.OKGREEN}✓ {self.desc} 完成! {completed}/{total}{Colors.ENDC}")
+            else:
+                # 未完成状态
+                print("\033[K", end='')  # 清除行
+                print(f"{Colors.WARNING}⚠ {self.desc} 中断! 完成 {completed}/{total}{Colors.ENDC}")
+            
+            # 在Windows上需要多打印换行来调整布局
+            if platform.system() == 'Windows':
+                print("\n")
     
     def __enter__(self):
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if not self.visible:
-            return
-            
-        if exc_type is KeyboardInterrupt:
-            self.close()
-            return False
-            
-        # 如果未完成，确保显示进度条
-        if self.completed < self.total:
-            self._update_display()
-        
-        # 等待0.5秒后关闭
-        time.sleep(0.5)
         self.close()
         return False
 
 
 # 优化常量
 IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.heic', '.tiff', '.nef', '.cr2', '.arw', '.dng')
-VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.flv', '.wmv', '.3gp', '.m4v', '.mts', '.mpg', '.mpeg')
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.flv', '.wmv', '.3gp', '.m4v', '.mts', '.m2ts', '.mpg', '.mpeg')
 ALL_EXTENSIONS = IMAGE_EXTENSIONS + VIDEO_EXTENSIONS
 
 # 扩展名字典用于快速查找
 EXT_MAP = {ext: 1 for ext in ALL_EXTENSIONS}
 
+# 文件记录（扫描时stat一次，后续各阶段直接使用）
+class FileRecord:
+    """单个媒体文件的扫描结果及其目标位置"""
+    __slots__ = ('path', 'name', 'ext', 'size', 'mtime_ns', 'dev', 'ino',
+                 'target_path', 'date_folder', 'date_source', 'duplicate_of', 'content_hash')
+    
+    def __init__(self, path, name, st):
+        self.path = path
+        self.name = name
+        self.ext = os.path.splitext(name)[1].lower()
+        self.size = st.st_size
+        self.mtime_ns = st.st_mtime_ns
+        self.dev = st.st_dev
+        self.ino = st.st_ino
+        # 以下由日期分析阶段填写
+        self.target_path = None
+        self.date_folder = None
+        self.date_source = None
+        # 全局去重确认的内容相同文件（保留该文件，删除本文件）
+        self.duplicate_of = None
+        # 已计算的完整内容哈希（移入目标库时写入内容目录）
+        self.content_hash = None
+    
+    @classmethod
+    def from_path(cls, path):
+        """对单个路径stat并创建记录"""
+        return cls(path, os.path.basename(path), os.stat(path))
+    
+    @classmethod
+    def from_fields(cls, path, name, size, mtime_ns, dev=0, ino=0):
+        """由保存的stat字段重建记录（不访问文件系统）"""
+        record = cls.__new__(cls)
+        record.path = path
+        record.name = name
+        record.ext = os.path.splitext(name)[1].lower()
+        record.size = size
+        record.mtime_ns = mtime_ns
+        record.dev = dev
+        record.ino = ino
+        record.target_path = None
+        record.date_folder = None
+        record.date_source = None
+        record.duplicate_of = None
+        record.content_hash = None
+        return record
+    
+    @classmethod
+    def from_entry(cls, entry):
+        """由日志或计划文件中的一行重建记录（不访问文件系统）"""
+        path = entry['src']
+        record = cls.from_fields(path, os.path.basename(path), entry['size'], entry['mtime_ns'],
+                                 entry.get('dev', 0), entry.get('ino', 0))
+        record.target_path = entry.get('dst')
+        record.date_folder = entry.get('date')
+        record.date_source = entry.get('date_source')
+        record.duplicate_of = entry.get('duplicate_of')
+        record.content_hash = entry.get('hash')
+        return record
+    
+    def to_entry(self):
+        """转换为日志或计划文件中的一行"""
+        return {'src': self.path, 'dst': self.target_path, 'size': self.size, 'mtime_ns': self.mtime_ns,
+                'dev': self.dev, 'ino': self.ino, 'date': self.date_folder, 'date_source': self.date_source,
+                'hash': self.content_hash}
+    
+    @property
+    def mtime(self):
+        return self.mtime_ns / 1e9
+
 # 线程安全的统计对象
 class ProcessingStats:
     def __init__(self, total_files):
@@ -276,15 +434,19 @@ class ProcessingStats:
         self.files_skipped = 0
         self.files_failed = 0
         self.files_processed = 0
+        self.bytes_moved = 0
         self.total_files = total_files
+        self.in_flight = {}   # 线程池/进程池 -> 正在处理的文件数
+        self.completed = {}   # 线程池/进程池 -> 已完成的文件数
         self.start_time = time.time()
         self.last_log_time = self.start_time
         self.last_count = 0
         
-    def moved(self):
+    def moved(self, size=0):
         with self.lock:
             self.files_moved += 1
             self.files_processed += 1
+            self.bytes_moved += size
             
     def skipped(self):
         with self.lock:
@@ -296,6 +458,28 @@ class ProcessingStats:
             self.files_failed += 1
             self.files_processed += 1
             
+    def add_total(self, num=1):
+        """增加总文件数（流式处理时随扫描增长）"""
+        with self.lock:
+            self.total_files += num
+            
+    def task_started(self, pool, num=1):
+        with self.lock:
+            self.in_flight[pool] = self.in_flight.get(pool, 0) + num
+            
+    def task_finished(self, pool, num=1):
+        with self.lock:
+            self.in_flight[pool] = self.in_flight.get(pool, 0) - num
+            self.completed[pool] = self.completed.get(pool, 0) + num
+            
+    def merge(self, counts):
+        """合并工作进程返回的计数"""
+        with self.lock:
+            self.files_moved += counts['moved']
+            self.files_skipped += counts['skipped']
+            self.files_failed += counts['failed']
+            self.files_processed += counts['processed']
+            
     def get_stats(self):
         with self.lock:
             elapsed = time.time() - self.start_time
@@ -304,6 +488,9 @@ class ProcessingStats:
                 'skipped': self.files_skipped,
                 'failed': self.files_failed,
                 'processed': self.files_processed,
+                'analyzed': self.completed.get('analyze', 0),
+                'bytes_moved': self.bytes_moved,
+                'in_flight': dict(self.in_flight),
                 'elapsed': elapsed,
                 'total': self.total_files
             }
@@ -313,7 +500,7 @@ class ProcessingStats:
         current_time = time.time()
         with self.lock:
             if force or (current_time - self.last_log_time > 60 or self.files_processed == self.total_files):
-                percent = (self.files_processed / self.total_files) * 100
+                percent = (self.files_processed / self.total_files) * 100 if self.total_files else 0.0
                 speed = (self.files_processed - self.last_count) / max(1, current_time - self.last_log_time)
                 
                 logger.info(
@@ -327,260 +514,2226 @@ class ProcessingStats:
                 self.last_log_time = current_time
                 self.last_count = self.files_processed
 
+# 运行指标（--report 时记录各环节的延迟分布和计数）
+LATENCY_BUCKETS = tuple(1e-5 * 2 ** i for i in range(24))  # 直方图桶上限：10微秒起按2倍递增（约84秒）
+REPORT_VERSION = 1  # 运行报告格式版本
 
-def setup_logging(verbose=False):
-    """配置日志级别"""
-    log_level = logging.DEBUG if verbose else logging.INFO
-    logger.setLevel(log_level)
+class LatencyHistogram:
+    """按指数分桶的延迟直方图（秒）"""
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+    
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # 最后一个桶为超出上限
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+            
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+            
+    def quantile(self, q):
+        """估算分位数（所在桶的上限，不超过最大值）"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(LATENCY_BUCKETS[i], self.max) if i < len(LATENCY_BUCKETS) else self.max
+        return self.max
+    
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_s': round(self.total, 6),
+            'mean_ms': round(self.total / self.count * 1000, 3) if self.count else None,
+            'min_ms': round(self.min * 1000, 3) if self.min is not None else None,
+            'p50_ms': round(self.quantile(0.5) * 1000, 3) if self.count else None,
+            'p90_ms': round(self.quantile(0.9) * 1000, 3) if self.count else None,
+            'p99_ms': round(self.quantile(0.99) * 1000, 3) if self.count else None,
+            'max_ms': round(self.max * 1000, 3) if self.max is not None else None,
+            # 非空桶: [桶上限（毫秒，null表示超出上限）, 次数]
+            'buckets': [[round(LATENCY_BUCKETS[i] * 1000, 3) if i < len(LATENCY_BUCKETS) else None, n]
+                        for i, n in enumerate(self.counts) if n],
+        }
 
-@lru_cache(maxsize=4096)
-def get_cached_file_timestamp(filepath):
-    """带缓存的文件修改时间获取（性能优化）"""
-    try:
-        return os.path.getmtime(filepath)
-    except Exception:
-        return time.time()
+class _MetricTimer:
+    """计时上下文：退出时把耗时记录到指定直方图"""
+    __slots__ = ('metrics', 'name', 'start')
+    
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
 
-@lru_cache(maxsize=4096)
-def get_image_exif_date(image_path):
-    """从图片EXIF获取日期（带缓存）"""
-    try:
-        with Image.open(image_path) as img:
-            exif_data = img.getexif()
+class _NullTimer:
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class RunMetrics:
+    """线程安全的运行指标：各环节延迟直方图、计数器和阶段耗时（未启用时不记录）"""
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.reset()
+        
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.phases = {}
+            self.totals = None
             
-            if not exif_data:
-                return None
+    def timer(self, name):
+        """with run_metrics.timer('move'): ... 记录代码块耗时"""
+        return _MetricTimer(self, name) if self.enabled else _NULL_TIMER
+    
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.observe(seconds)
             
-            # 预定义的日期标签ID列表
-            date_tag_ids = {
-                36867: "DateTimeOriginal",   # EXIF日期时间原始值
-                36868: "DateTimeDigitized",  # EXIF数字化日期时间
-                306: "DateTime",             # TIFF/EP 标准日期时间
+    def count(self, name, num=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + num
+            
+    def add_phase(self, name, seconds):
+        """累加阶段墙钟耗时"""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+            
+    def set_totals(self, stats, total_bytes):
+        if not self.enabled:
+            return
+        totals = stats.get_stats()
+        totals['bytes_planned'] = total_bytes
+        del totals['in_flight']
+        with self.lock:
+            self.totals = totals
+            
+    def drain(self):
+        """取出并清空已记录的直方图和计数器（工作进程随批次结果返回给主进程）"""
+        with self.lock:
+            histograms, counters = self.histograms, self.counters
+            self.histograms, self.counters = {}, {}
+        return histograms, counters
+    
+    def merge(self, drained):
+        """合并工作进程返回的指标"""
+        histograms, counters = drained
+        with self.lock:
+            for name, other in histograms.items():
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    self.histograms[name] = other
+                else:
+                    histogram.merge(other)
+            for name, num in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + num
                 
-                # 相机特定标签
-                50934: "OlympusDate",        # Olympus日期时间
-                50937: "OlympusDateTime",    # Olympus日期时间(长格式)
-                32781: "DateTimeCreated",    # 创建日期时间(某些相机),
-                36864: 'ExifVersion',
-                36880: 'OffsetTime',
-                36881: 'OffsetTimeOriginal',
-                36882: 'OffsetTimeDigitized',
-                33434: 'ExposureTime',
-                33437: 'FNumber',
+    def to_dict(self):
+        with self.lock:
+            date_sources = {name.split('.', 1)[1]: num for name, num in self.counters.items()
+                            if name.startswith('date_source.')}
+            return {
+                'totals': self.totals,
+                'phases_s': {name: round(seconds, 4) for name, seconds in self.phases.items()},
+                'date_sources': date_sources,
+                'counters': {name: num for name, num in sorted(self.counters.items())
+                             if not name.startswith('date_source.')},
+                'latency': {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())},
             }
-            
-            # 优先检查已知日期标签
-            for tag_id, tag_name in date_tag_ids.items():
-                value = exif_data.get(tag_id)
-                if value and isinstance(value, str):
-                    try:
-                        # 尝试多种日期格式
-                        formats = ["%Y:%m:%d %H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S"]
-                        for fmt in formats:
-                            try:
-                                dt = datetime.datetime.strptime(value.strip()[:19], fmt)
-                                return dt.date()
-                            except ValueError:
-                                continue
-                    except (ValueError, TypeError):
-                        continue
-    except Exception as e:
-        logger.debug(f"EXIF读取错误 {os.path.basename(image_path)}: {str(e)}")
-    return None
 
-@lru_cache(maxsize=2048)
-def get_video_metadata_date(video_path):
-    """带缓存的视频元数据日期获取，支持更多格式"""
-    try:
-        cmd = [
-            'ffprobe', '-v', 'error',
-            '-show_entries', 'format_tags=creation_time',
-            '-show_entries', 'format_tags=creation_date',
-            '-show_entries', 'format_tags=com.apple.quicktime.creationdate',
-            '-of', 'default=nokey=1:noprint_wrappers=1',
-            video_path
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
-        
-        if result.returncode == 0:
-            # 尝试解析输出中的日期值
-            date_strs = result.stdout.strip().splitlines()
-            
-            # 尝试所有可能的日期格式
-            formats = [
-                "%Y-%m-%dT%H:%M:%S",   # ISO格式 (GoPro/iPhone)
-                "%Y%m%d",               # 紧凑格式 (Sony相机)
-                "%Y/%m/%d %H:%M:%S",    # 目录/时间格式
-                "%d-%b-%Y",             # Nikon格式 (01-JAN-2023)
-                "%Y:%m:%d %H:%M:%S",     # EXIF格式的视频
-                "%Y%m%d%H%M%S",         # 紧凑时间格式
-                "%b %d %Y %H:%M:%S"      # 文本月份格式
-            ]
-            
-            for date_str in date_strs:
-                date_str = date_str.strip()
-                if not date_str:
-                    continue
-                    
-                for fmt in formats:
-                    try:
-                        # 清理不规则字符
-                        clean_date = ''.join(c for c in date_str if c.isprintable()).replace('T', ' ')
-                        # 尝试不带时区的部分
-                        dt_str = clean_date.split('.')[0].split('+')[0].strip()
-                        dt = datetime.datetime.strptime(dt_str, fmt)
-                        return dt.date()
-                    except ValueError:
-                        continue
-                        
-        # 从文件名提取日期信息
-        basename = os.path.basename(video_path)
-        name_without_ext = os.path.splitext(basename)[0]
-        
-        # 常见命名模式: YYYYMMDD_HHMMSS, YYYY-MM-DD HH.MM.SS
-        patterns = [
-            r'\d{4}-\d{2}-\d{2}',  # YYYY-MM-DD
-            r'\d{8}',              # YYYYMMDD
-            r'\d{4}\d{2}\d{2}'     # YYYYMMDD
-        ]
-        
-        import re
-        for pattern in patterns:
-            match = re.search(pattern, name_without_ext)
-            if match:
-                date_str = match.group(0)
-                date_formats = ["%Y-%m-%d", "%Y%m%d", "%Y%m%d"]
-                for fmt in date_formats:
-                    try:
-                        dt = datetime.datetime.strptime(date_str, fmt)
-                        return dt.date()
-                    except ValueError:
-                        continue
-                
-    except (FileNotFoundError, subprocess.TimeoutExpired, subprocess.CalledProcessError) as e:
-        logger.debug(f"视频日期读取失败 {os.path.basename(video_path)}: {str(e)}")
-    return None
+run_metrics = RunMetrics()
 
-def get_media_date_fast(media_path):
-    """优化的日期获取策略（带缓存和回退）"""
+def write_run_report(report_path, config, started):
+    """把本次运行的指标写入JSON报告"""
+    report = {
+        'version': REPORT_VERSION,
+        'started': datetime.datetime.fromtimestamp(started).isoformat(timespec='seconds'),
+        'finished': datetime.datetime.now().isoformat(timespec='seconds'),
+        'elapsed_s': round(time.time() - started, 3),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': config,
+    }
+    report.update(run_metrics.to_dict())
     try:
-        lower_path = media_path.lower()
-        ext = os.path.splitext(lower_path)[1].lower()
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        logger.info(f"📈 运行报告已写入 {os.path.abspath(report_path)}")
+    except OSError as e:
+        logger.warning(f"无法写入运行报告 {report_path}: {e}")
+
+# Prometheus格式的运行指标（node_exporter文本文件或本机HTTP端点）
+METRICS_INTERVAL = 15.0  # 文本文件重写间隔（秒）
+# ProcessingStats字段 -> (指标名, 类型, 说明)
+METRICS_STATS_FIELDS = (
+    ('total', 'organize_files_discovered', 'gauge', '已发现的待处理文件数'),
+    ('analyzed', 'organize_files_analyzed_total', 'counter', '已完成日期分析的文件数'),
+    ('moved', 'organize_files_moved_total', 'counter', '已移动的文件数'),
+    ('skipped', 'organize_files_skipped_total', 'counter', '跳过的文件数（重复、已在目标位置、源文件消失）'),
+    ('failed', 'organize_files_failed_total', 'counter', '处理失败的文件数'),
+    ('processed', 'organize_files_processed_total', 'counter', '已处理完成的文件数'),
+    ('bytes_moved', 'organize_bytes_moved_total', 'counter', '已移动的字节数'),
+)
+# RunMetrics计数器 -> (指标名, 说明)
+METRICS_COUNTERS = (
+    ('files_scanned', 'organize_files_scanned_total', '扫描到的媒体文件数'),
+    ('ffprobe_timeouts', 'organize_ffprobe_timeouts_total', 'ffprobe超时次数'),
+    ('collision_retries', 'organize_collision_retries_total', '移动时目标名称已被占用而重试的次数'),
+    ('name_collisions', 'organize_name_collisions_total', '分析时因同名文件改用 name_N 的次数'),
+    ('date_cache_hits', 'organize_date_cache_hits_total', '元数据缓存命中次数'),
+    ('duplicates', 'organize_duplicates_total', '全局去重发现的重复文件数'),
+)
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class MetricsExporter:
+    """把ProcessingStats和运行指标导出为Prometheus文本格式（定时重写文件和/或本机HTTP端点）"""
+    def __init__(self):
+        self.enabled = False
+        self.stats = None
+        self.textfile = None
+        self.server = None
+        self.writer = None
+        self.stop_event = threading.Event()
+        self.started = time.time()
         
-        # 图片文件优先尝试EXIF
-        if ext in IMAGE_EXTENSIONS:
-            exif_date = get_image_exif_date(media_path)
-            if exif_date:
-                return exif_date
+    def attach(self, stats):
+        """指定当前运行的统计对象（各运行模式创建统计对象后调用）"""
+        self.stats = stats
         
-        # 视频文件尝试获取元数据
-        if ext in VIDEO_EXTENSIONS:
-            video_date = get_video_metadata_date(media_path)
-            if video_date:
-                return video_date
+    def start(self, textfile=None, port=None):
+        self.enabled = True
+        self.started = time.time()
+        self.stats = None
+        self.stop_event.clear()
+        if textfile:
+            self.textfile = textfile
+            self.writer = threading.Thread(target=self._write_loop, name="metrics-writer", daemon=True)
+            self.writer.start()
+            logger.info(f"📡 指标文本文件: {os.path.abspath(textfile)}（每{METRICS_INTERVAL:.0f}秒更新）")
+        if port is not None:
+            from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+            exporter = self
             
-        # 尝试从文件名解析日期
-        basename = os.path.basename(media_path)
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                        self.send_error(404)
+                        return
+                    body = exporter.render().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    
+                def log_message(self, format, *args):
+                    pass  # 抓取请求不写入日志
+            
+            try:
+                self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+            except OSError as e:
+                logger.warning(f"无法监听指标端口 127.0.0.1:{port}: {e}")
+            else:
+                self.server.daemon_threads = True
+                threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+                logger.info(f"📡 指标端点: http://127.0.0.1:{self.server.server_address[1]}/metrics")
+                
+    def render(self):
+        """生成Prometheus文本格式"""
+        lines = []
         
-        # 常见文件名模式（20230105_123456.jpg）
-        patterns = [
-            r'(\d{4}-\d{2}-\d{2})',       # YYYY-MM-DD
-            r'(\d{4}_\d{2}_\d{2})',        # YYYY_MM_DD
-            r'(\d{4}\d{2}\d{2})',          # YYYYMMDD
-            r'(\d{4}\d{2}\d{2}[_-]\d{6})'  # YYYYMMDD-HHMMSS
-        ]
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels)
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
         
-        import re
-        for pattern in patterns:
-            match = re.search(pattern, basename)
-            if match:
-                date_str = match.group(1)
-                date_formats = ["%Y-%m-%d", "%Y_%m_%d", "%Y%m%d", "%Y%m%d-%H%M%S"]
-                for fmt in date_formats:
-                    if len(date_str) == len(fmt.replace('_', '').replace('-', '')):
-                        try:
-                            dt = datetime.datetime.strptime(date_str, fmt)
-                            return dt.date()
-                        except ValueError:
-                            continue
-                
-        # 最后使用缓存的文件修改时间
-        timestamp = get_cached_file_timestamp(media_path)
-        return datetime.datetime.fromtimestamp(timestamp).date()
-    except Exception as e:
-        logger.debug(f"日期获取错误 {os.path.basename(media_path)}: {str(e)}")
-        # 回退到文件修改时间
+        stats = self.stats.get_stats() if self.stats is not None else None
+        if stats is not None:
+            for field, name, kind, help_text in METRICS_STATS_FIELDS:
+                metric(name, kind, help_text, [((), stats[field])])
+            pools = sorted(set(stats['in_flight']) | {'analyze', 'move'})
+            metric('organize_tasks_in_flight', 'gauge', '各线程池/进程池中正在处理的文件数',
+                   [((('pool', pool),), stats['in_flight'].get(pool, 0)) for pool in pools])
+        with run_metrics.lock:
+            counters = dict(run_metrics.counters)
+            phases = dict(run_metrics.phases)
+            histograms = {name: (list(h.counts), h.count, h.total) for name, h in run_metrics.histograms.items()}
+        for key, name, help_text in METRICS_COUNTERS:
+            metric(name, 'counter', help_text, [((), counters.get(key, 0))])
+        metric('organize_date_source_total', 'counter', '按日期来源统计的文件数',
+               [((('source', key.split('.', 1)[1]),), num) for key, num in sorted(counters.items())
+                if key.startswith('date_source.')])
+        if phases:
+            metric('organize_phase_seconds', 'gauge', '已完成阶段的墙钟耗时（秒）',
+                   [((('phase', phase),), round(seconds, 6)) for phase, seconds in sorted(phases.items())])
+        if histograms:
+            name = 'organize_latency_seconds'
+            lines.append(f"# HELP {name} 各环节单次操作延迟（秒）")
+            lines.append(f"# TYPE {name} histogram")
+            for op, (counts, count, total) in sorted(histograms.items()):
+                op_label = _escape_label(op)
+                cumulative = 0
+                for bound, num in zip(LATENCY_BUCKETS, counts):
+                    cumulative += num
+                    lines.append(f'{name}_bucket{{op="{op_label}",le="{bound:.6g}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{op="{op_label}",le="+Inf"}} {count}')
+                lines.append(f'{name}_sum{{op="{op_label}"}} {total:.6f}')
+                lines.append(f'{name}_count{{op="{op_label}"}} {count}')
+        metric('organize_start_time_seconds', 'gauge', '本次运行开始时间（Unix时间戳）', [((), round(self.started, 3))])
+        metric('organize_last_update_time_seconds', 'gauge', '指标生成时间（Unix时间戳）', [((), round(time.time(), 3))])
+        return '\n'.join(lines) + '\n'
+    
+    def write_textfile(self):
+        """原子地重写文本文件（node_exporter不会读到写了一半的文件）"""
+        tmp_path = f"{self.textfile}.{os.getpid()}.tmp"
         try:
-            ts = os.path.getmtime(media_path)
-            return datetime.datetime.fromtimestamp(ts).date()
-        except:
-            return datetime.date(1970, 1, 1)  # 回退到epoch时间
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.render())
+            os.replace(tmp_path, self.textfile)
+        except OSError as e:
+            logger.debug(f"指标文件写入失败 {self.textfile}: {e}")
+            
+    def _write_loop(self):
+        while not self.stop_event.wait(METRICS_INTERVAL):
+            self.write_textfile()
+            
+    def stop(self):
+        """写出最终指标并停止导出"""
+        if not self.enabled:
+            return
+        self.enabled = False
+        self.stop_event.set()
+        if self.writer is not None:
+            self.writer.join()
+            self.write_textfile()
+            self.writer = None
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        self.stats = None
 
-def generate_unique_filename(target_dir, base_name, extension):
-    """生成唯一文件名（解决冲突）"""
-    counter = 1
-    base, orig_ext = os.path.splitext(base_name)
-    if not extension:
-        extension = orig_ext
-    
-    # 首选原始文件名
-    new_filename = base_name
-    
-    while os.path.exists(os.path.join(target_dir, new_filename)):
-        # 尝试计数器
-        new_filename = f"{base}_{counter}{extension}"
-        counter += 1
+metrics_exporter = MetricsExporter()
+
+# 分阶段性能剖析（--profile）
+PROFILE_MAX_DEPTH = 64        # 由调用关系展开折叠栈时的最大深度
+PROFILE_MIN_MICROS = 1        # 展开时忽略小于该耗时（微秒）的路径
+
+class _ProfileStats:
+    """包装原始统计字典，供 pstats.Stats 加载（工作进程返回的结果）"""
+    def __init__(self, stats):
+        self.stats = stats
         
-        # 如果冲突严重，添加短哈希
-        if counter > 10:  # 防止无限循环
-            file_hash = hashlib.md5(f"{base}{time.time()}{counter}".encode()).hexdigest()[:6]
-            new_filename = f"{base}_{file_hash}{extension}"
+    def create_stats(self):
+        pass
+
+def _frame_label(filename, line, name):
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+def collapse_profile_stats(stats):
+    """把cProfile的调用关系展开为火焰图折叠栈（按调用边耗时比例分摊，为近似结果），返回 {栈: 微秒}"""
+    entries = stats.stats  # 函数 -> (原始调用次数, 调用次数, 自身耗时, 累计耗时, 调用方)
+    children = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+    # 没有调用方的函数为根（剖析器自身的 disable 调用除外）
+    roots = [func for func, value in entries.items()
+             if not any(caller in entries for caller in value[4]) and not func[2].startswith("<method 'disable'")]
+    collapsed = {}
+    pending = [(root, 1.0, (_frame_label(*root),), frozenset((root,))) for root in roots]
+    while pending:
+        func, fraction, path, seen = pending.pop()
+        own = int(entries[func][2] * fraction * 1e6)
+        if own >= PROFILE_MIN_MICROS:
+            key = ';'.join(path)
+            collapsed[key] = collapsed.get(key, 0) + own
+        if len(path) >= PROFILE_MAX_DEPTH:
+            continue
+        for child, edge_time in children.get(func, ()):
+            child_total = entries[child][3]
+            # 递归调用不再展开；本路径分到的耗时过小时剪枝
+            if child in seen or child_total <= 0 or fraction * edge_time * 1e6 < PROFILE_MIN_MICROS:
+                continue
+            pending.append((child, fraction * edge_time / child_total,
+                            path + (_frame_label(*child),), seen | {child}))
+    return collapsed
+
+def write_collapsed(path, collapsed):
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, value in sorted(collapsed.items()):
+            f.write(f"{stack} {value}\n")
+
+class StackSampler(threading.Thread):
+    """按固定间隔采样本进程所有线程的调用栈（包括阻塞在subprocess、锁和I/O中的时间）"""
+    def __init__(self, interval, phase_getter):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.interval = interval
+        self.phase_getter = phase_getter
+        self.stop_event = threading.Event()
+        self.samples = {}  # 阶段 -> {折叠栈: 采样次数}
         
-        # 最终保护
-        if counter > 100:
-            new_filename = f"{base}_{int(time.time())}{extension}"
-            
-    return os.path.join(target_dir, new_filename)
+    def run(self):
+        own_ident = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            phase = self.phase_getter()
+            counts = self.samples.setdefault(phase, {})
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(_frame_label(code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                # 同一线程池的线程合并为一个根（去掉编号）
+                stack.append(re.sub(r'[-_]?\d+$', '', names.get(ident, 'thread')) or 'thread')
+                key = ';'.join(reversed(stack))
+                counts[key] = counts.get(key, 0) + 1
+                
+    def stop(self):
+        self.stop_event.set()
+        self.join()
 
-def file_hash(filepath, block_size=65536):
-    """计算文件的快速哈希值（仅文件开头提高速度）"""
-    hasher = hashlib.md5()
-    with open(filepath, 'rb') as f:
-        for chunk in iter(lambda: f.read(block_size), b''):
-            hasher.update(chunk)
-            # 对于大文件，只读取第一部分
-            if f.tell() > 1024 * 1024:  # 只读1MB足够
-                break
-    return hasher.hexdigest()
+class PhaseProfiler:
+    """按阶段剖析各工作线程（每个线程一个cProfile），结束时合并写出pstats和折叠栈
 
-def calculate_target_path(file_info, target_base_dir, stats, progress_bar=None):
-    """计算文件的目标路径，同时更新统计信息"""
-    filename, source_path = file_info
-    
-    try:
-        # 检查源文件是否仍然存在
-        if not os.path.exists(source_path):
-            logger.warning(f"文件已消失: {filename} (跳过)")
-            stats.skipped()
-            return None
+    未启用时 wrap() 直接返回原函数，不增加任何开销。
+    """
+    def __init__(self):
+        self.enabled = False
+        self.output_dir = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.generation = 0
+        self.profiles = {}    # 阶段 -> [本代的cProfile.Profile]
+        self.collected = {}   # 阶段 -> pstats.Stats（已合并的结果）
+        self.phase = 'startup'
+        self.sampler = None
+        self.busy_warned = False
+        
+    def start(self, output_dir, sample_interval=None):
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.enabled = True
+        self.phase = 'startup'
+        if sample_interval:
+            self.sampler = StackSampler(sample_interval, lambda: self.phase)
+            self.sampler.start()
             
-        # 获取文件大小（用于进度统计）
-        file_size = os.path.getsize(source_path)
+    def set_phase(self, phase):
+        """切换当前阶段（用于采样结果归类）"""
+        self.phase = phase
         
-        # 计算文件日期和目标文件夹
-        media_date = get_media_date_fast(source_path)
-        date_folder = media_date.strftime("%Y-%m-%d")
-        target_dir = os.path.join(target_base_dir, date_folder)
-        os.makedirs(
-            target_dir, 
-            exist_ok=True,
-            mode=0o755  # 合理的默认权限
-        )
+    def _thread_profile(self, phase):
+        profiles = getattr(self.local, 'profiles', None)
+        if profiles is None or self.local.generation != self.generation:
+            profiles = self.local.profiles = {}
+            self.local.generation = self.generation
+        profile = profiles.get(phase)
+        if profile is None:
+            profile = profiles[phase] = cProfile.Profile()
+            with self.lock:
+                self.profiles.setdefault(phase, []).append(profile)
+        return profile
+    
+    def wrap(self, phase, func):
+        """返回在调用线程中剖析func的包装函数（结果计入phase阶段）"""
+        if not self.enabled:
+            return func
         
-        # 获取实际扩展名
-        base, orig_ext = os.path.splitext(filename)
-        ext_lower = orig_ext.lower()
-        extension = None
+        def profiled(*args, **kwargs):
+            profile = self._thread_profile(phase)
+            try:
+                profile.enable()
+            except ValueError:
+                # Python 3.12+ 同一时间只允许一个剖析器，其余调用不剖析
+                if not self.busy_warned:
+                    self.busy_warned = True
+                    logger.warning("当前Python版本不支持多线程同时剖析，部分调用未计入剖析结果")
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+        return profiled
+    
+    def drain(self):
+        """取出本代各阶段的原始统计并开始新一代（工作进程随批次结果返回）"""
+        with self.lock:
+            profiles, self.profiles = self.profiles, {}
+            self.generation += 1
+        drained = {}
+        for phase, phase_profiles in profiles.items():
+            for profile in phase_profiles:
+                profile.create_stats()
+                if profile.stats:
+                    drained.setdefault(phase, []).append(profile.stats)
+        return drained
+    
+    def merge(self, drained):
+        """合并原始统计（本进程或工作进程）"""
+        with self.lock:
+            for phase, raw_stats in drained.items():
+                for stats in raw_stats:
+                    merged = self.collected.get(phase)
+                    if merged is None:
+                        self.collected[phase] = pstats.Stats(_ProfileStats(stats))
+                    else:
+                        merged.add(_ProfileStats(stats))
+                        
+    def stop(self):
+        """停止采样并写出结果：<阶段>.prof、<阶段>.txt、<阶段>.collapsed、<阶段>.sampled.collapsed"""
+        if not self.enabled:
+            return
+        self.enabled = False
+        if self.sampler is not None:
+            self.sampler.stop()
+        self.merge(self.drain())
+        written = []
+        try:
+            for phase, stats in self.collected.items():
+                base = os.path.join(self.output_dir, phase)
+                stats.dump_stats(base + '.prof')
+                with open(base + '.txt', 'w', encoding='utf-8') as f:
+                    stats.stream = f
+                    stats.sort_stats('cumulative').print_stats(60)
+                write_collapsed(base + '.collapsed', collapse_profile_stats(stats))
+                written.append(phase)
+            if self.sampler is not None:
+                for phase, counts in self.sampler.samples.items():
+                    write_collapsed(os.path.join(self.output_dir, phase + '.sampled.collapsed'), counts)
+        except OSError as e:
+            logger.warning(f"无法写入剖析结果 {self.output_dir}: {e}")
+        logger.info(f"🔬 剖析结果已写入 {os.path.abspath(self.output_dir)}"
+                    f"（{', '.join(written) or '无'}{'，含定时采样' if self.sampler is not None else ''}）")
+        self.collected = {}
+        self.sampler = None
+
+phase_profiler = PhaseProfiler()
+
+def setup_logging(verbose=False):
+    """配置日志级别"""
+    log_level = logging.DEBUG if verbose else logging.INFO
+    logger.setLevel(log_level)
+
+# 异步日志：工作线程只把记录放入队列，由单独的写入线程格式化并输出
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_SAMPLE_INTERVAL = 1.0            # 控制台上逐文件成功日志的采样间隔（秒）
+LOG_FILE_MAX_BYTES = 50 * 1024 * 1024  # 日志文件轮转大小
+LOG_FILE_BACKUPS = 5                 # 保留的轮转日志文件数
+PER_FILE = {'per_file': True}        # 逐文件成功日志的标记（extra=PER_FILE）
+
+class _BatchFlushMixin:
+    """emit后不逐条flush，由写入线程在队列暂时为空时统一flush"""
+    def flush(self):
+        pass
+    
+    def flush_batch(self):
+        super().flush()
+        
+    def close(self):
+        self.flush_batch()
+        super().close()
+
+class BatchedStreamHandler(_BatchFlushMixin, logging.StreamHandler):
+    pass
+
+class BatchedRotatingFileHandler(_BatchFlushMixin, logging.handlers.RotatingFileHandler):
+    pass
+
+class PerFileLogSampler(logging.Filter):
+    """控制台上的逐文件成功日志按时间采样（完整记录写入日志文件）"""
+    def __init__(self, interval=LOG_SAMPLE_INTERVAL):
+        super().__init__()
+        self.interval = interval
+        self.last = 0.0
+        self.suppressed = 0
+        
+    def filter(self, record):
+        if not getattr(record, 'per_file', False):
+            return True
+        if record.created - self.last < self.interval:
+            self.suppressed += 1
+            return False
+        self.last = record.created
+        return True
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """日志写入线程：逐条输出，队列暂时为空时统一flush（终端和文件按批写入）"""
+    def handle(self, record):
+        super().handle(record)
+        if self.queue.empty():
+            self.flush()
+            
+    def flush(self):
+        for handler in self.handlers:
+            handler.flush_batch()
+
+class LogPipeline:
+    """把模块日志改为 QueueHandler -> 写入线程 -> 控制台（采样）/轮转文件（完整）"""
+    def __init__(self):
+        self.listener = None
+        self.queue_handler = None
+        self.sampler = None
+        
+    def start(self, verbose=False, log_file=None):
+        if self.listener is not None:
+            self.stop()
+        formatter = logging.Formatter(LOG_FORMAT)
+        handlers = []
+        console = BatchedStreamHandler()
+        console.setFormatter(formatter)
+        if not verbose:
+            self.sampler = PerFileLogSampler()
+            console.addFilter(self.sampler)
+        handlers.append(console)
+        if log_file:
+            try:
+                file_handler = BatchedRotatingFileHandler(log_file, maxBytes=LOG_FILE_MAX_BYTES,
+                                                          backupCount=LOG_FILE_BACKUPS, encoding='utf-8')
+                file_handler.setFormatter(formatter)
+                handlers.append(file_handler)
+            except OSError as e:
+                logger.warning(f"无法打开日志文件 {log_file}: {e}")
+        log_queue = queue.SimpleQueue()
+        self.queue_handler = logging.handlers.QueueHandler(log_queue)
+        self.listener = BatchingQueueListener(log_queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+        logger.addHandler(self.queue_handler)
+        logger.propagate = False
+        
+    def stop(self):
+        """写出队列中剩余的日志并恢复直接输出"""
+        if self.listener is None:
+            return
+        logger.removeHandler(self.queue_handler)
+        logger.propagate = True
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+        if self.sampler is not None and self.sampler.suppressed:
+            logger.debug(f"控制台省略了 {self.sampler.suppressed:,} 条逐文件日志")
+        self.listener = None
+        self.queue_handler = None
+        self.sampler = None
+        
+    def detach(self):
+        """fork出的工作进程中调用：写入线程不会随fork复制，去掉继承的QueueHandler改回直接输出"""
+        if self.queue_handler is not None:
+            logger.removeHandler(self.queue_handler)
+        logger.propagate = True
+        self.listener = None
+        self.queue_handler = None
+        self.sampler = None
+
+log_pipeline = LogPipeline()
+
+# 持久化元数据缓存
+CACHE_FILENAME = '.organize_cache.sqlite'
+CACHE_MAX_ENTRIES = 2000000
+
+class MetadataCache:
+    """持久化的媒体日期缓存（SQLite，保存在目标根目录）
+
+    以 (st_dev, st_ino, st_size, st_mtime_ns) 为键，记录解析出的日期和来源，
+    未变化的文件在下次运行时直接命中，不再读取EXIF或调用ffprobe。
+    """
+    BATCH_SIZE = 500  # 批量读写大小（低于SQLite变量数上限）
+
+    def __init__(self, db_path, max_entries=CACHE_MAX_ENTRIES, rebuild=False):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.run_stamp = int(time.time())
+        self.memory = {}      # 已加载的缓存项: key -> (date, source)
+        self.pending = {}     # 待写入的新结果
+        self.touched = set()  # 本次运行命中的键（用于淘汰排序）
+        self.hits = 0
+        self.misses = 0
+        self.preloaded = False  # 已批量预加载本次全部文件时，未命中无需再查数据库
+        
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        if rebuild:
+            self.conn.execute("DROP TABLE IF EXISTS media_dates")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS media_dates ("
+            " key TEXT PRIMARY KEY,"
+            " media_date TEXT NOT NULL,"
+            " source TEXT NOT NULL,"
+            " last_seen INTEGER NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_media_dates_seen ON media_dates(last_seen)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(record):
+        """由文件记录生成缓存键"""
+        return f"{record.dev}:{record.ino}:{record.size}:{record.mtime_ns}"
+
+    def get_many(self, keys, complete=False):
+        """批量查询（扫描结束后一次性预加载），返回命中的 {key: (date, source)}
+
+        complete=True 表示keys覆盖了本次要处理的全部文件。
+        """
+        found = {}
+        keys = list(keys)
+        with self.lock:
+            self.preloaded = self.preloaded or complete
+            for i in range(0, len(keys), self.BATCH_SIZE):
+                chunk = keys[i:i + self.BATCH_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT key, media_date, source FROM media_dates WHERE key IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for key, date_str, source in rows:
+                    entry = (datetime.date.fromisoformat(date_str), source)
+                    found[key] = entry
+                    self.memory[key] = entry
+        return found
+
+    def get(self, key):
+        """查询单个文件，返回 (date, source) 或 None"""
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is None and not self.preloaded:
+                row = self.conn.execute(
+                    "SELECT media_date, source FROM media_dates WHERE key = ?", (key,)
+                ).fetchone()
+                if row:
+                    entry = (datetime.date.fromisoformat(row[0]), row[1])
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.touched.add(key)
+            return entry
+
+    def put(self, key, media_date, source):
+        """记录新解析的结果（批量写入）"""
+        with self.lock:
+            self.memory[key] = (media_date, source)
+            self.pending[key] = (media_date.isoformat(), source)
+            if len(self.pending) >= self.BATCH_SIZE:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self.pending:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO media_dates (key, media_date, source, last_seen) VALUES (?, ?, ?, ?)",
+                [(k, d, src, self.run_stamp) for k, (d, src) in self.pending.items()]
+            )
+            self.pending.clear()
+        if self.touched:
+            touched = list(self.touched)
+            for i in range(0, len(touched), self.BATCH_SIZE):
+                chunk = touched[i:i + self.BATCH_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                self.conn.execute(
+                    f"UPDATE media_dates SET last_seen = ? WHERE key IN ({placeholders})",
+                    [self.run_stamp] + chunk
+                )
+            self.touched.clear()
+        self.conn.commit()
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def close(self):
+        """写入剩余结果，超出容量时淘汰最久未使用的条目"""
+        with self.lock:
+            try:
+                self._flush_locked()
+                count = self.conn.execute("SELECT COUNT(*) FROM media_dates").fetchone()[0]
+                if count > self.max_entries:
+                    self.conn.execute(
+                        "DELETE FROM media_dates WHERE key IN ("
+                        " SELECT key FROM media_dates ORDER BY last_seen ASC LIMIT ?)",
+                        (count - self.max_entries,)
+                    )
+                    self.conn.commit()
+                    logger.debug(f"元数据缓存淘汰 {count - self.max_entries} 条旧记录")
+            finally:
+                self.conn.close()
+
+# 目录快照缓存（增量扫描）
+class DirectorySnapshotCache:
+    """源目录的快照缓存（与元数据缓存同一个SQLite文件）
+
+    记录每个目录的 (st_dev, st_ino, st_mtime_ns) 及其中的媒体文件和子目录，
+    目录mtime未变化时直接使用缓存的列表，不再scandir和逐个stat文件。
+    目录内文件被原地改写不会改变目录mtime，此时需要 --full-rescan。
+    """
+    RACY_WINDOW_NS = 2 * 10**9  # mtime距扫描时间太近的目录不缓存（同一时间粒度内可能还有修改）
+
+    def __init__(self, db_path, rebuild=False, full_rescan=False):
+        self.lock = threading.Lock()
+        self.full_rescan = full_rescan
+        self.updates = {}     # 本次重新读取的目录: path -> 行数据
+        self.visited = set()  # 本次扫描到的目录（用于清理已删除的目录）
+        self.hits = 0
+        self.misses = 0
+        
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        if rebuild:
+            self.conn.execute("DROP TABLE IF EXISTS scan_dirs")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS scan_dirs ("
+            " path TEXT PRIMARY KEY,"
+            " dev INTEGER NOT NULL,"
+            " ino INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " subdirs TEXT NOT NULL,"
+            " files TEXT NOT NULL)"
+        )
+        self.conn.commit()
+        # 一次性加载全部快照，扫描线程只查字典
+        self.snapshots = {row[0]: row[1:] for row in self.conn.execute("SELECT * FROM scan_dirs")}
+
+    def scan(self, path, skipped_dirs=None):
+        """读取目录（快照有效时不访问目录内容），返回 (媒体文件记录列表, 子目录列表)"""
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        with self.lock:
+            self.visited.add(key)
+            snapshot = None if self.full_rescan else self.snapshots.get(key)
+        if snapshot is not None and tuple(snapshot[:3]) == (st.st_dev, st.st_ino, st.st_mtime_ns):
+            files = [FileRecord.from_fields(os.path.join(path, name), name, size, mtime_ns, st.st_dev, ino)
+                     for name, size, mtime_ns, ino in json.loads(snapshot[4])]
+            subdirs = [os.path.join(path, name) for name in json.loads(snapshot[3])]
+            with self.lock:
+                self.hits += 1
+            return files, subdirs
+        
+        files, subdirs = _scan_directory(path, skipped_dirs)
+        with self.lock:
+            self.misses += 1
+            if time.time_ns() - st.st_mtime_ns > self.RACY_WINDOW_NS:
+                self.updates[key] = (
+                    st.st_dev, st.st_ino, st.st_mtime_ns,
+                    json.dumps([os.path.basename(d) for d in subdirs], ensure_ascii=False),
+                    json.dumps([[r.name, r.size, r.mtime_ns, r.ino] for r in files], ensure_ascii=False)
+                )
+        return files, subdirs
+
+    def close(self, scanned_root=None):
+        """写入新快照；scanned_root为完整扫描过的根目录时，清理其下已不存在的目录"""
+        with self.lock:
+            try:
+                stale = []
+                if scanned_root is not None:
+                    root = os.path.abspath(scanned_root)
+                    prefix = root.rstrip(os.sep) + os.sep
+                    stale = [(path,) for path in self.snapshots
+                             if (path == root or path.startswith(prefix)) and path not in self.visited]
+                with self.conn:
+                    if stale:
+                        self.conn.executemany("DELETE FROM scan_dirs WHERE path = ?", stale)
+                    if self.updates:
+                        self.conn.executemany(
+                            "INSERT OR REPLACE INTO scan_dirs (path, dev, ino, mtime_ns, subdirs, files)"
+                            " VALUES (?, ?, ?, ?, ?, ?)",
+                            [(path,) + row for path, row in self.updates.items()]
+                        )
+            finally:
+                self.conn.close()
+
+# 目标库内容目录（已整理文件的内容哈希和日期）
+CATALOG_FILENAME = '.organize_catalog.sqlite'
+
+class ContentCatalog:
+    """目标库的持久化内容目录（SQLite，保存在目标根目录）
+
+    以库内相对路径为键记录 (大小, mtime_ns) 及内容哈希和日期，大小或mtime变化的记录视为失效。
+    已整理文件的哈希只计算一次，之后与库内文件的去重比较直接查表。
+    完整遍历过一次目标库后（user_version=1）目录即是库内文件的索引，去重时按大小查表而不再遍历目标库。
+    """
+    BATCH_SIZE = 500  # 每个事务提交的记录数
+    SIZE_QUERY_CHUNK = 500  # 按大小查询时每条SQL的参数个数
+
+    def __init__(self, db_path, root):
+        self.root = os.path.abspath(root)
+        self.lock = threading.Lock()
+        self.pending = {}  # 待提交的变更: rel_path -> 行数据（None表示删除）
+        self.hits = 0
+        
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS library_files ("
+            " rel_path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " partial_hash TEXT,"
+            " content_hash TEXT,"
+            " media_date TEXT)"
+        )
+        self.conn.commit()
+
+    def relpath(self, path):
+        """库内相对路径（库外文件返回None）"""
+        try:
+            rel = os.path.relpath(os.path.abspath(path), self.root)
+        except ValueError:  # Windows上不同驱动器
+            return None
+        if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+            return None
+        return rel.replace(os.sep, '/')
+
+    def _row_locked(self, rel):
+        if rel in self.pending:
+            return self.pending[rel]
+        return self.conn.execute(
+            "SELECT size, mtime_ns, partial_hash, content_hash, media_date FROM library_files WHERE rel_path = ?",
+            (rel,)
+        ).fetchone()
+
+    @staticmethod
+    def _valid(row, size, mtime_ns):
+        return row is not None and row[0] == size and row[1] == mtime_ns
+
+    def lookup(self, record):
+        """返回库内文件已知的 (partial_hash, content_hash)，未登记或已失效时返回None"""
+        rel = self.relpath(record.path)
+        if rel is None:
+            return None
+        with self.lock:
+            row = self._row_locked(rel)
+            if not self._valid(row, record.size, record.mtime_ns):
+                return None
+            self.hits += 1
+            return row[2], row[3]
+
+    def update_hashes(self, record, partial=None, full=None):
+        """登记库内文件新计算出的哈希"""
+        rel = self.relpath(record.path)
+        if rel is None:
+            return
+        with self.lock:
+            row = self._row_locked(rel)
+            if not self._valid(row, record.size, record.mtime_ns):
+                row = (record.size, record.mtime_ns, None, None, None)
+            self._stage_locked(rel, (row[0], row[1], partial or row[2], full or row[3], row[4]))
+
+    def record_move(self, record, source_path):
+        """登记移入目标库的文件（库内移动时同时删除旧路径，沿用其哈希）"""
+        with self.lock:
+            partial = None
+            old_rel = self.relpath(source_path)
+            if old_rel is not None:
+                old_row = self._row_locked(old_rel)
+                if self._valid(old_row, record.size, record.mtime_ns):
+                    partial = old_row[2]
+                    record.content_hash = record.content_hash or old_row[3]
+                self._stage_locked(old_rel, None)
+            rel = self.relpath(record.target_path)
+            if rel is not None:
+                self._stage_locked(rel, (record.size, record.mtime_ns, partial,
+                                         record.content_hash, record.date_folder))
+
+    def register(self, record):
+        """登记遍历目标库时看到的文件（已有有效记录时不变）"""
+        rel = self.relpath(record.path)
+        if rel is None:
+            return
+        with self.lock:
+            if not self._valid(self._row_locked(rel), record.size, record.mtime_ns):
+                self._stage_locked(rel, (record.size, record.mtime_ns, None, None, None))
+
+    def is_indexed(self):
+        """是否已登记过目标库中的全部文件"""
+        with self.lock:
+            return self.conn.execute("PRAGMA user_version").fetchone()[0] >= 1
+
+    def mark_indexed(self):
+        with self.lock:
+            self._flush_locked()
+            self.conn.execute("PRAGMA user_version = 1")
+            self.conn.commit()
+
+    def paths_with_sizes(self, sizes):
+        """库内大小属于sizes的文件，返回 (绝对路径, 大小, mtime_ns) 列表"""
+        sizes = sorted(sizes)
+        rows = []
+        with self.lock:
+            self._flush_locked()
+            for i in range(0, len(sizes), self.SIZE_QUERY_CHUNK):
+                chunk = sizes[i:i + self.SIZE_QUERY_CHUNK]
+                rows.extend(self.conn.execute(
+                    "SELECT rel_path, size, mtime_ns FROM library_files"
+                    f" WHERE size IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ))
+        return [(os.path.join(self.root, rel.replace('/', os.sep)), size, mtime_ns)
+                for rel, size, mtime_ns in rows]
+
+    def forget(self, path):
+        """文件被删除时移除其记录"""
+        rel = self.relpath(path)
+        if rel is not None:
+            with self.lock:
+                self._stage_locked(rel, None)
+
+    def _stage_locked(self, rel, row):
+        self.pending[rel] = row
+        if len(self.pending) >= self.BATCH_SIZE:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self.pending:
+            return
+        upserts = [(rel,) + row for rel, row in self.pending.items() if row is not None]
+        deletes = [(rel,) for rel, row in self.pending.items() if row is None]
+        # 一批变更在同一个事务中提交
+        with self.conn:
+            if deletes:
+                self.conn.executemany("DELETE FROM library_files WHERE rel_path = ?", deletes)
+            if upserts:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO library_files"
+                    " (rel_path, size, mtime_ns, partial_hash, content_hash, media_date)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    upserts
+                )
+        self.pending.clear()
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def close(self):
+        with self.lock:
+            try:
+                self._flush_locked()
+            finally:
+                self.conn.close()
+
+
+@lru_cache(maxsize=4096)
+def get_cached_file_timestamp(filepath):
+    """带缓存的文件修改时间获取（性能优化）"""
+    try:
+        return os.path.getmtime(filepath)
+    except Exception:
+        return time.time()
+
+# EXIF头部解析（不经过PIL）
+EXIF_HEADER_WINDOW = 64 * 1024  # JPEG中查找APP1段的最大范围
+EXIF_DATE_TAGS = (36867, 36868, 306)  # DateTimeOriginal, DateTimeDigitized, DateTime（按优先级）
+EXIF_IFD_POINTER = 34665  # ExifIFD偏移
+EXIF_MAX_IFD_ENTRIES = 1024  # 损坏文件保护
+
+def _parse_exif_datetime(value):
+    """解析EXIF日期字符串（多种格式）"""
+    formats = ["%Y:%m:%d %H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S"]
+    for fmt in formats:
+        try:
+            return datetime.datetime.strptime(value.strip()[:19], fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def _read_ifd_tags(f, base, offset, endian, wanted):
+    """读取一个IFD中需要的标签（只对需要的值seek+read）"""
+    f.seek(base + offset)
+    count = struct.unpack(endian + 'H', f.read(2))[0]
+    if count > EXIF_MAX_IFD_ENTRIES:
+        raise ValueError(f"IFD条目数异常: {count}")
+    entries = f.read(count * 12)
+    found = {}
+    for i in range(0, len(entries) - 11, 12):
+        tag, typ, cnt, raw = struct.unpack(endian + 'HHI4s', entries[i:i + 12])
+        if tag not in wanted:
+            continue
+        if typ == 2:  # ASCII
+            if cnt <= 4:
+                data = raw[:cnt]
+            else:
+                value_offset = struct.unpack(endian + 'I', raw)[0]
+                f.seek(base + value_offset)
+                data = f.read(min(cnt, 64))
+            found[tag] = data.split(b'\0', 1)[0].decode('ascii', 'ignore')
+        elif typ in (4, 13):  # LONG / IFD 指针
+            found[tag] = struct.unpack(endian + 'I', raw)[0]
+    return found
+
+def _read_tiff_exif_date(f, base):
+    """从TIFF结构读取日期（base为TIFF头在文件中的偏移）"""
+    f.seek(base)
+    header = f.read(8)
+    if header[:2] == b'II':
+        endian = '<'
+    elif header[:2] == b'MM':
+        endian = '>'
+    else:
+        raise ValueError("无效的TIFF字节序标记")
+    magic, ifd0_offset = struct.unpack(endian + 'HI', header[2:8])
+    if magic != 42:
+        raise ValueError("无效的TIFF头")
+    
+    tags = _read_ifd_tags(f, base, ifd0_offset, endian, {306, EXIF_IFD_POINTER})
+    exif_offset = tags.pop(EXIF_IFD_POINTER, None)
+    if isinstance(exif_offset, int) and exif_offset:
+        tags.update(_read_ifd_tags(f, base, exif_offset, endian, {36867, 36868}))
+    
+    for tag_id in EXIF_DATE_TAGS:
+        value = tags.get(tag_id)
+        if isinstance(value, str) and value:
+            date = _parse_exif_datetime(value)
+            if date:
+                return date
+    return None
+
+def read_exif_date_native(image_path):
+    """仅读取文件头的EXIF日期解析（JPEG APP1 / TIFF及基于TIFF的RAW）
+
+    返回日期或None（结构正常但没有日期）；无法识别的格式抛出ValueError。
+    """
+    with open(image_path, 'rb') as f:
+        head = f.read(4)
+        if head[:2] in (b'II', b'MM'):
+            return _read_tiff_exif_date(f, 0)
+        if head[:2] != b'\xff\xd8':
+            raise ValueError("不是JPEG/TIFF文件")
+        
+        # 遍历JPEG段，只定位APP1(Exif)
+        pos = 2
+        while pos < EXIF_HEADER_WINDOW:
+            f.seek(pos)
+            marker = f.read(4)
+            if len(marker) < 4 or marker[0] != 0xFF:
+                raise ValueError("JPEG段结构损坏")
+            if marker[1] in (0xD9, 0xDA):  # EOI / SOS：图像数据开始，没有EXIF
+                return None
+            seg_length = struct.unpack('>H', marker[2:4])[0]
+            if marker[1] == 0xE1:
+                if f.read(6) == b'Exif\0\0':
+                    return _read_tiff_exif_date(f, pos + 10)
+            pos += 2 + seg_length
+    return None
+
+def _get_image_exif_date_pil(image_path):
+    """通过PIL读取EXIF日期（非JPEG/TIFF格式的回退方案）"""
+    try:
+        with Image.open(image_path) as img:
+            exif_data = img.getexif()
+            
+            if not exif_data:
+                return None
+            
+            # 预定义的日期标签ID列表
+            date_tag_ids = {
+                36867: "DateTimeOriginal",   # EXIF日期时间原始值
+                36868: "DateTimeDigitized",  # EXIF数字化日期时间
+                306: "DateTime",             # TIFF/EP 标准日期时间
+                
+                # 相机特定标签
+                50934: "OlympusDate",        # Olympus日期时间
+                50937: "OlympusDateTime",    # Olympus日期时间(长格式)
+                32781: "DateTimeCreated",    # 创建日期时间(某些相机),
+                36864: 'ExifVersion',
+                36880: 'OffsetTime',
+                36881: 'OffsetTimeOriginal',
+                36882: 'OffsetTimeDigitized',
+                33434: 'ExposureTime',
+                33437: 'FNumber',
+            }
+            
+            # 优先检查已知日期标签
+            for tag_id, tag_name in date_tag_ids.items():
+                value = exif_data.get(tag_id)
+                if value and isinstance(value, str):
+                    date = _parse_exif_datetime(value)
+                    if date:
+                        return date
+    except Exception as e:
+        logger.debug(f"EXIF读取错误 {os.path.basename(image_path)}: {str(e)}")
+    return None
+
+@lru_cache(maxsize=4096)
+def get_image_exif_date(image_path):
+    """从图片EXIF获取日期（带缓存，优先使用只读文件头的解析器）"""
+    try:
+        return read_exif_date_native(image_path)
+    except (ValueError, struct.error) as e:
+        # HEIC/PNG或结构异常的文件交给PIL
+        logger.debug(f"EXIF头部解析回退到PIL {os.path.basename(image_path)}: {str(e)}")
+    except OSError as e:
+        logger.debug(f"EXIF读取错误 {os.path.basename(image_path)}: {str(e)}")
+        return None
+    return _get_image_exif_date_pil(image_path)
+
+# 视频元数据日期格式
+VIDEO_DATE_FORMATS = [
+    "%Y-%m-%dT%H:%M:%S",   # ISO格式 (GoPro/iPhone)
+    "%Y%m%d",               # 紧凑格式 (Sony相机)
+    "%Y/%m/%d %H:%M:%S",    # 目录/时间格式
+    "%d-%b-%Y",             # Nikon格式 (01-JAN-2023)
+    "%Y:%m:%d %H:%M:%S",     # EXIF格式的视频
+    "%Y%m%d%H%M%S",         # 紧凑时间格式
+    "%b %d %Y %H:%M:%S"      # 文本月份格式
+]
+
+# ISO 8601 日期（可带时间、小数秒和时区），取其中的日期部分
+ISO_DATE_RE = re.compile(r'^(\d{4}-\d{2}-\d{2})(?:[T ]\d{2}:\d{2}(?::\d{2})?|$)')
+
+def _parse_video_date_string(date_str):
+    """尝试所有可能的日期格式解析视频元数据中的日期字符串"""
+    date_str = date_str.strip().strip('\0')
+    if not date_str:
+        return None
+    iso_match = ISO_DATE_RE.match(date_str)
+    if iso_match:
+        try:
+            return datetime.date.fromisoformat(iso_match.group(1))
+        except ValueError:
+            return None
+    for fmt in VIDEO_DATE_FORMATS:
+        try:
+            # 清理不规则字符
+            clean_date = ''.join(c for c in date_str if c.isprintable()).replace('T', ' ')
+            # 尝试不带时区的部分
+            dt_str = clean_date.split('.')[0].split('+')[0].strip()
+            dt = datetime.datetime.strptime(dt_str, fmt)
+            return dt.date()
+        except ValueError:
+            continue
+    return None
+
+# ISO-BMFF (MP4/MOV) 原生解析
+MP4_EXTENSIONS = ('.mp4', '.mov', '.3gp', '.m4v')
+MP4_EPOCH = datetime.datetime(1904, 1, 1)  # mvhd时间起点
+MP4_MAX_META_SIZE = 256 * 1024  # meta/udta中单个值的读取上限
+APPLE_CREATION_KEY = b'com.apple.quicktime.creationdate'
+
+def _iter_boxes(f, start, end):
+    """遍历 [start, end) 内的box（只读头部，靠seek跳过内容），返回 (类型, 数据起点, 结束位置)"""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>I4s', header)
+        data_start = pos + 8
+        if size == 1:  # 64位大小
+            size = struct.unpack('>Q', f.read(8))[0]
+            data_start += 8
+        elif size == 0:  # 延伸到父容器末尾
+            size = end - pos
+        if size < data_start - pos:
+            raise ValueError(f"box大小无效: {box_type!r}")
+        yield box_type, data_start, min(pos + size, end)
+        pos += size
+
+def _read_mvhd_date(f, data_start):
+    """读取mvhd中的creation_time（UTC，1904纪元）"""
+    f.seek(data_start)
+    data = f.read(12)
+    if data[:1] == b'\x01':
+        creation_time = struct.unpack('>Q', data[4:12])[0]
+    else:
+        creation_time = struct.unpack('>I', data[4:8])[0]
+    if not creation_time:
+        return None
+    dt = MP4_EPOCH + datetime.timedelta(seconds=creation_time)
+    return dt.date() if dt.year >= 1970 else None
+
+def _read_meta_creation_date(f, start, end):
+    """读取QuickTime meta(keys+ilst)中的 com.apple.quicktime.creationdate"""
+    # QuickTime的meta没有version/flags，MP4的meta是FullBox
+    f.seek(start)
+    if f.read(8)[4:8] != b'hdlr':
+        start += 4
+    key_index = None
+    ilst = None
+    for box_type, data_start, box_end in _iter_boxes(f, start, end):
+        if box_type == b'keys':
+            f.seek(data_start + 4)
+            entry_count = struct.unpack('>I', f.read(4))[0]
+            for index in range(1, entry_count + 1):
+                key_size, _namespace = struct.unpack('>I4s', f.read(8))
+                if key_size < 8:
+                    break
+                if f.read(key_size - 8) == APPLE_CREATION_KEY:
+                    key_index = index
+                    break
+        elif box_type == b'ilst':
+            ilst = (data_start, box_end)
+    if key_index is None or ilst is None:
+        return None
+    for item_type, item_start, item_end in _iter_boxes(f, *ilst):
+        if struct.unpack('>I', item_type)[0] != key_index:
+            continue
+        for data_type, value_start, value_end in _iter_boxes(f, item_start, item_end):
+            if data_type == b'data':
+                # type indicator(4) + locale(4) + 值
+                f.seek(value_start + 8)
+                value = f.read(min(value_end - value_start - 8, MP4_MAX_META_SIZE))
+                return _parse_video_date_string(value.decode('utf-8', 'ignore'))
+    return None
+
+def _read_udta_date(f, start, end):
+    """读取udta中的meta或 ©day 日期"""
+    day_date = None
+    for box_type, data_start, box_end in _iter_boxes(f, start, end):
+        if box_type == b'meta':
+            date = _read_meta_creation_date(f, data_start, box_end)
+            if date:
+                return date
+        elif box_type == b'\xa9day':
+            # 长度(2) + 语言(2) + 文本
+            f.seek(data_start + 4)
+            value = f.read(min(box_end - data_start - 4, MP4_MAX_META_SIZE))
+            day_date = _parse_video_date_string(value.decode('utf-8', 'ignore'))
+    return day_date
+
+def read_mp4_creation_date(video_path):
+    """原生解析MP4/MOV的创建日期（只读box头部，moov在文件末尾时直接seek过去）
+
+    返回日期或None（结构正常但没有日期）；不是ISO-BMFF结构时抛出ValueError。
+    """
+    with open(video_path, 'rb') as f:
+        file_end = os.fstat(f.fileno()).st_size
+        for box_type, data_start, box_end in _iter_boxes(f, 0, file_end):
+            if not all(32 <= c < 127 for c in box_type):
+                raise ValueError("不是MP4/MOV文件")
+            if box_type != b'moov':
+                continue
+            
+            apple_date = None
+            mvhd_date = None
+            for child_type, child_start, child_end in _iter_boxes(f, data_start, box_end):
+                if child_type == b'mvhd':
+                    mvhd_date = _read_mvhd_date(f, child_start)
+                elif child_type == b'meta':
+                    apple_date = apple_date or _read_meta_creation_date(f, child_start, child_end)
+                elif child_type == b'udta':
+                    apple_date = apple_date or _read_udta_date(f, child_start, child_end)
+            # 优先使用带本地时区的拍摄日期
+            return apple_date or mvhd_date
+    raise ValueError("未找到moov")
+
+# AVI (RIFF) 原生解析
+AVI_MAX_CHUNK_READ = 64 * 1024  # IDIT/ICRD/strd 单个块的读取上限
+AVI_CONTAINER_LISTS = (b'hdrl', b'strl', b'INFO')  # 需要进入的LIST（跳过movi）
+EXIF_DATETIME_RE = re.compile(rb'(\d{4}):(\d{2}):(\d{2}) \d{2}:\d{2}:\d{2}')
+
+def _parse_avi_date_string(raw):
+    """解析IDIT/ICRD日期（如 'MON MAR 13 16:58:26 2006' 或 '2006:03:13 16:58:26'）"""
+    text = raw.split(b'\0', 1)[0].decode('latin-1').strip()
+    date = _parse_video_date_string(text)
+    if date:
+        return date
+    try:
+        return datetime.datetime.strptime(' '.join(text.split()), "%a %b %d %H:%M:%S %Y").date()
+    except ValueError:
+        return None
+
+def _iter_riff_chunks(f, start, end):
+    """遍历RIFF块（只读8字节头部），返回 (块ID, 数据起点, 数据大小)"""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        chunk_id, size = struct.unpack('<4sI', header)
+        yield chunk_id, pos + 8, size
+        pos += 8 + size + (size & 1)  # 块按偶数字节对齐
+
+def _collect_riff_dates(f, start, end, found):
+    """在LIST内（含嵌套的hdrl/strl等）收集 IDIT（数字化时间）、strd（相机EXIF数据）和 ICRD（创建日期）
+
+    found 为 {块ID: 日期}，每种块只取第一个有效日期；找到IDIT后不再继续。
+    """
+    for chunk_id, data_start, size in _iter_riff_chunks(f, start, end):
+        if chunk_id == b'LIST':
+            f.seek(data_start)
+            if f.read(4) in AVI_CONTAINER_LISTS:
+                _collect_riff_dates(f, data_start + 4, min(data_start + size, end), found)
+        elif chunk_id in (b'IDIT', b'ICRD', b'strd') and chunk_id not in found:
+            f.seek(data_start)
+            raw = f.read(min(size, AVI_MAX_CHUNK_READ))
+            if chunk_id == b'strd':
+                match = EXIF_DATETIME_RE.search(raw)
+                date = _parse_exif_datetime(match.group(0).decode('ascii')) if match else None
+            else:
+                date = _parse_avi_date_string(raw)
+            if date:
+                found[chunk_id] = date
+        if b'IDIT' in found:
+            return
+
+def _read_riff_list_date(f, start, end):
+    """按 IDIT > strd > ICRD 的优先级返回整个RIFF中的拍摄日期"""
+    found = {}
+    _collect_riff_dates(f, start, end, found)
+    return found.get(b'IDIT') or found.get(b'strd') or found.get(b'ICRD')
+
+def read_avi_creation_date(video_path):
+    """原生解析AVI的拍摄日期（只读取头部LIST中的小块，movi数据通过seek跳过）"""
+    with open(video_path, 'rb') as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'AVI ':
+            raise ValueError("不是AVI文件")
+        riff_size = struct.unpack('<I', header[4:8])[0]
+        file_end = os.fstat(f.fileno()).st_size
+        return _read_riff_list_date(f, 12, min(8 + riff_size, file_end))
+
+# Matroska (EBML) 原生解析
+EBML_MAGIC = b'\x1a\x45\xdf\xa3'
+MKV_SEGMENT_ID = 0x18538067
+MKV_SEEKHEAD_ID = 0x114D9B74
+MKV_SEEK_ID = 0x4DBB
+MKV_SEEK_ID_ID = 0x53AB
+MKV_SEEK_POSITION_ID = 0x53AC
+MKV_INFO_ID = 0x1549A966
+MKV_CLUSTER_ID = 0x1F43B675
+MKV_DATE_UTC_ID = 0x4461
+MKV_EPOCH = datetime.datetime(2001, 1, 1)  # DateUTC起点（纳秒）
+MKV_MAX_ELEMENT_READ = 64 * 1024  # Info/SeekHead 的读取上限
+
+def _read_ebml_vint(data, pos, keep_marker):
+    """读取EBML变长整数，返回 (值, 新位置, 是否为未知大小)"""
+    first = data[pos]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not (first & mask):
+        mask >>= 1
+        length += 1
+    if length > 8 or pos + length > len(data):
+        raise ValueError("EBML变长整数无效")
+    value = first if keep_marker else first & (mask - 1)
+    for b in data[pos + 1:pos + length]:
+        value = (value << 8) | b
+    unknown = not keep_marker and value == (1 << (7 * length)) - 1
+    return value, pos + length, unknown
+
+def _iter_ebml_elements(data):
+    """遍历内存中的EBML元素，返回 (ID, 数据)"""
+    pos = 0
+    while pos < len(data):
+        element_id, pos, _ = _read_ebml_vint(data, pos, True)
+        size, pos, _ = _read_ebml_vint(data, pos, False)
+        yield element_id, data[pos:pos + size]
+        pos += size
+
+def _read_ebml_header(f, pos):
+    """在文件中读取元素头部，返回 (ID, 数据起点, 大小或None)"""
+    f.seek(pos)
+    header = f.read(12)
+    if not header:
+        return None, pos, 0
+    element_id, offset, _ = _read_ebml_vint(header, 0, True)
+    size, offset, unknown = _read_ebml_vint(header, offset, False)
+    return element_id, pos + offset, None if unknown else size
+
+def _parse_mkv_info_date(data):
+    """从Segment Info中读取DateUTC"""
+    for element_id, value in _iter_ebml_elements(data):
+        if element_id == MKV_DATE_UTC_ID and len(value) == 8:
+            nanoseconds = struct.unpack('>q', value)[0]
+            return (MKV_EPOCH + datetime.timedelta(microseconds=nanoseconds // 1000)).date()
+    return None
+
+def read_mkv_creation_date(video_path):
+    """原生解析Matroska的DateUTC（逐个读取Segment子元素头部，遇到Cluster即停止）"""
+    with open(video_path, 'rb') as f:
+        if f.read(4) != EBML_MAGIC:
+            raise ValueError("不是Matroska文件")
+        file_end = os.fstat(f.fileno()).st_size
+        
+        # 跳过EBML头，定位Segment
+        _, data_start, size = _read_ebml_header(f, 0)
+        element_id, segment_start, segment_size = _read_ebml_header(f, data_start + (size or 0))
+        if element_id != MKV_SEGMENT_ID:
+            raise ValueError("未找到Matroska Segment")
+        segment_end = file_end if segment_size is None else min(segment_start + segment_size, file_end)
+        
+        info_position = None
+        pos = segment_start
+        while pos < segment_end:
+            element_id, data_start, size = _read_ebml_header(f, pos)
+            if element_id is None or size is None:
+                break
+            if element_id == MKV_INFO_ID:
+                f.seek(data_start)
+                return _parse_mkv_info_date(f.read(min(size, MKV_MAX_ELEMENT_READ)))
+            if element_id == MKV_SEEKHEAD_ID:
+                f.seek(data_start)
+                for seek_id, seek in _iter_ebml_elements(f.read(min(size, MKV_MAX_ELEMENT_READ))):
+                    if seek_id != MKV_SEEK_ID:
+                        continue
+                    fields = dict(_iter_ebml_elements(seek))
+                    if fields.get(MKV_SEEK_ID_ID) == struct.pack('>I', MKV_INFO_ID):
+                        info_position = segment_start + int.from_bytes(fields.get(MKV_SEEK_POSITION_ID, b''), 'big')
+            if element_id == MKV_CLUSTER_ID:
+                break
+            pos = data_start + size
+        
+        # Info位于Cluster之后时，通过SeekHead直接跳转
+        if info_position is not None:
+            element_id, data_start, size = _read_ebml_header(f, info_position)
+            if element_id == MKV_INFO_ID and size is not None:
+                f.seek(data_start)
+                return _parse_mkv_info_date(f.read(min(size, MKV_MAX_ELEMENT_READ)))
+    return None
+
+# AVCHD (MTS/M2TS) 原生解析
+AVCHD_HEADER_WINDOW = 1024 * 1024  # 只在文件开头的视频流中查找MDPM
+TS_SYNC_BYTE = 0x47
+MDPM_MARKER = b'MDPM'
+
+def _bcd(value):
+    """BCD字节转整数"""
+    high, low = value >> 4, value & 0x0F
+    if high > 9 or low > 9:
+        raise ValueError("BCD数据无效")
+    return high * 10 + low
+
+def _demux_ts_payloads(data):
+    """按PID拆出TS包的负载（188字节TS包或192字节M2TS包）"""
+    if len(data) > 192 and data[0] == TS_SYNC_BYTE and data[188] == TS_SYNC_BYTE:
+        packet_size, sync_offset = 188, 0
+    elif len(data) > 196 and data[4] == TS_SYNC_BYTE and data[196] == TS_SYNC_BYTE:
+        packet_size, sync_offset = 192, 4
+    else:
+        raise ValueError("不是MPEG-TS文件")
+    
+    streams = {}
+    for pos in range(sync_offset, len(data) - 187, packet_size):
+        packet = data[pos:pos + 188]
+        if packet[0] != TS_SYNC_BYTE:
+            continue
+        pid = ((packet[1] & 0x1F) << 8) | packet[2]
+        adaptation = (packet[3] >> 4) & 0x3
+        payload_start = 4
+        if adaptation & 0x2:
+            payload_start += 1 + packet[4]
+        if adaptation & 0x1 and payload_start < 188:
+            streams.setdefault(pid, bytearray()).extend(packet[payload_start:])
+    return streams
+
+def _parse_mdpm_date(stream):
+    """解析H.264 SEI中的MDPM（0x18: 时区/年/月，0x19: 日/时/分/秒）"""
+    pos = stream.find(MDPM_MARKER)
+    while pos != -1:
+        # 去除H.264防竞争字节后再解析
+        block = bytes(stream[pos + 4:pos + 4 + 256]).replace(b'\x00\x00\x03', b'\x00\x00')
+        if block:
+            count = block[0]
+            tags = {}
+            for i in range(count):
+                entry = block[1 + i * 5:6 + i * 5]
+                if len(entry) < 5:
+                    break
+                tags[entry[0]] = entry[1:]
+            if 0x18 in tags and 0x19 in tags:
+                try:
+                    ymd, dhms = tags[0x18], tags[0x19]
+                    year = _bcd(ymd[1]) * 100 + _bcd(ymd[2])
+                    return datetime.date(year, _bcd(ymd[3]), _bcd(dhms[0]))
+                except ValueError:
+                    pass
+        pos = stream.find(MDPM_MARKER, pos + 4)
+    return None
+
+def read_avchd_creation_date(video_path):
+    """原生解析AVCHD的录制日期（只读取开头窗口，从视频流的MDPM元数据中获取）"""
+    with open(video_path, 'rb') as f:
+        data = f.read(AVCHD_HEADER_WINDOW)
+    for stream in _demux_ts_payloads(data).values():
+        date = _parse_mdpm_date(stream)
+        if date:
+            return date
+    return None
+
+@lru_cache(maxsize=1)
+def _ffprobe_available():
+    """检查ffprobe是否可用（只检查一次）"""
+    return shutil.which('ffprobe') is not None
+
+def _get_video_date_ffprobe(video_path):
+    """通过ffprobe子进程获取视频创建日期（最后手段）"""
+    try:
+        cmd = [
+            'ffprobe', '-v', 'error',
+            '-show_entries', 'format_tags=creation_time',
+            '-show_entries', 'format_tags=creation_date',
+            '-show_entries', 'format_tags=com.apple.quicktime.creationdate',
+            '-of', 'default=nokey=1:noprint_wrappers=1',
+            video_path
+        ]
+        with run_metrics.timer('ffprobe'):
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
+        
+        if result.returncode == 0:
+            # 尝试解析输出中的日期值
+            for date_str in result.stdout.strip().splitlines():
+                date = _parse_video_date_string(date_str)
+                if date:
+                    return date
+    except (FileNotFoundError, subprocess.TimeoutExpired, subprocess.CalledProcessError) as e:
+        if isinstance(e, subprocess.TimeoutExpired):
+            run_metrics.count('ffprobe_timeouts')
+        logger.debug(f"视频日期读取失败 {os.path.basename(video_path)}: {str(e)}")
+    return None
+
+# 扩展名 -> 原生容器解析函数
+NATIVE_VIDEO_READERS = {ext: read_mp4_creation_date for ext in MP4_EXTENSIONS}
+NATIVE_VIDEO_READERS.update({
+    '.avi': read_avi_creation_date,
+    '.mkv': read_mkv_creation_date,
+    '.mts': read_avchd_creation_date,
+    '.m2ts': read_avchd_creation_date,
+})
+
+@lru_cache(maxsize=2048)
+def get_video_metadata_date(video_path):
+    """带缓存的视频元数据日期获取（优先原生解析容器，ffprobe作为最后手段）"""
+    ext = os.path.splitext(video_path)[1].lower()
+    reader = NATIVE_VIDEO_READERS.get(ext)
+    if reader is not None:
+        try:
+            # 容器结构正常时结果即为最终结果（ffprobe读取的是同样的元数据）
+            return reader(video_path)
+        except (ValueError, struct.error, IndexError) as e:
+            logger.debug(f"容器解析回退到ffprobe {os.path.basename(video_path)}: {str(e)}")
+        except OSError as e:
+            logger.debug(f"视频日期读取失败 {os.path.basename(video_path)}: {str(e)}")
+            return None
+    
+    if _ffprobe_available():
+        return _get_video_date_ffprobe(video_path)
+    return None
+
+def get_video_filename_date(video_path):
+    """从视频文件名提取日期信息"""
+    basename = os.path.basename(video_path)
+    name_without_ext = os.path.splitext(basename)[0]
+    
+    # 常见命名模式: YYYYMMDD_HHMMSS, YYYY-MM-DD HH.MM.SS
+    patterns = [
+        r'\d{4}-\d{2}-\d{2}',  # YYYY-MM-DD
+        r'\d{8}',              # YYYYMMDD
+        r'\d{4}\d{2}\d{2}'     # YYYYMMDD
+    ]
+    
+    import re
+    for pattern in patterns:
+        match = re.search(pattern, name_without_ext)
+        if match:
+            date_str = match.group(0)
+            date_formats = ["%Y-%m-%d", "%Y%m%d", "%Y%m%d"]
+            for fmt in date_formats:
+                try:
+                    dt = datetime.datetime.strptime(date_str, fmt)
+                    return dt.date()
+                except ValueError:
+                    continue
+    return None
+
+def resolve_media_date(media_path, mtime=None):
+    """获取媒体日期及其来源（'exif' / 'video' / 'filename' / 'mtime' / 'fallback'）
+
+    mtime: 扫描时已获取的修改时间，提供时不再重复stat。
+    """
+    try:
+        lower_path = media_path.lower()
+        ext = os.path.splitext(lower_path)[1].lower()
+        
+        # 图片文件优先尝试EXIF
+        if ext in IMAGE_EXTENSIONS:
+            with run_metrics.timer('date.exif'):
+                exif_date = get_image_exif_date(media_path)
+            if exif_date:
+                return exif_date, 'exif'
+        
+        # 视频文件尝试获取元数据
+        if ext in VIDEO_EXTENSIONS:
+            with run_metrics.timer('date.video'):
+                video_date = get_video_metadata_date(media_path)
+            if video_date:
+                return video_date, 'video'
+            with run_metrics.timer('date.filename'):
+                name_date = get_video_filename_date(media_path)
+            if name_date:
+                return name_date, 'filename'
+            
+        # 尝试从文件名解析日期
+        basename = os.path.basename(media_path)
+        
+        # 常见文件名模式（20230105_123456.jpg）
+        patterns = [
+            r'(\d{4}-\d{2}-\d{2})',       # YYYY-MM-DD
+            r'(\d{4}_\d{2}_\d{2})',        # YYYY_MM_DD
+            r'(\d{4}\d{2}\d{2})',          # YYYYMMDD
+            r'(\d{4}\d{2}\d{2}[_-]\d{6})'  # YYYYMMDD-HHMMSS
+        ]
+        
+        import re
+        with run_metrics.timer('date.filename'):
+            for pattern in patterns:
+                match = re.search(pattern, basename)
+                if match:
+                    date_str = match.group(1)
+                    date_formats = ["%Y-%m-%d", "%Y_%m_%d", "%Y%m%d", "%Y%m%d-%H%M%S"]
+                    for fmt in date_formats:
+                        if len(date_str) == len(fmt.replace('_', '').replace('-', '')):
+                            try:
+                                dt = datetime.datetime.strptime(date_str, fmt)
+                                return dt.date(), 'filename'
+                            except ValueError:
+                                continue
+                
+        # 最后使用缓存的文件修改时间
+        with run_metrics.timer('date.mtime'):
+            timestamp = mtime if mtime is not None else get_cached_file_timestamp(media_path)
+            return datetime.datetime.fromtimestamp(timestamp).date(), 'mtime'
+    except Exception as e:
+        logger.debug(f"日期获取错误 {os.path.basename(media_path)}: {str(e)}")
+        # 回退到文件修改时间
+        try:
+            ts = os.path.getmtime(media_path)
+            return datetime.datetime.fromtimestamp(ts).date(), 'mtime'
+        except:
+            return datetime.date(1970, 1, 1), 'fallback'  # 回退到epoch时间
+
+def get_media_date_fast(media_path):
+    """优化的日期获取策略（带缓存和回退）"""
+    return resolve_media_date(media_path)[0]
+
+def iter_unique_filenames(base_name, extension=None):
+    """依次生成候选文件名：原名、计数器后缀、短哈希后缀、时间戳后缀"""
+    base, orig_ext = os.path.splitext(base_name)
+    if not extension:
+        extension = orig_ext
+    
+    # 首选原始文件名
+    yield base_name
+    
+    # 尝试计数器
+    for counter in range(1, 11):
+        yield f"{base}_{counter}{extension}"
+    
+    # 如果冲突严重，添加短哈希
+    for counter in range(11, 101):
+        file_hash = hashlib.md5(f"{base}{time.time()}{counter}".encode()).hexdigest()[:6]
+        yield f"{base}_{file_hash}{extension}"
+    
+    # 最终保护
+    yield f"{base}_{int(time.time())}{extension}"
+
+def generate_unique_filename(target_dir, base_name, extension):
+    """生成唯一文件名（解决冲突）"""
+    for new_filename in iter_unique_filenames(base_name, extension):
+        if not os.path.exists(os.path.join(target_dir, new_filename)):
+            break
+    return os.path.join(target_dir, new_filename)
+
+# 内容去重（大小 → 头尾部分哈希 → 完整哈希）
+DEDUP_PARTIAL_SIZE = 64 * 1024      # 部分哈希读取的头部和尾部字节数
+DEDUP_CHUNK_SIZE = 1024 * 1024      # 完整哈希的读取块大小（大块更新时hashlib会释放GIL）
+DATE_FOLDER_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+def _new_hasher():
+    return hashlib.blake2b(digest_size=32)
+
+def partial_hash(filepath, size):
+    """计算文件头部和尾部的哈希（小文件即为完整内容的哈希）"""
+    hasher = _new_hasher()
+    with run_metrics.timer('hash.partial'), open(filepath, 'rb') as f:
+        if size <= 2 * DEDUP_PARTIAL_SIZE:
+            hasher.update(f.read())
+        else:
+            hasher.update(f.read(DEDUP_PARTIAL_SIZE))
+            f.seek(-DEDUP_PARTIAL_SIZE, os.SEEK_END)
+            hasher.update(f.read(DEDUP_PARTIAL_SIZE))
+    return hasher.hexdigest()
+
+def file_hash(filepath, block_size=DEDUP_CHUNK_SIZE):
+    """计算文件完整内容的BLAKE2b哈希（流式读取）"""
+    hasher = _new_hasher()
+    with run_metrics.timer('hash.full'), open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(block_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+# 扩展属性中的内容哈希（随文件一起rename、复制和rsync -X同步）
+XATTR_SUPPORTED = hasattr(os, 'getxattr')
+HASH_XATTR = 'user.organize.content'
+HASH_ALGORITHM = 'blake2b-256'
+XATTR_UNSUPPORTED_ERRNOS = {errno.ENOTSUP, errno.EOPNOTSUPP}
+
+class HashXattrStore:
+    """在文件的 user.* 扩展属性中保存 "算法 哈希 大小 mtime_ns"
+
+    读取时算法、大小或mtime不符即忽略；不支持扩展属性的文件系统按设备自动停用。
+    """
+    def __init__(self):
+        self.enabled = XATTR_SUPPORTED
+        self.unsupported_devs = set()
+        self.hits = 0
+        self.writes = 0
+
+    def _usable(self, dev):
+        return self.enabled and dev not in self.unsupported_devs
+
+    def _check_unsupported(self, dev, error):
+        if error.errno in XATTR_UNSUPPORTED_ERRNOS and dev not in self.unsupported_devs:
+            self.unsupported_devs.add(dev)
+            logger.debug(f"文件系统不支持扩展属性（设备 {dev}），不再读写哈希属性")
+
+    def read(self, record):
+        """返回扩展属性中仍然有效的内容哈希，没有或已失效时返回None"""
+        if not self._usable(record.dev):
+            return None
+        try:
+            value = os.getxattr(record.path, HASH_XATTR)
+        except OSError as e:
+            self._check_unsupported(record.dev, e)
+            return None
+        try:
+            algorithm, digest, size, mtime_ns = value.decode('ascii').split()
+            if algorithm != HASH_ALGORITHM or int(size) != record.size or int(mtime_ns) != record.mtime_ns:
+                return None
+        except ValueError:
+            return None
+        self.hits += 1
+        return digest
+
+    def write(self, path, dev, digest, size, mtime_ns):
+        """写入内容哈希（单个属性一次写入，不会出现哈希与mtime不一致的中间状态）"""
+        if not self._usable(dev):
+            return
+        value = f"{HASH_ALGORITHM} {digest} {size} {mtime_ns}".encode('ascii')
+        try:
+            os.setxattr(path, HASH_XATTR, value)
+            self.writes += 1
+        except OSError as e:
+            self._check_unsupported(dev, e)
+            logger.debug(f"写入哈希属性失败 {path}: {e}")
+
+hash_xattrs = HashXattrStore()
+
+class DuplicateDetector:
+    """分级内容去重引擎：按大小分组，再用头尾哈希、完整哈希逐级缩小候选（哈希在线程池中并行）
+
+    提供内容目录时，库内文件的已知哈希直接查表，新算出的哈希写回目录；
+    完整哈希还会从文件的扩展属性读取，并在计算后写入扩展属性。
+    read_only=True（--plan）时只读取已知哈希，不写内容目录和扩展属性。
+    """
+    def __init__(self, workers=8, catalog=None, read_only=False):
+        self.workers = max(1, workers)
+        self.catalog = catalog
+        self.read_only = read_only
+        self.partial_hashed = 0
+        self.full_hashed = 0
+    
+    def _known(self, record):
+        partial = full = None
+        if self.catalog is not None:
+            partial, full = self.catalog.lookup(record) or (None, None)
+        if full is None and record.content_hash is None:
+            full = hash_xattrs.read(record)
+            if full is not None and self.catalog is not None and not self.read_only:
+                self.catalog.update_hashes(record, full=full)
+        return partial, full or record.content_hash
+    
+    def known_full(self, record):
+        """不读取文件内容即可得到的完整哈希（记录、内容目录或扩展属性），没有时返回None"""
+        if record.content_hash is None:
+            record.content_hash = self._known(record)[1]
+        return record.content_hash
+    
+    def partial(self, record):
+        """文件记录的头尾部分哈希"""
+        digest = self._known(record)[0]
+        if digest is None:
+            digest = partial_hash(record.path, record.size)
+            self.partial_hashed += 1
+            if record.size <= 2 * DEDUP_PARTIAL_SIZE and record.content_hash is None:
+                # 小文件的部分哈希就是完整内容哈希，同样登记并写入扩展属性
+                self._store_full(record, digest)
+            if self.catalog is not None and not self.read_only:
+                self.catalog.update_hashes(record, partial=digest)
+        return digest
+    
+    def _store_full(self, record, digest):
+        if not self.read_only:
+            if self.catalog is not None:
+                self.catalog.update_hashes(record, full=digest)
+            hash_xattrs.write(record.path, record.dev, digest, record.size, record.mtime_ns)
+        record.content_hash = digest
+    
+    def full(self, record):
+        """文件记录的完整内容哈希"""
+        digest = self.known_full(record)
+        if digest is None:
+            digest = file_hash(record.path)
+            self.full_hashed += 1
+            self._store_full(record, digest)
+        return digest
+    
+    def _regroup(self, groups, hash_func):
+        """对每组成员计算哈希并重新分组，只保留仍有多个成员的组"""
+        regrouped = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {}
+            for key, members in groups.items():
+                for record in members:
+                    futures[pool.submit(hash_func, record)] = (key, record)
+            for future in concurrent.futures.as_completed(futures):
+                key, record = futures[future]
+                try:
+                    digest = future.result()
+                except OSError as e:
+                    logger.debug(f"计算哈希失败 {record.path}: {e}")
+                    continue
+                regrouped.setdefault((key, digest), []).append(record)
+        return {key: members for key, members in regrouped.items() if len(members) > 1}
+    
+    @staticmethod
+    def _distinct_files(members):
+        """去掉符号链接，同一 (设备, inode) 的多个路径（硬链接）只保留路径最小的一个
+
+        扫描时stat跟随符号链接，链接与其指向的文件大小和内容都相同，但删除任何一个都会丢失数据。
+        """
+        distinct = {}
+        for record in sorted(members, key=lambda record: record.path):
+            if os.path.islink(record.path):
+                continue
+            distinct.setdefault((record.dev, record.ino), record)
+        return list(distinct.values())
+    
+    def find_groups(self, records, scanned_paths=None):
+        """在文件记录中查找内容完全相同的文件，返回文件记录分组列表（组内按路径排序）
+
+        scanned_paths: 可被判为重复的文件路径（本次扫描的文件），不含其中任何文件的组不再计算哈希。
+        符号链接不参与去重，同一文件的多个硬链接只作为一个文件参与比较。
+        """
+        def relevant(members):
+            return len(members) > 1 and (scanned_paths is None or
+                                         any(record.path in scanned_paths for record in members))
+        
+        by_size = {}
+        for record in records:
+            # 空文件不参与去重
+            if record.size > 0:
+                by_size.setdefault(record.size, []).append(record)
+        # 只对大小相同的候选检查符号链接（多一次lstat）
+        candidates = {size: self._distinct_files(members) for size, members in by_size.items() if relevant(members)}
+        candidates = {size: members for size, members in candidates.items() if relevant(members)}
+        if not candidates:
+            return []
+        
+        # 组内所有文件的完整哈希都已知时直接按哈希分组，不读取文件
+        confirmed = []
+        for size in list(candidates):
+            members = candidates[size]
+            if all(self.known_full(record) for record in members):
+                del candidates[size]
+                by_hash = {}
+                for record in members:
+                    by_hash.setdefault(record.content_hash, []).append(record)
+                confirmed.extend(m for m in by_hash.values() if len(m) > 1)
+        
+        candidates = {key: m for key, m in self._regroup(candidates, self.partial).items() if relevant(m)}
+        
+        # 小文件的部分哈希已覆盖全部内容，无需再算完整哈希
+        confirmed.extend(m for m in candidates.values() if m[0].size <= 2 * DEDUP_PARTIAL_SIZE)
+        large = {key: m for key, m in candidates.items() if m[0].size > 2 * DEDUP_PARTIAL_SIZE}
+        if large:
+            confirmed.extend(self._regroup(large, self.full).values())
+        return [sorted(members, key=lambda record: record.path) for members in confirmed]
+
+def files_identical(record, other_path, catalog=None, read_only=False):
+    """逐级比较文件记录与另一文件的内容是否完全相同（已知的哈希不再重新计算）"""
+    other = FileRecord.from_path(other_path)
+    if record.size != other.size:
+        return False
+    hashes = DuplicateDetector(catalog=catalog, read_only=read_only)
+    if hashes.known_full(record) and hashes.known_full(other):
+        return record.content_hash == other.content_hash
+    if hashes.partial(record) != hashes.partial(other):
+        return False
+    if record.size <= 2 * DEDUP_PARTIAL_SIZE:
+        return True
+    return hashes.full(record) == hashes.full(other)
+
+def _is_organized(path, target_base_dir):
+    """文件是否已位于目标目录的日期文件夹中"""
+    parent = os.path.dirname(os.path.abspath(path))
+    return (DATE_FOLDER_RE.match(os.path.basename(parent)) is not None and
+            os.path.normcase(os.path.dirname(parent)) == os.path.normcase(os.path.abspath(target_base_dir)))
+
+def _library_candidates(target_base_dir, sizes, catalog, full_rescan=False, read_only=False):
+    """目标库中大小属于sizes的已有文件
+
+    内容目录已索引全部库内文件时按大小查表并stat命中的文件，否则遍历目标库一次并登记到内容目录
+    （read_only=True 时只遍历，不修改内容目录）。
+    """
+    if catalog is not None and not full_rescan and catalog.is_indexed():
+        records = []
+        for path, size, mtime_ns in catalog.paths_with_sizes(sizes):
+            try:
+                record = FileRecord.from_path(path)
+            except FileNotFoundError:
+                if not read_only:
+                    catalog.forget(path)  # 库外删除的文件
+                continue
+            except OSError as e:
+                logger.debug(f"无法访问库内文件 {path}: {e}")
+                continue
+            if record.size in sizes:
+                records.append(record)
+        return records
+    
+    indexing = catalog is not None and not read_only
+    records = []
+    for record in iter_media_files(target_base_dir):
+        if indexing:
+            catalog.register(record)
+        if record.size in sizes:
+            records.append(record)
+    if indexing:
+        catalog.mark_indexed()
+    return records
+
+def dedup_keeper_key(record, existing_paths, target_base_dir):
+    """内容相同的一组文件中保留哪一个：目标库中已有的 > 已在日期文件夹中的 > 修改时间最早的 > 文件名最短的 > 路径
+
+    副本（"IMG_0001 (1).jpg"、"copy_*"、"a_1"）通常更新、文件名更长，因此保留原始文件。
+    """
+    return (record.path not in existing_paths, not _is_organized(record.path, target_base_dir),
+            record.mtime_ns, len(record.name), record.path)
+
+def detect_duplicates(media_files, source_dir, target_base_dir, workers=8, catalog=None, full_rescan=False,
+                      dry_run=False):
+    """在本次扫描的文件和目标目录已有文件中查找重复内容，填写 record.duplicate_of，返回重复文件列表
+
+    dry_run=True（生成计划）时不写扩展属性，也不修改内容目录。
+    """
+    records_by_path = {record.path: record for record in media_files}
+    files = list(media_files)
+    
+    # 目标目录不在源目录内时，已整理的文件也参与比较（只保留，不删除）；只需要与扫描到的文件大小相同的
+    existing_paths = set()
+    source_abs = os.path.abspath(source_dir)
+    target_abs = os.path.abspath(target_base_dir)
+    if os.path.commonpath([source_abs, target_abs]) != source_abs:
+        scanned = {(record.dev, record.ino) for record in media_files}
+        sizes = {record.size for record in media_files if record.size > 0}
+        for record in _library_candidates(target_base_dir, sizes, catalog, full_rescan, dry_run):
+            if (record.dev, record.ino) not in scanned:
+                existing_paths.add(record.path)
+                files.append(record)
+    
+    detector = DuplicateDetector(workers, catalog, read_only=dry_run)
+    duplicates = []
+    for group in detector.find_groups(files, records_by_path.keys()):
+        keeper = min(group, key=lambda record: dedup_keeper_key(record, existing_paths, target_base_dir))
+        for record in group:
+            if record is keeper or record.path not in records_by_path:
+                continue
+            if (record.dev, record.ino) == (keeper.dev, keeper.ino):
+                continue  # 同一个文件，不是重复
+            record.duplicate_of = keeper.path
+            duplicates.append(record)
+    logger.debug(f"去重: 部分哈希 {detector.partial_hashed} 个文件, 完整哈希 {detector.full_hashed} 个文件"
+                 f"{f', 内容目录命中 {catalog.hits} 次' if catalog is not None else ''}"
+                 f", 扩展属性命中 {hash_xattrs.hits} 次")
+    return duplicates
+
+# 目标目录名称索引
+class _IndexedFolder:
+    """单个日期目录的名称集合"""
+    __slots__ = ('lock', 'loaded', 'existing', 'taken', 'counters')
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.existing = set()  # 首次访问时磁盘上已有的名称
+        self.taken = set()     # 已有名称 + 本次运行预留的名称
+        self.counters = {}     # 文件名 -> 下一个计数器后缀（避免大量同名文件时反复探测）
+
+class TargetDirectoryIndex:
+    """目标日期目录的内存索引
+
+    每个目录首次访问时创建并scandir一次，之后的"名称是否存在"和"预留名称"
+    都是字典操作，不再逐个候选名称访问文件系统。
+    """
+    def __init__(self, target_base_dir, create=True):
+        self.target_base_dir = target_base_dir
+        self.create = create  # False时不创建目录（生成计划）
+        self.lock = threading.Lock()
+        self.folders = {}
+        
+    def _folder(self, date_folder):
+        with self.lock:
+            folder = self.folders.get(date_folder)
+            if folder is None:
+                folder = self.folders[date_folder] = _IndexedFolder()
+        with folder.lock:
+            if not folder.loaded:
+                path = os.path.join(self.target_base_dir, date_folder)
+                with run_metrics.timer('target_dir'):
+                    if self.create:
+                        os.makedirs(path, exist_ok=True, mode=0o755)  # 合理的默认权限
+                    try:
+                        with os.scandir(path) as it:
+                            folder.existing = {os.path.normcase(entry.name) for entry in it}
+                    except FileNotFoundError:
+                        if self.create:
+                            raise
+                folder.taken = set(folder.existing)
+                folder.loaded = True
+        return folder
+    
+    def prepare(self, date_folder):
+        """确保目录已创建并已建立索引"""
+        self._folder(date_folder)
+    
+    def on_disk(self, date_folder, name):
+        """名称在目录首次访问时是否已存在于磁盘上"""
+        return os.path.normcase(name) in self._folder(date_folder).existing
+    
+    def reserve(self, date_folder, base_name, extension=None):
+        """预留一个未被占用的名称（原名或 name_N.ext）并返回"""
+        folder = self._folder(date_folder)
+        base, orig_ext = os.path.splitext(base_name)
+        if not extension:
+            extension = orig_ext
+        with folder.lock:
+            key = os.path.normcase(base_name)
+            if key not in folder.taken:
+                folder.taken.add(key)
+                return base_name
+            counter = folder.counters.get(key, 1)
+            while True:
+                candidate = f"{base}_{counter}{extension}"
+                counter += 1
+                if os.path.normcase(candidate) not in folder.taken:
+                    break
+            run_metrics.count('name_collisions')
+            folder.counters[key] = counter
+            folder.taken.add(os.path.normcase(candidate))
+            return candidate
+
+def calculate_target_path(record, target_base_dir, stats, progress_bar=None, metadata_cache=None,
+                          directory_index=None, content_catalog=None, dry_run=False):
+    """计算文件的目标路径（填写到记录中并返回记录），同时更新统计信息
+
+    dry_run=True 时不删除重复文件，而是填写 record.duplicate_of 并返回记录（用于生成计划）。
+    """
+    filename = record.name
+    source_path = record.path
+    stats.task_started('analyze')
+    
+    try:
+        # 全局去重已确认内容相同：保留另一份，删除本文件
+        if record.duplicate_of:
+            if dry_run:
+                stats.skipped()
+                return record
+            try:
+                os.remove(source_path)
+                logger.debug(f"删除重复文件: {filename}（与 {record.duplicate_of} 相同）")
+                if content_catalog is not None:
+                    content_catalog.forget(source_path)
+            except OSError as e:
+                logger.debug(f"删除重复文件失败 {filename}: {e}")
+            stats.skipped()
+            return None
+        
+        # 计算文件日期和目标文件夹（优先使用持久化缓存，大小和mtime来自扫描结果）
+        cached = None
+        if metadata_cache is not None:
+            cache_key = MetadataCache.make_key(record)
+            cached = metadata_cache.get(cache_key)
+        if cached:
+            media_date, date_source = cached
+            run_metrics.count('date_cache_hits')
+        else:
+            media_date, date_source = resolve_media_date(source_path, record.mtime)
+            if metadata_cache is not None:
+                metadata_cache.put(cache_key, media_date, date_source)
+        record.date_source = date_source
+        run_metrics.count('date_source.' + date_source)
+        date_folder = media_date.strftime("%Y-%m-%d")
+        target_dir = os.path.join(target_base_dir, date_folder)
+        if directory_index is not None:
+            # 每个目录只创建和列出一次
+            directory_index.prepare(date_folder)
+        else:
+            with run_metrics.timer('target_dir'):
+                os.makedirs(
+                    target_dir, 
+                    exist_ok=True,
+                    mode=0o755  # 合理的默认权限
+                )
+        
+        # 获取实际扩展名
+        base, orig_ext = os.path.splitext(filename)
+        ext_lower = orig_ext.lower()
+        extension = None
         
         # 查找实际文件扩展名
         for ext in ALL_EXTENSIONS:
@@ -590,78 +2743,1236 @@ def calculate_target_path(file_info, target_base_dir, stats, progress_bar=None):
         if extension is None:
             extension = orig_ext
         
-        # 初始目标路径
-        target_path = os.path.join(target_dir, filename)
+        # 初始目标路径
+        target_path = os.path.join(target_dir, filename)
+        
+        # 文件已在正确位置（重复运行时），不能当作重复文件删除
+        if os.path.normcase(os.path.abspath(target_path)) == os.path.normcase(os.path.abspath(source_path)):
+            logger.debug(f"已在目标位置: {filename}")
+            stats.skipped()
+            return None
+        
+        # 检查目标文件是否存在
+        record.date_folder = date_folder
+        if directory_index is not None:
+            if not directory_index.on_disk(date_folder, filename):
+                new_filename = directory_index.reserve(date_folder, filename, extension)
+                record.target_path = os.path.join(target_dir, new_filename)
+                return record
+        elif not os.path.exists(target_path):
+            record.target_path = target_path
+            return record
+        
+        # 如果已存在，检查是否是相同文件（逐级比较完整内容）
+        if files_identical(record, target_path, content_catalog, read_only=dry_run):
+            if dry_run:
+                record.duplicate_of = target_path
+                stats.skipped()
+                return record
+            # 删除源文件
+            try:
+                os.remove(source_path)
+                logger.debug(f"删除重复文件: {filename}")
+                if content_catalog is not None:
+                    content_catalog.forget(source_path)
+            except:
+                pass
+            stats.skipped()
+            return None
+            
+        # 生成唯一文件名
+        if directory_index is not None:
+            record.target_path = os.path.join(target_dir, directory_index.reserve(date_folder, filename, extension))
+        else:
+            record.target_path = generate_unique_filename(target_dir, filename, extension)
+        return record
+    
+    except Exception as e:
+        logger.error(f"计算路径失败 {filename}: {str(e)}", exc_info=False)
+        stats.failed()
+        return None
+    finally:
+        stats.task_finished('analyze')
+        # 更新进度条（如果有）
+        if progress_bar:
+            progress_bar.increment()
+
+# 文件移动
+COPY_CHUNK_SIZE = 64 * 1024 * 1024  # 跨设备拷贝的单次块大小
+# 内核拷贝不可用时回退的错误码（跨文件系统、不支持的文件系统等）
+KERNEL_COPY_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF}
+
+def _kernel_copy(fsrc, fdst, size):
+    """在内核中拷贝文件内容（copy_file_range → sendfile → 大缓冲区用户态拷贝）"""
+    infd, outfd = fsrc.fileno(), fdst.fileno()
+    
+    if hasattr(os, 'copy_file_range'):
+        copied = 0
+        try:
+            while copied < size:
+                n = os.copy_file_range(infd, outfd, min(COPY_CHUNK_SIZE, size - copied))
+                if n == 0:
+                    break
+                copied += n
+            return
+        except OSError as e:
+            if copied or e.errno not in KERNEL_COPY_FALLBACK_ERRNOS:
+                raise
+    
+    if hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+        copied = 0
+        try:
+            while copied < size:
+                n = os.sendfile(outfd, infd, copied, min(COPY_CHUNK_SIZE, size - copied))
+                if n == 0:
+                    break
+                copied += n
+            return
+        except OSError as e:
+            if copied or e.errno not in KERNEL_COPY_FALLBACK_ERRNOS:
+                raise
+    
+    fsrc.seek(0)
+    shutil.copyfileobj(fsrc, fdst, COPY_CHUNK_SIZE)
+
+# 不覆盖重命名（RENAME_NOREPLACE / RENAME_EXCL）
+AT_FDCWD = -100
+RENAME_NOREPLACE = 1  # Linux renameat2
+RENAME_EXCL = 0x4     # macOS renamex_np
+# 文件系统不支持硬链接时的错误码
+LINK_UNSUPPORTED_ERRNOS = {errno.EPERM, errno.EOPNOTSUPP, errno.ENOSYS, errno.EMLINK}
+
+@lru_cache(maxsize=1)
+def _load_native_rename():
+    """加载libc的不覆盖重命名函数，返回 (函数, 标志) 或 None"""
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if sys.platform.startswith('linux'):
+            func = libc.renameat2
+            func.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+            func.restype = ctypes.c_int
+            return lambda src, dst: func(AT_FDCWD, src, AT_FDCWD, dst, RENAME_NOREPLACE)
+        if sys.platform == 'darwin':
+            func = libc.renamex_np
+            func.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_uint]
+            func.restype = ctypes.c_int
+            return lambda src, dst: func(src, dst, RENAME_EXCL)
+    except (OSError, AttributeError):
+        pass
+    return None
+
+def rename_noreplace(source_path, target_path):
+    """原子地重命名，目标已存在时抛出FileExistsError（不会覆盖）"""
+    if platform.system() == 'Windows':
+        # Windows的rename本身不覆盖已有文件
+        os.rename(source_path, target_path)
+        return
+    
+    native_rename = _load_native_rename()
+    if native_rename is not None:
+        import ctypes
+        if native_rename(os.fsencode(source_path), os.fsencode(target_path)) == 0:
+            return
+        err = ctypes.get_errno()
+        if err not in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+            raise OSError(err, os.strerror(err), target_path)
+        # 文件系统不支持该标志，回退到硬链接方式
+    
+    try:
+        # link在目标存在时失败（EEXIST），同样是原子操作
+        os.link(source_path, target_path)
+    except OSError as e:
+        if e.errno not in LINK_UNSUPPORTED_ERRNOS:
+            raise
+        # 不支持硬链接（FAT/exFAT等），只能先检查再重命名
+        if os.path.lexists(target_path):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), target_path)
+        os.rename(source_path, target_path)
+        return
+    os.unlink(source_path)
+
+def copy_file_fast(source_path, target_path):
+    """跨设备拷贝文件并保留元数据，校验大小一致后返回（失败时删除不完整的目标文件）
+
+    目标文件以O_EXCL创建，已存在时抛出FileExistsError。
+    """
+    fd = os.open(target_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        with open(source_path, 'rb') as fsrc, open(fd, 'wb') as fdst:
+            source_size = os.fstat(fsrc.fileno()).st_size
+            _kernel_copy(fsrc, fdst, source_size)
+            fdst.flush()
+            copied_size = os.fstat(fdst.fileno()).st_size
+            if copied_size != source_size:
+                raise OSError(errno.EIO, f"拷贝不完整: {copied_size}/{source_size} 字节", target_path)
+        shutil.copystat(source_path, target_path)
+    except BaseException:
+        try:
+            os.remove(target_path)
+        except OSError:
+            pass
+        raise
+
+def move_file(source_path, target_path, same_device=None):
+    """移动文件（不覆盖）：同一设备直接rename，跨设备时内核拷贝并校验后再删除源文件
+
+    目标已存在时抛出FileExistsError，"占用名称"和"移动文件"是同一个操作。
+    same_device: 扫描时已知源文件与目标根目录是否同一设备（None表示未知，先尝试rename）。
+    """
+    if same_device is not False:
+        try:
+            rename_noreplace(source_path, target_path)
+            return
+        except OSError as e:
+            # 目标子目录可能是另一个挂载点
+            if e.errno != errno.EXDEV:
+                raise
+    copy_file_fast(source_path, target_path)
+    os.unlink(source_path)
+
+def process_file(record, stats, progress_bar=None, target_dev=None, content_catalog=None, journal=None):
+    """安全地处理单个文件（移动操作），更新统计信息"""
+    if record is None:
+        return False
+        
+    source_path = record.path
+    target_path = record.target_path
+    date_folder = record.date_folder
+    filename = record.name
+    stats.task_started('move')
+    
+    try:
+        # 移动文件（target_dev为目标根目录所在设备）
+        # 目标名称被占用（已有文件或其他线程刚移入）时依次尝试下一个候选名称
+        same_device = None if target_dev is None else record.dev == target_dev
+        target_dir = os.path.dirname(target_path)
+        with run_metrics.timer('move'):
+            for new_filename in iter_unique_filenames(os.path.basename(target_path)):
+                try:
+                    move_file(source_path, os.path.join(target_dir, new_filename), same_device)
+                    break
+                except FileExistsError:
+                    run_metrics.count('collision_retries')
+                    continue
+            else:
+                raise FileExistsError(errno.EEXIST, "无法找到可用的文件名", target_path)
+        record.target_path = os.path.join(target_dir, new_filename)
+        if record.content_hash is not None:
+            # 跨设备拷贝时扩展属性不一定随文件复制，移动后确保目标文件带有哈希
+            hash_xattrs.write(record.target_path, target_dev, record.content_hash, record.size, record.mtime_ns)
+        if content_catalog is not None:
+            content_catalog.record_move(record, source_path)
+        if journal is not None:
+            journal.completed(record)
+        logger.info(f"✓ 已移动: {filename} -> {date_folder}/{new_filename}", extra=PER_FILE)
+        stats.moved(record.size)
+        return True
+    except FileNotFoundError as e:
+        if os.path.exists(source_path):
+            # 源文件还在：目标目录不存在或被其他线程删除，按移动失败计数
+            logger.error(f"✗ 移动失败: {filename} - 错误: {str(e)}", exc_info=False)
+            stats.failed()
+            return False
+        # 扫描后源文件被删除或移走（不再提前检查，省去一次stat）
+        logger.warning(f"源文件已消失: {filename} (跳过)")
+        stats.skipped()
+        return False
+    except Exception as e:
+        logger.error(f"✗ 移动失败: {filename} - 错误: {str(e)}", exc_info=False)
+        stats.failed()
+        return False
+    finally:
+        stats.task_finished('move')
+        # 更新进度条（如果有）
+        if progress_bar:
+            progress_bar.increment()
+
+# 预写式移动日志（中断后 --resume 继续）
+JOURNAL_FILENAME = '.organize_journal.jsonl'
+JOURNAL_BATCH_SIZE = 256       # 完成记录攒够一批再写入
+JOURNAL_FSYNC_INTERVAL = 2.0   # fsync最短间隔（秒）
+
+def read_jsonl(path):
+    """逐行读取JSON Lines文件（跳过中断时写了一半的行）"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+class MoveJournal:
+    """移动日志（JSON Lines，保存在目标根目录）
+
+    移动开始前写入全部计划并fsync，之后每完成一个移动追加一条完成记录（按批写入、定期fsync）。
+    全部完成后删除日志；中断时保留，--resume 跳过已完成的移动并核对未确认的移动。
+    """
+    def __init__(self, path, append=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.last_sync = time.monotonic()
+        self.file = open(path, 'a' if append else 'w', encoding='utf-8')
+
+    def _append_locked(self, entry):
+        self.buffer.append(json.dumps(entry, ensure_ascii=False))
+
+    def _flush_locked(self, sync=False):
+        if self.buffer:
+            self.file.write('\n'.join(self.buffer) + '\n')
+            self.buffer.clear()
+        self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+            self.last_sync = time.monotonic()
+
+    def start(self, source_dir, target_base_dir, resumed=False):
+        """写入运行头（记录开始时间，用于识别中断时未写完的拷贝）"""
+        with self.lock:
+            self._append_locked({'op': 'resume' if resumed else 'start', 'time_ns': time.time_ns(),
+                                 'source': os.path.abspath(source_dir) if source_dir else None,
+                                 'target': os.path.abspath(target_base_dir)})
+
+    def plan(self, records):
+        """写入全部移动计划，落盘后才开始移动"""
+        with self.lock:
+            for record in records:
+                entry = record.to_entry()
+                entry['op'] = 'plan'
+                self._append_locked(entry)
+                if len(self.buffer) >= JOURNAL_BATCH_SIZE:
+                    self._flush_locked()
+            self._flush_locked(sync=True)
+
+    def completed(self, record):
+        """记录一个已完成的移动"""
+        with self.lock:
+            self._append_locked({'op': 'done', 'src': record.path, 'dst': record.target_path})
+            if len(self.buffer) >= JOURNAL_BATCH_SIZE:
+                self._flush_locked(time.monotonic() - self.last_sync >= JOURNAL_FSYNC_INTERVAL)
+
+    def close(self, finished=False):
+        """写入剩余记录；全部完成时删除日志"""
+        with self.lock:
+            try:
+                self._flush_locked(sync=True)
+            finally:
+                self.file.close()
+        if finished:
+            os.remove(self.path)
+
+    @staticmethod
+    def load_pending(path):
+        """返回 (首次开始时间, 未完成的记录列表, 已完成数量)，分两遍流式读取"""
+        started_ns = None
+        done = set()
+        for entry in read_jsonl(path):
+            op = entry.get('op')
+            if op == 'done':
+                done.add(entry['src'])
+            elif op == 'start' and started_ns is None:
+                started_ns = entry['time_ns']
+        pending = [FileRecord.from_entry(entry) for entry in read_jsonl(path)
+                   if entry.get('op') == 'plan' and entry['src'] not in done]
+        return started_ns or 0, pending, len(done)
+
+def open_move_journal(target_base_dir, append=False):
+    """打开移动日志，失败时返回None（不影响整理，但无法恢复）"""
+    journal_path = os.path.join(target_base_dir, JOURNAL_FILENAME)
+    try:
+        return MoveJournal(journal_path, append)
+    except OSError as e:
+        logger.warning(f"无法写入移动日志 {journal_path}: {e}（本次中断后无法恢复）")
+        return None
+
+def reconcile_pending_move(record, started_ns, content_catalog=None):
+    """核对日志中未确认完成的移动，返回 'done'、'gone' 或 'redo'"""
+    try:
+        st = os.stat(record.path)
+    except FileNotFoundError:
+        # 源文件已不在：移动已完成但完成记录未落盘，或文件被外部删除
+        if os.path.exists(record.target_path):
+            if content_catalog is not None:
+                content_catalog.record_move(record, record.path)
+            return 'done'
+        return 'gone'
+    if st.st_size != record.size or st.st_mtime_ns != record.mtime_ns:
+        # 计划之后源文件有变化，已知哈希失效
+        record.size, record.mtime_ns = st.st_size, st.st_mtime_ns
+        record.content_hash = None
+    try:
+        target_size = os.path.getsize(record.target_path)
+    except FileNotFoundError:
+        return 'redo'
+    if target_size == record.size and files_identical(record, record.target_path, content_catalog):
+        # 拷贝已完成，但中断前没来得及删除源文件
+        os.remove(record.path)
+        if content_catalog is not None:
+            content_catalog.record_move(record, record.path)
+        return 'done'
+    if target_size < record.size and os.stat(record.target_path).st_mtime_ns >= started_ns:
+        # 中断时未写完的拷贝（完成后才会复制时间戳，所以mtime晚于本次运行开始）
+        logger.debug(f"删除未完成的拷贝: {record.target_path}")
+        os.remove(record.target_path)
+    return 'redo'
+
+# 有界队列（扫描和流式处理共用）
+STREAM_QUEUE_SIZE = 1024  # 每个阶段队列的容量（限制内存占用）
+
+def _queue_put(q, item, stop_event):
+    """向有界队列放入数据，停止时放弃（避免下游退出后永久阻塞）"""
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+# 并行目录扫描
+SCAN_WORKERS = 8  # 默认扫描线程数（网络存储上每次目录读取都有往返延迟）
+SKIPPABLE_DIRS = ('@eaDir', '__MACOSX', '.DS_Store', 'Thumbs.db')  # 以及所有以.开头的目录
+
+def _is_skippable_dir(name):
+    """系统目录（.git、@eaDir等）不进入"""
+    return name.startswith('.') or name in SKIPPABLE_DIRS
+
+def _scan_directory(path, skipped_dirs):
+    """读取单个目录，返回 (媒体文件记录列表, 子目录列表)"""
+    files = []
+    subdirs = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if _is_skippable_dir(entry.name):
+                        logger.debug(f"跳过目录: {entry.path}")
+                        if skipped_dirs is not None:
+                            skipped_dirs.append(entry.path)
+                    else:
+                        subdirs.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in EXT_MAP and entry.is_file():
+                    # DirEntry.stat() 复用目录读取的结果（Windows上无需额外系统调用）
+                    files.append(FileRecord(entry.path, entry.name, entry.stat()))
+            except OSError as e:
+                logger.warning(f"无法访问文件: {entry.path}: {e}")
+    return files, subdirs
+
+def iter_media_files(source_dir, skipped_dirs=None, workers=SCAN_WORKERS, snapshot_cache=None):
+    """并行扫描媒体文件，逐个返回 FileRecord
+
+    多个线程共享一个目录队列，每个线程读取一个目录后把子目录放回队列，
+    扫描结果按目录批量返回给调用方。提供目录快照缓存时，未变化的目录直接使用缓存的列表。
+    """
+    dir_queue = queue.Queue()
+    result_queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+    stop_event = threading.Event()
+    pending_lock = threading.Lock()
+    pending = [1]  # 已入队但尚未读取完成的目录数
+    
+    def finish_directory():
+        with pending_lock:
+            pending[0] -= 1
+            done = pending[0] == 0
+        if done:
+            # 全部目录读取完成：通知调用方和所有扫描线程
+            _queue_put(result_queue, None, stop_event)
+            for _ in range(workers):
+                dir_queue.put(None)
+    
+    def scan_worker():
+        while not stop_event.is_set():
+            path = dir_queue.get()
+            if path is None:
+                return
+            try:
+                with run_metrics.timer('scan.directory'):
+                    if snapshot_cache is not None:
+                        files, subdirs = snapshot_cache.scan(path, skipped_dirs)
+                    else:
+                        files, subdirs = _scan_directory(path, skipped_dirs)
+            except OSError as e:
+                logger.warning(f"无法读取目录: {path}: {e}")
+                files, subdirs = [], []
+            run_metrics.count('files_scanned', len(files))
+            if subdirs:
+                with pending_lock:
+                    pending[0] += len(subdirs)
+                for subdir in subdirs:
+                    dir_queue.put(subdir)
+            if files and not _queue_put(result_queue, files, stop_event):
+                return
+            finish_directory()
+    
+    dir_queue.put(source_dir)
+    threads = [threading.Thread(target=scan_worker, name=f"scan-{i}", daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            batch = result_queue.get()
+            if batch is None:
+                return
+            yield from batch
+    finally:
+        # 调用方提前结束（中断）时让扫描线程退出
+        stop_event.set()
+        for _ in range(workers):
+            dir_queue.put(None)
+
+# 进程池模式（日期分析阶段）
+ANALYSIS_BATCH_SIZE = 256  # 每批发送给工作进程的文件数上限
+
+class BatchDateCache:
+    """工作进程内使用的缓存（由主进程按批次预热，新结果随批次结果返回）"""
+    def __init__(self, seed):
+        self.entries = seed
+        self.new_entries = []
+        
+    def get(self, key):
+        return self.entries.get(key)
+        
+    def put(self, key, media_date, source):
+        self.entries[key] = (media_date, source)
+        self.new_entries.append((key, media_date, source))
+
+_worker_directory_indexes = {}  # 工作进程内的目标目录索引（跨批次复用）
+
+def _init_analysis_worker(verbose, collect_metrics=False, profile=False):
+    """工作进程初始化：同步日志级别、指标和剖析开关，并预热进程级缓存"""
+    log_pipeline.detach()  # 否则日志进入无人读取的队列
+    setup_logging(verbose)
+    run_metrics.reset()  # fork时继承了主进程已记录的指标
+    run_metrics.enabled = collect_metrics
+    # 工作进程只剖析，不写文件也不采样（结果随批次返回）
+    phase_profiler.sampler = None
+    phase_profiler.drain()
+    phase_profiler.collected = {}
+    phase_profiler.enabled = profile
+    _ffprobe_available()
+
+def analyze_batch(batch, target_base_dir, seed, dry_run=False):
+    """在工作进程中计算一批文件的目标路径，返回 (任务列表, 统计计数, 新缓存结果, 指标, 剖析结果)"""
+    stats = ProcessingStats(total_files=len(batch))
+    cache = BatchDateCache(seed)
+    # 各进程的名称预留互不可见，跨进程的同名冲突由移动阶段的原子重命名解决
+    directory_index = _worker_directory_indexes.get((target_base_dir, dry_run))
+    if directory_index is None:
+        directory_index = TargetDirectoryIndex(target_base_dir, create=not dry_run)
+        _worker_directory_indexes[(target_base_dir, dry_run)] = directory_index
+    tasks = []
+    analyze = phase_profiler.wrap('analyze', calculate_target_path)
+    for record in batch:
+        task = analyze(record, target_base_dir, stats, metadata_cache=cache,
+                       directory_index=directory_index, dry_run=dry_run)
+        if task:
+            tasks.append(task)
+    return (tasks, stats.get_stats(), cache.new_entries,
+            run_metrics.drain() if run_metrics.enabled else None,
+            phase_profiler.drain() if phase_profiler.enabled else None)
+
+def compute_targets_in_processes(media_files, target_base_dir, stats, progress_bar,
+                                 metadata_cache, worker_count, verbose=False, dry_run=False):
+    """使用进程池按批次计算目标路径，主进程汇总统计和缓存（中断时返回None）"""
+    batch_size = max(1, min(ANALYSIS_BATCH_SIZE, math.ceil(len(media_files) / (worker_count * 4))))
+    compute_tasks = []
+    
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=worker_count,
+        initializer=_init_analysis_worker,
+        initargs=(verbose, run_metrics.enabled, phase_profiler.enabled)
+    )
+    try:
+        future_to_size = {}
+        for i in range(0, len(media_files), batch_size):
+            batch = media_files[i:i + batch_size]
+            seed = {}
+            if metadata_cache is not None:
+                for record in batch:
+                    key = MetadataCache.make_key(record)
+                    entry = metadata_cache.get(key)
+                    if entry:
+                        seed[key] = entry
+            future = executor.submit(analyze_batch, batch, target_base_dir, seed, dry_run)
+            future_to_size[future] = len(batch)
+            stats.task_started('analyze', len(batch))
+        
+        for future in concurrent.futures.as_completed(future_to_size):
+            stats.task_finished('analyze', future_to_size[future])
+            try:
+                tasks, counts, new_entries, metrics, profile = future.result()
+                compute_tasks.extend(tasks)
+                stats.merge(counts)
+                if metrics is not None:
+                    run_metrics.merge(metrics)
+                if profile is not None:
+                    phase_profiler.merge(profile)
+                if metadata_cache is not None:
+                    for key, media_date, source in new_entries:
+                        metadata_cache.put(key, media_date, source)
+            except Exception as e:
+                logger.error(f"批次分析失败: {str(e)}")
+                stats.merge({'moved': 0, 'skipped': 0, 'failed': future_to_size[future],
+                             'processed': future_to_size[future]})
+            if progress_bar:
+                progress_bar.update(future_to_size[future])
+    except KeyboardInterrupt:
+        logger.warning("用户中止计算任务!")
+        executor.shutdown(wait=False, cancel_futures=True)
+        return None
+    executor.shutdown()
+    return compute_tasks
+
+def open_metadata_cache(target_base_dir, rebuild=False, max_entries=CACHE_MAX_ENTRIES):
+    """打开目标根目录下的元数据缓存（失败时返回None，不影响整理）"""
+    db_path = os.path.join(target_base_dir, CACHE_FILENAME)
+    try:
+        cache = MetadataCache(db_path, max_entries=max_entries, rebuild=rebuild)
+        logger.info(f"🗄️ 元数据缓存: {db_path}{' (重建)' if rebuild else ''}")
+        return cache
+    except sqlite3.Error as e:
+        logger.warning(f"无法打开元数据缓存 {db_path}: {e}（本次不使用缓存）")
+        return None
+
+def open_snapshot_cache(target_base_dir, rebuild=False, full_rescan=False):
+    """打开目录快照缓存，失败时返回None（完整扫描）"""
+    db_path = os.path.join(target_base_dir, CACHE_FILENAME)
+    try:
+        return DirectorySnapshotCache(db_path, rebuild, full_rescan)
+    except sqlite3.Error as e:
+        logger.warning(f"无法打开目录快照缓存 {db_path}: {e}（本次完整扫描）")
+        return None
+
+def close_snapshot_cache(snapshot_cache, scanned_root=None):
+    """写回并关闭目录快照缓存"""
+    if snapshot_cache is None:
+        return
+    try:
+        snapshot_cache.close(scanned_root)
+    except sqlite3.Error as e:
+        logger.warning(f"目录快照写入失败: {e}")
+
+def open_content_catalog(target_base_dir):
+    """打开目标库内容目录，失败时返回None（不影响整理）"""
+    db_path = os.path.join(target_base_dir, CATALOG_FILENAME)
+    try:
+        return ContentCatalog(db_path, target_base_dir)
+    except sqlite3.Error as e:
+        logger.warning(f"无法打开内容目录 {db_path}: {e}（本次不使用）")
+        return None
+
+def close_content_catalog(content_catalog):
+    """提交并关闭内容目录"""
+    if content_catalog is None:
+        return
+    try:
+        content_catalog.close()
+    except sqlite3.Error as e:
+        logger.warning(f"内容目录写入失败: {e}")
+
+# 移动计划（--plan 生成，审阅后 --apply 执行）
+class PlanWriter:
+    """流式写出移动计划（JSON Lines：首行为计划头，之后每个文件一行）"""
+    def __init__(self, path, source_dir, target_base_dir):
+        self.path = path
+        self.lock = threading.Lock()
+        self.counts = {'move': 0, 'duplicate': 0}
+        self.total_bytes = 0
+        self.file = open(path, 'w', encoding='utf-8')
+        self.file.write(json.dumps({'source': os.path.abspath(source_dir), 'target': os.path.abspath(target_base_dir),
+                                   'created': datetime.datetime.now().isoformat(timespec='seconds')},
+                                  ensure_ascii=False) + '\n')
+
+    def write(self, record, keeper_target=None):
+        """写入一个文件的计划（移动或重复；keeper_target为保留文件本身的计划移动位置）"""
+        entry = record.to_entry()
+        entry['src'] = os.path.abspath(record.path)
+        if record.duplicate_of:
+            entry['verdict'] = 'duplicate'
+            entry['dst'] = None
+            entry['duplicate_of'] = os.path.abspath(record.duplicate_of)
+            entry['duplicate_target'] = os.path.abspath(keeper_target) if keeper_target else None
+        else:
+            entry['verdict'] = 'move'
+            entry['dst'] = os.path.abspath(record.target_path)
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.counts[entry['verdict']] += 1
+            if entry['verdict'] == 'move':
+                self.total_bytes += record.size
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def read_plan_target(plan_path):
+    """读取计划头中的目标根目录"""
+    for entry in read_jsonl(plan_path):
+        return entry.get('target') if 'src' not in entry else None
+    return None
+
+def apply_plan(plan_path, global_stats, io_workers, target_dev=None, content_catalog=None):
+    """执行计划文件：流式读取，移动阶段并行执行，不重新分析日期，返回移动的总字节数"""
+    task_queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+    stop_event = threading.Event()
+    dirs_lock = threading.Lock()
+    prepared_dirs = set()
+    total_bytes = 0
+    move = phase_profiler.wrap('move', process_file)
+    
+    with FixedProgressBar(total=0, desc="执行计划", position='bottom') as bar:
+        
+        def remove_duplicate(record, keeper_target):
+            # 执行前再次确认内容相同，审阅后文件有变化时保留
+            keeper = record.duplicate_of
+            if keeper_target and not os.path.exists(keeper):
+                keeper = keeper_target  # 保留的文件已按计划移走
+            try:
+                st = os.stat(record.path)
+                keeper_st = os.stat(keeper)
+                unchanged = st.st_size == record.size and st.st_mtime_ns == record.mtime_ns
+                # 符号链接或与保留文件是同一个文件（硬链接）时删除会丢失数据
+                same_file = (st.st_dev, st.st_ino) == (keeper_st.st_dev, keeper_st.st_ino)
+                if unchanged and not same_file and not os.path.islink(record.path) and \
+                        files_identical(record, keeper, content_catalog):
+                    os.remove(record.path)
+                    logger.debug(f"删除重复文件: {record.name}（与 {keeper} 相同）")
+                    if content_catalog is not None:
+                        content_catalog.forget(record.path)
+                else:
+                    logger.warning(f"内容已不同，保留: {record.name}")
+                global_stats.skipped()
+            except FileNotFoundError:
+                logger.warning(f"文件已消失: {record.name} (跳过)")
+                global_stats.skipped()
+            except OSError as e:
+                logger.error(f"✗ 删除重复文件失败: {record.name} - 错误: {str(e)}")
+                global_stats.failed()
+            finally:
+                bar.increment()
+        
+        def mover():
+            while not stop_event.is_set():
+                try:
+                    record = task_queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if record is None:
+                    return
+                record, keeper_target = record
+                if record.duplicate_of:
+                    remove_duplicate(record, keeper_target)
+                    continue
+                # 生成计划时不创建目录，每个目录在首次移入时创建一次
+                # （持锁创建：其他线程看到目录已登记时目录一定已经存在）
+                target_dir = os.path.dirname(record.target_path)
+                with dirs_lock:
+                    if target_dir not in prepared_dirs:
+                        try:
+                            os.makedirs(target_dir, exist_ok=True, mode=0o755)
+                        except OSError as e:
+                            logger.debug(f"创建目录失败 {target_dir}: {e}")
+                        prepared_dirs.add(target_dir)
+                move(record, global_stats, bar, target_dev, content_catalog)
+        
+        move_threads = [threading.Thread(target=mover, name=f"mover-{i}", daemon=True)
+                        for i in range(io_workers)]
+        for thread in move_threads:
+            thread.start()
         
-        # 检查目标文件是否存在
-        if not os.path.exists(target_path):
-            return (source_path, target_path, date_folder, file_size)
+        try:
+            for entry in read_jsonl(plan_path):
+                if 'src' not in entry:
+                    continue  # 计划头
+                verdict = entry.get('verdict', 'move')
+                if verdict not in ('move', 'duplicate'):
+                    logger.warning(f"未知的计划类型 {verdict!r}: {entry['src']} (跳过)")
+                    continue
+                record = FileRecord.from_entry(entry)
+                if verdict == 'move':
+                    record.duplicate_of = None
+                    total_bytes += record.size
+                elif not record.duplicate_of:
+                    continue
+                global_stats.add_total()
+                bar.add_total()
+                task_queue.put((record, entry.get('duplicate_target')))
+        except KeyboardInterrupt:
+            logger.warning("用户中止执行计划!")
+            stop_event.set()
+        finally:
+            if not stop_event.is_set():
+                for _ in move_threads:
+                    task_queue.put(None)
+            for thread in move_threads:
+                thread.join()
+    return total_bytes
+
+# 流式处理模式（扫描→分析→移动）
+def stream_organize_media(source_dir, target_base_dir, global_stats, metadata_cache,
+                          worker_count, io_workers, scan_workers=SCAN_WORKERS, target_dev=None,
+                          content_catalog=None):
+    """流式整理：扫描、日期分析、移动三个阶段通过有界队列同时进行，返回计划移动的总字节数"""
+    directory_index = TargetDirectoryIndex(target_base_dir)
+    analysis_queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+    move_queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+    stop_event = threading.Event()
+    counters_lock = threading.Lock()
+    counters = {'scanned': 0, 'bytes': 0}
+    skipped_dirs = []
+    analyze = phase_profiler.wrap('analyze', calculate_target_path)
+    move = phase_profiler.wrap('move', process_file)
+    
+    with FixedProgressBar(total=0, desc="流式整理", position='bottom') as bar:
         
-        # 如果已存在，检查是否是相同文件
-        if file_hash(source_path) == file_hash(target_path):
-            # 删除源文件
+        def scanner():
             try:
-                os.remove(source_path)
-                logger.debug(f"删除重复文件: {filename}")
-            except:
-                pass
-            stats.skipped()
-            return None
-            
-        # 生成唯一文件名
-        target_path = generate_unique_filename(target_dir, filename, extension)
+                for record in iter_media_files(source_dir, skipped_dirs, scan_workers):
+                    global_stats.add_total()
+                    bar.add_total()
+                    with counters_lock:
+                        counters['scanned'] += 1
+                    if not _queue_put(analysis_queue, record, stop_event):
+                        return
+            except Exception as e:
+                logger.error(f"扫描失败: {str(e)}")
+            finally:
+                for _ in range(worker_count):
+                    _queue_put(analysis_queue, None, stop_event)
+        
+        def analyzer():
+            while not stop_event.is_set():
+                record = analysis_queue.get()
+                if record is None:
+                    return
+                task = analyze(record, target_base_dir, global_stats, None, metadata_cache,
+                               directory_index, content_catalog)
+                if task:
+                    with counters_lock:
+                        counters['bytes'] += task.size
+                    if not _queue_put(move_queue, task, stop_event):
+                        return
+                else:
+                    bar.increment()
         
-        return (source_path, target_path, date_folder, file_size)
+        def mover():
+            while not stop_event.is_set():
+                task = move_queue.get()
+                if task is None:
+                    return
+                move(task, global_stats, bar, target_dev, content_catalog)
+        
+        scan_thread = threading.Thread(target=scanner, name="scanner", daemon=True)
+        analysis_threads = [threading.Thread(target=analyzer, name=f"analyzer-{i}", daemon=True)
+                            for i in range(worker_count)]
+        move_threads = [threading.Thread(target=mover, name=f"mover-{i}", daemon=True)
+                        for i in range(io_workers)]
+        for thread in [scan_thread] + analysis_threads + move_threads:
+            thread.start()
+        
+        try:
+            # 分析线程全部结束后通知移动线程退出
+            stage_threads = [([scan_thread] + analysis_threads, move_queue, io_workers), (move_threads, None, 0)]
+            for threads, next_queue, sentinel_count in stage_threads:
+                while any(t.is_alive() for t in threads):
+                    for t in threads:
+                        t.join(timeout=0.5)
+                    with counters_lock:
+                        scanned = counters['scanned']
+                    bar.extra_text = (f"已扫描: {scanned} | 队列: 分析 {analysis_queue.qsize()}"
+                                      f" / 移动 {move_queue.qsize()}")
+                    global_stats.log_progress()
+                if next_queue is not None:
+                    for _ in range(sentinel_count):
+                        _queue_put(next_queue, None, stop_event)
+        except KeyboardInterrupt:
+            logger.warning("用户中止流式整理!")
+            stop_event.set()
+            raise
     
-    except Exception as e:
-        logger.error(f"计算路径失败 {filename}: {str(e)}", exc_info=False)
-        stats.failed()
-        return None
+    if skipped_dirs:
+        logger.debug(f"⚠️ 跳过 {len(skipped_dirs)} 个系统目录")
+    return counters['bytes']
+
+# 监视模式（--watch）
+WATCH_SETTLE_SECONDS = 5.0   # 文件大小和mtime保持不变多久后才处理（等待上传完成）
+WATCH_POLL_INTERVAL = 10.0   # 不支持inotify时轮询目录的间隔（秒）
+WATCH_BATCH_SIZE = 64        # 每批处理的文件数上限
+
+# inotify事件标志（linux/inotify.h）
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len
+
+class InotifyWatcher:
+    """基于inotify的目录监视（ctypes调用libc，仅Linux），事件为 (类型, 路径)"""
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    
+    def __init__(self):
+        import ctypes
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, "inotify仅支持Linux")
+        libc = ctypes.CDLL(None, use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._add_watch.restype = ctypes.c_int
+        self._get_errno = ctypes.get_errno
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.dirs = {}  # wd -> 目录路径
+    
+    def add(self, path):
+        wd = self._add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            err = self._get_errno()
+            raise OSError(err, os.strerror(err), path)
+        self.dirs[wd] = path
+    
+    def read(self, timeout):
+        """等待事件，返回 [('file'|'dir'|'rescan', 路径)]"""
+        import select
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            wd, mask, _cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b'\0')
+            offset += INOTIFY_EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出，可能漏掉了文件，需要重新扫描
+                events.append(('rescan', None))
+                continue
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+            base = self.dirs.get(wd)
+            if base is None or not name:
+                continue
+            events.append(('dir' if mask & IN_ISDIR else 'file', os.path.join(base, os.fsdecode(name))))
+        return events
+    
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """不支持inotify时的轮询监视：每次只stat目录，mtime变化的目录才重新读取"""
+    def __init__(self, interval=WATCH_POLL_INTERVAL):
+        self.interval = interval
+        self.dirs = {}  # 目录路径 -> mtime_ns
+        self.next_poll = time.monotonic() + interval
+    
+    def add(self, path):
+        self.dirs[path] = os.stat(path).st_mtime_ns
+    
+    def read(self, timeout):
+        now = time.monotonic()
+        if now < self.next_poll:
+            time.sleep(min(timeout, self.next_poll - now))
+            return []
+        self.next_poll = now + self.interval
+        events = []
+        for path, mtime_ns in list(self.dirs.items()):
+            try:
+                st = os.stat(path)
+                if st.st_mtime_ns == mtime_ns:
+                    continue
+                self.dirs[path] = st.st_mtime_ns
+                files, subdirs = _scan_directory(path, None)
+            except OSError:
+                self.dirs.pop(path, None)
+                continue
+            events.extend(('file', record.path) for record in files)
+            events.extend(('dir', subdir) for subdir in subdirs if subdir not in self.dirs)
+        return events
+    
+    def close(self):
+        pass
+
+def watch_media(source_dir, target_base_dir, max_workers, target_dev=None, metadata_cache=None,
+                content_catalog=None, settle_seconds=WATCH_SETTLE_SECONDS):
+    """持续监视源目录，新文件稳定后小批量整理，返回 (统计, 移动的总字节数)（Ctrl-C退出）
+
+    线程池、元数据缓存、目标目录索引和内容目录在整个监视期间保持，
+    稳定状态下的开销只与新文件数量有关，与目录树大小无关。
+    """
+    try:
+        watcher = InotifyWatcher()
+        logger.info(f"👀 监视模式 (inotify) @ {os.path.abspath(source_dir)}")
+    except OSError as e:
+        watcher = PollingWatcher()
+        logger.info(f"👀 监视模式 (轮询, 每{WATCH_POLL_INTERVAL:.0f}秒) @ {os.path.abspath(source_dir)}: {e}")
+    
+    target_root = os.path.normcase(os.path.abspath(target_base_dir))
+    directory_index = TargetDirectoryIndex(target_base_dir)
+    global_stats = ProcessingStats(total_files=0)
+    metrics_exporter.attach(global_stats)
+    pending = {}   # 路径 -> 上次观察到的 (大小, mtime_ns, 观察时间)，None表示尚未观察
+    handled = {}   # 已处理但仍留在源目录的文件（跳过或失败） -> (大小, mtime_ns)，未变化时不再处理
+    watch_limit_warned = [False]
+    moved_bytes = [0]
+    analyze = phase_profiler.wrap('analyze', calculate_target_path)
+    move = phase_profiler.wrap('move', process_file)
+    
+    def is_target_folder(path):
+        # 目标目录在源目录内时，不监视已整理的日期文件夹
+        parent, name = os.path.split(os.path.abspath(path))
+        return os.path.normcase(parent) == target_root and DATE_FOLDER_RE.match(name) is not None
+    
+    def add_tree(path):
+        """监视目录及其子目录，并把其中已有的媒体文件加入待处理"""
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            if is_target_folder(current):
+                continue
+            try:
+                watcher.add(current)
+                files, subdirs = _scan_directory(current, None)
+            except OSError as e:
+                if e.errno == errno.ENOSPC and not watch_limit_warned[0]:
+                    watch_limit_warned[0] = True
+                    logger.warning("inotify监视数量达到上限（fs.inotify.max_user_watches），部分目录不会被监视")
+                else:
+                    logger.debug(f"无法监视目录 {current}: {e}")
+                continue
+            for record in files:
+                pending.setdefault(record.path, None)
+            stack.extend(subdirs)
+    
+    def collect_ready(now):
+        """返回大小和mtime已稳定的文件记录"""
+        ready = []
+        for path, seen in list(pending.items()):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                del pending[path]
+                continue
+            except OSError as e:
+                logger.debug(f"无法访问文件 {path}: {e}")
+                continue
+            if handled.get(path) == (st.st_size, st.st_mtime_ns):
+                del pending[path]
+                continue
+            if seen is None or seen[:2] != (st.st_size, st.st_mtime_ns):
+                pending[path] = (st.st_size, st.st_mtime_ns, now)
+            elif now - seen[2] >= settle_seconds:
+                del pending[path]
+                ready.append(FileRecord(path, os.path.basename(path), st))
+        return ready
+    
+    def organize_batch(records, pool):
+        global_stats.add_total(len(records))
+        run_metrics.count('files_scanned', len(records))
+        before = global_stats.get_stats()
+        tasks = pool.map(lambda record: analyze(record, target_base_dir, global_stats, None,
+                                                metadata_cache, directory_index, content_catalog),
+                         records)
+        moves = [task for task in tasks if task]
+        moved_bytes[0] += sum(task.size for task in moves)
+        list(pool.map(lambda task: move(task, global_stats, None, target_dev, content_catalog), moves))
+        for record in records:
+            try:
+                st = os.stat(record.path)
+                handled[record.path] = (st.st_size, st.st_mtime_ns)
+            except FileNotFoundError:
+                handled.pop(record.path, None)
+        if metadata_cache is not None:
+            metadata_cache.flush()
+        if content_catalog is not None:
+            content_catalog.flush()
+        after = global_stats.get_stats()
+        logger.info(
+            f"📥 处理 {len(records)} 个新文件: 移动 {after['moved'] - before['moved']}, "
+            f"跳过 {after['skipped'] - before['skipped']}, 失败 {after['failed'] - before['failed']}"
+        )
+    
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or 8) as pool:
+            add_tree(source_dir)
+            while True:
+                for kind, path in watcher.read(timeout=1.0):
+                    if kind == 'rescan':
+                        logger.warning("inotify事件溢出，重新扫描源目录")
+                        add_tree(source_dir)
+                    elif kind == 'dir':
+                        if not _is_skippable_dir(os.path.basename(path)):
+                            add_tree(path)
+                    elif os.path.splitext(path)[1].lower() in EXT_MAP:
+                        pending.setdefault(path, None)
+                
+                ready = collect_ready(time.monotonic())
+                for i in range(0, len(ready), WATCH_BATCH_SIZE):
+                    organize_batch(ready[i:i + WATCH_BATCH_SIZE], pool)
+    except KeyboardInterrupt:
+        logger.info("👋 退出监视模式")
     finally:
-        # 更新进度条（如果有）
-        if progress_bar:
-            progress_bar.increment()
+        watcher.close()
+    return global_stats, moved_bytes[0]
 
-def process_file(file_task, stats, progress_bar=None):
-    """安全地处理单个文件（移动操作），更新统计信息"""
-    if file_task is None:
-        return False
-        
-    source_path, target_path, date_folder, file_size = file_task
-    filename = os.path.basename(source_path)
+def log_final_report(global_stats, total_bytes, target_base_dir):
+    """输出最终性能报告"""
+    run_metrics.set_totals(global_stats, total_bytes)
+    stats = global_stats.get_stats()
+    elapsed = stats['elapsed']
+    
+    # 计算各种速率
+    file_rate = stats['processed'] / elapsed if elapsed > 0 else 0
+    mb_rate = total_bytes / (1024 * 1024) / elapsed if elapsed > 0 else 0
+    success_rate = (stats['moved'] / stats['processed']) * 100 if stats['processed'] > 0 else 0
+    
+    # 生成最终报告
+    summary = [
+        "=" * 70,
+        f"⭐ {Colors.OKGREEN}整理完成!{Colors.ENDC}",
+        "=" * 70,
+        f"📊 {Colors.PROGRESS_TEXT}统计数据:{Colors.ENDC}",
+        f"  总耗时: {Colors.PROGRESS_VALUE}{elapsed:.1f}秒{Colors.ENDC}",
+        f"  处理文件: {Colors.PROGRESS_VALUE}{stats['processed']}/{stats['total']}{Colors.ENDC} ({success_rate:.1f}% 成功率)",
+        f"  成功移动: {Colors.OKGREEN}{stats['moved']}{Colors.ENDC}个文件",
+        f"  跳过/重复: {Colors.WARNING}{stats['skipped']}{Colors.ENDC}个文件",
+        f"  处理失败: {Colors.FAIL}{stats['failed']}{Colors.ENDC}个文件",
+        "",
+        f"⚡ {Colors.PROGRESS_TEXT}性能指标:{Colors.ENDC}",
+        f"  速度: {Colors.PROGRESS_VALUE}{file_rate:.1f}文件/秒 | {mb_rate:.1f} MB/秒{Colors.ENDC}",
+        "",
+        f"🗂️ {Colors.PROGRESS_TEXT}目标位置:{Colors.ENDC} {Colors.PROGRESS_VALUE}{os.path.abspath(target_base_dir)}{Colors.ENDC}",
+        "=" * 70
+    ]
     
+    for line in summary:
+        logger.info(line)
+
+def close_metadata_cache(metadata_cache):
+    """写回并关闭元数据缓存"""
+    if metadata_cache is None:
+        return
     try:
-        # 双重检查源文件
-        if not os.path.exists(source_path):
-            logger.warning(f"源文件已消失: {filename} (跳过)")
-            stats.skipped()
-            return False
+        metadata_cache.close()
+    except sqlite3.Error as e:
+        logger.warning(f"缓存写入失败: {e}")
+
+def run_move_phase(valid_tasks, global_stats, io_workers, target_dev=None, content_catalog=None, journal=None):
+    """并行移动全部任务，返回移动的总字节数"""
+    # 移动进度条
+    total_bytes = sum(t.size for t in valid_tasks)
+    desc_text = f"移动文件 ({total_bytes/1024/1024:.1f} MB)"
+    start_move = time.time()
+    phase_profiler.set_phase('move')
+    move = phase_profiler.wrap('move', process_file)
+    
+    with FixedProgressBar(total=len(valid_tasks), 
+                         desc=desc_text, 
+                         position='bottom') as move_bar:
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=io_workers) as move_executor:
+            # 提交所有移动任务
+            io_futures = []
+            for task in valid_tasks:
+                future = move_executor.submit(
+                    move, 
+                    task, 
+                    global_stats,
+                    move_bar,
+                    target_dev,
+                    content_catalog,
+                    journal
+                )
+                io_futures.append(future)
             
-        # 如果目标文件存在（可能是并发操作创建的），重新生成唯一路径
-        if os.path.exists(target_path):
-            target_dir = os.path.dirname(target_path)
-            filename = os.path.basename(target_path)
-            base, ext = os.path.splitext(filename)
-            target_path = generate_unique_filename(target_dir, base, ext)
-            
-        # 移动文件
-        shutil.move(source_path, target_path)
-        new_filename = os.path.basename(target_path)
-        logger.info(f"✓ 已移动: {filename} -> {date_folder}/{new_filename}")
-        stats.moved()
-        return True
-    except Exception as e:
-        logger.error(f"✗ 移动失败: {filename} - 错误: {str(e)}", exc_info=False)
-        stats.failed()
-        return False
+            # 等待任务完成，同时每分钟记录一次详细状态
+            for future in concurrent.futures.as_completed(io_futures):
+                try:
+                    future.result()  # 触发异常（如果有）
+                except Exception:
+                    pass
+                
+                # 每分钟记录一次详细状态
+                if time.time() - global_stats.last_log_time >= 60:
+                    global_stats.log_progress(force=True)
+    run_metrics.add_phase('move', time.time() - start_move)
+    return total_bytes
+
+def resume_organize(target_base_dir, max_workers, target_dev, content_catalog=None):
+    """从移动日志恢复中断的整理：不重新扫描和分析，跳过已完成的移动，核对未确认的移动，继续剩余部分"""
+    journal_path = os.path.join(target_base_dir, JOURNAL_FILENAME)
+    if not os.path.exists(journal_path):
+        logger.info("❗ 没有找到未完成的移动日志，无需恢复")
+        return
+    
+    started_ns, pending, done_count = MoveJournal.load_pending(journal_path)
+    logger.info(f"♻️ 恢复上次运行: 已完成 {done_count:,} 个移动, 未确认 {len(pending):,} 个")
+    global_stats = ProcessingStats(total_files=len(pending))
+    metrics_exporter.attach(global_stats)
+    journal = open_move_journal(target_base_dir, append=True)
+    finished = False
+    try:
+        if journal is not None:
+            journal.start(None, target_base_dir, resumed=True)
+        tasks = []
+        for record in pending:
+            try:
+                state = reconcile_pending_move(record, started_ns, content_catalog)
+            except OSError as e:
+                logger.error(f"✗ 核对失败: {record.name} - 错误: {str(e)}")
+                global_stats.failed()
+                continue
+            if state == 'redo':
+                tasks.append(record)
+            elif state == 'done':
+                if journal is not None:
+                    journal.completed(record)
+                global_stats.moved(record.size)
+            else:
+                logger.warning(f"源文件已消失: {record.name} (跳过)")
+                global_stats.skipped()
+        logger.info(f"🚀 继续移动 {len(tasks):,} 个文件...")
+        total_bytes = run_move_phase(tasks, global_stats, min(max_workers or 8, 8), target_dev,
+                                     content_catalog, journal)
+        finished = True
     finally:
-        # 更新进度条（如果有）
-        if progress_bar:
-            progress_bar.increment()
+        if journal is not None:
+            journal.close(finished)
+    
+    log_final_report(global_stats, total_bytes, target_base_dir)
 
-def organize_media(source_dir, target_base_dir=None, verbose=False, max_workers=None):
-    """主函数：按日期整理媒体文件（图片+视频）"""
+def organize_media(source_dir, target_base_dir=None, verbose=False, max_workers=None,
+                   use_cache=True, rebuild_cache=False, cache_max_entries=CACHE_MAX_ENTRIES,
+                   executor='thread', stream=False, scan_workers=SCAN_WORKERS, dedup=False,
+                   use_xattrs=True, resume=False, plan_path=None, apply_path=None, watch=False,
+                   full_rescan=False, report_path=None, profile_dir=None, profile_interval=None,
+                   metrics_textfile=None, metrics_port=None, log_file=None):
+    """主函数：按日期整理媒体文件（图片+视频）
+
+    plan_path: 只扫描和分析，把移动计划写入该文件；apply_path: 执行之前生成的计划；
+    watch: 持续监视源目录并整理新文件；report_path: 把各环节延迟分布和日期来源统计写入该JSON文件；
+    profile_dir: 按阶段剖析工作线程并写出pstats和折叠栈，profile_interval: 额外定时采样线程栈的间隔（秒）；
+    metrics_textfile / metrics_port: 以Prometheus格式定时重写指标文件 / 在127.0.0.1上提供 /metrics 端点；
+    log_file: 完整日志（包括每个文件）写入该轮转文件，控制台上的逐文件日志只按时间采样；
+    dedup: 全局内容去重，删除与其他文件内容相同的文件（即使文件名不同），默认关闭，只跳过目标位置已有的同名同内容文件。
+    """
     setup_logging(verbose)
+    hash_xattrs.enabled = use_xattrs and XATTR_SUPPORTED
+    run_metrics.reset()
+    run_metrics.enabled = report_path is not None or bool(metrics_textfile) or metrics_port is not None
+    started = time.time()
     
     # Windows终端支持ANSI转义序列
     if platform.system() == 'Windows':
@@ -672,7 +3983,9 @@ def organize_media(source_dir, target_base_dir=None, verbose=False, max_workers=
         except Exception:
             pass  # 如果失败则忽略，使用基础模式
     
-    # 设置目标目录
+    # 设置目标目录（执行计划时默认使用计划中的目标目录）
+    if target_base_dir is None and apply_path:
+        target_base_dir = read_plan_target(apply_path)
     if target_base_dir is None:
         target_base_dir = source_dir
     
@@ -684,61 +3997,135 @@ def organize_media(source_dir, target_base_dir=None, verbose=False, max_workers=
     logger.info(f"🖥️ 系统信息: Python {sys.version} on {sys.platform}")
     logger.info(f"⚙️ 配置: 目标目录={os.path.abspath(target_base_dir)} | 详细模式={'是' if verbose else '否'}")
     
+    # 目标根目录所在设备（同一设备的文件直接rename）
+    target_dev = os.stat(target_base_dir).st_dev
+    
+    # 目标库内容目录（已整理文件的哈希，移动时同步更新）
+    content_catalog = open_content_catalog(target_base_dir) if use_cache else None
+    mode = ('resume' if resume else 'watch' if watch else 'apply' if apply_path else
+            'plan' if plan_path else 'stream' if stream else 'batch')
+    # 之后的日志（包括工作线程的逐文件日志）经队列由写入线程输出
+    log_pipeline.start(verbose, log_file)
+    if profile_dir is not None:
+        phase_profiler.start(profile_dir, profile_interval)
+        phase_profiler.set_phase(mode)
+    if metrics_textfile or metrics_port is not None:
+        metrics_exporter.start(metrics_textfile, metrics_port)
+    try:
+        # 从移动日志恢复上次中断的运行
+        if resume:
+            resume_organize(target_base_dir, max_workers, target_dev, content_catalog)
+            return
+        
+        # 持续监视源目录
+        if watch:
+            metadata_cache = open_metadata_cache(target_base_dir, rebuild_cache, cache_max_entries) if use_cache else None
+            try:
+                global_stats, total_bytes = watch_media(source_dir, target_base_dir, max_workers, target_dev,
+                                                        metadata_cache, content_catalog)
+            finally:
+                close_metadata_cache(metadata_cache)
+            if global_stats.get_stats()['total']:
+                log_final_report(global_stats, total_bytes, target_base_dir)
+            return
+        
+        # 执行审阅过的计划
+        if apply_path:
+            logger.info(f"📋 执行计划: {os.path.abspath(apply_path)}")
+            global_stats = ProcessingStats(total_files=0)
+            metrics_exporter.attach(global_stats)
+            total_bytes = apply_plan(apply_path, global_stats, min(max_workers or 8, 8), target_dev, content_catalog)
+            log_final_report(global_stats, total_bytes, target_base_dir)
+            return
+        
+        # 流式模式：扫描、分析、移动重叠执行，不保存完整文件列表
+        if stream and plan_path:
+            logger.warning("生成计划使用批量模式（需要全局去重）")
+        elif stream:
+            if executor == 'process':
+                logger.warning("流式模式暂不支持进程池，日期分析使用线程")
+            worker_count = max_workers or 8
+            global_stats = ProcessingStats(total_files=0)
+            metrics_exporter.attach(global_stats)
+            metadata_cache = open_metadata_cache(target_base_dir, rebuild_cache, cache_max_entries) if use_cache else None
+            logger.info(f"🌊 流式整理: {worker_count} 个分析线程, {min(worker_count, 8)} 个移动线程")
+            try:
+                total_bytes = stream_organize_media(
+                    source_dir, target_base_dir, global_stats, metadata_cache,
+                    worker_count, min(worker_count, 8), scan_workers, target_dev, content_catalog
+                )
+            finally:
+                close_metadata_cache(metadata_cache)
+            if global_stats.get_stats()['total'] == 0:
+                logger.info("❗ 没有找到可处理的媒体文件，程序退出")
+                return
+            log_final_report(global_stats, total_bytes, target_base_dir)
+            return
+        
+        organize_files_batch(source_dir, target_base_dir, max_workers, use_cache, rebuild_cache,
+                             cache_max_entries, executor, scan_workers, dedup, verbose, target_dev,
+                             content_catalog, plan_path, full_rescan)
+    finally:
+        close_content_catalog(content_catalog)
+        phase_profiler.stop()
+        metrics_exporter.stop()
+        if report_path is not None:
+            # 中断的运行也写出已记录的指标
+            write_run_report(report_path, {
+                'mode': mode,
+                'source': os.path.abspath(source_dir),
+                'target': os.path.abspath(target_base_dir),
+                'workers': max_workers,
+                'scan_workers': scan_workers,
+                'executor': executor,
+                'cache': use_cache,
+                'dedup': dedup,
+                'xattrs': hash_xattrs.enabled,
+            }, started)
+        log_pipeline.stop()
+
+def organize_files_batch(source_dir, target_base_dir, max_workers, use_cache, rebuild_cache,
+                         cache_max_entries, executor, scan_workers, dedup, verbose, target_dev,
+                         content_catalog=None, plan_path=None, full_rescan=False):
+    """批量模式：完整扫描后依次去重、分析日期、并行移动（指定plan_path时只写出计划）"""
     # 1. 扫描媒体文件
     logger.info("🔍 开始扫描媒体文件...")
+    phase_profiler.set_phase('scan')
     start_scan = time.time()
     media_files = []
     total_size = 0
     skipped_dirs = []
     
-    # 用于扫描进度的虚拟进度条
-    scan_stats = ProcessingStats(total_files=float('inf'))
     last_log_time = time.time()
     
-    # 递归扫描所有文件
-    for root, dirs, files in os.walk(source_dir):
-        # 跳过系统目录（以.开头或特殊目录）
-        skippable_dirs = ['.', '@eaDir', '__MACOSX', '.DS_Store', 'Thumbs.db']
-        if any(skip_name in os.path.basename(root) for skip_name in skippable_dirs):
-            skipped_dirs.append(root)
-            continue
-        
-        # 避免进入某些系统目录 (.git, .svn等)
-        for d in list(dirs):
-            if d.startswith('.') or d in skippable_dirs:
-                logger.debug(f"跳过目录: {os.path.join(root, d)}")
-                dirs.remove(d)
-                skipped_dirs.append(os.path.join(root, d))
-            
-        for file in files:
-            # 检查文件扩展名
-            file_ext = os.path.splitext(file)[1].lower()
-            if file_ext in EXT_MAP:
-                file_path = os.path.join(root, file)
-                file_size = 0
-                
-                try:
-                    # 获取文件大小
-                    file_size = os.path.getsize(file_path)
-                    total_size += file_size
-                    # 添加到处理列表
-                    media_files.append((file, file_path))
-                except OSError as e:
-                    logger.warning(f"无法访问文件: {file_path}: {e}")
-                
-                # 每10秒或每500文件记录一次进度
-                current_time = time.time()
-                if current_time - last_log_time > 10 or len(media_files) % 500 == 0:
-                    logger.info(
-                        f"扫描进度: 已找到 {len(media_files):,}个文件 ({total_size/1024/1024:.1f} MB)"
-                    )
-                    last_log_time = current_time
+    # 递归扫描所有文件（未变化的目录使用上次的快照）
+    snapshot_cache = open_snapshot_cache(target_base_dir, rebuild_cache, full_rescan) if use_cache else None
+    scan_complete = False
+    try:
+        for record in iter_media_files(source_dir, skipped_dirs, scan_workers, snapshot_cache):
+            total_size += record.size
+            # 添加到处理列表
+            media_files.append(record)
+            
+            # 每10秒或每500文件记录一次进度
+            current_time = time.time()
+            if current_time - last_log_time > 10 or len(media_files) % 500 == 0:
+                logger.info(
+                    f"扫描进度: 已找到 {len(media_files):,}个文件 ({total_size/1024/1024:.1f} MB)"
+                )
+                last_log_time = current_time
+        scan_complete = True
+    finally:
+        close_snapshot_cache(snapshot_cache, source_dir if scan_complete else None)
+    if snapshot_cache is not None:
+        logger.info(f"📂 目录快照: 复用 {snapshot_cache.hits:,} 个目录, 重新读取 {snapshot_cache.misses:,} 个")
     
     # 扫描完成
     if skipped_dirs:
         logger.debug(f"⚠️ 跳过 {len(skipped_dirs)} 个系统目录")
     
     scan_time = time.time() - start_scan
+    run_metrics.add_phase('scan', scan_time)
     logger.info(
         f"📊 扫描完成! 找到 {len(media_files):,}个媒体文件 ({total_size/1024/1024:.1f} MB) "
         f"耗时: {scan_time:.1f}秒 ({len(media_files)/max(scan_time, 0.01):.1f}文件/秒)"
@@ -751,49 +4138,133 @@ def organize_media(source_dir, target_base_dir=None, verbose=False, max_workers=
     
     # 2. 设置全局统计
     global_stats = ProcessingStats(total_files=len(media_files))
+    metrics_exporter.attach(global_stats)
+    
+    # 打开持久化缓存并批量预加载本次扫描到的文件
+    metadata_cache = open_metadata_cache(target_base_dir, rebuild_cache, cache_max_entries) if use_cache else None
+    if metadata_cache is not None:
+        try:
+            hits = metadata_cache.get_many((MetadataCache.make_key(r) for r in media_files), complete=True)
+            logger.info(f"🗄️ 缓存命中 {len(hits):,}/{len(media_files):,} 个文件")
+        except sqlite3.Error as e:
+            logger.warning(f"缓存预加载失败: {e}")
+    
+    # 全局内容去重（同名冲突之外的重复文件）
+    if dedup:
+        phase_profiler.set_phase('dedup')
+        start_dedup = time.time()
+        duplicates = detect_duplicates(media_files, source_dir, target_base_dir, max_workers or 8,
+                                       content_catalog, full_rescan, dry_run=plan_path is not None)
+        run_metrics.add_phase('dedup', time.time() - start_dedup)
+        run_metrics.count('duplicates', len(duplicates))
+        if duplicates:
+            dup_size = sum(record.size for record in duplicates)
+            logger.info(
+                f"🔁 发现 {len(duplicates):,} 个重复文件 ({dup_size/1024/1024:.1f} MB) "
+                f"耗时: {time.time() - start_dedup:.1f}秒"
+            )
     
     # 3. 并行处理计算目标路径
     logger.info("🧠 计算目标路径...")
+    phase_profiler.set_phase('analyze')
+    start_analyze = time.time()
     compute_tasks = []
+    dry_run = plan_path is not None
+    directory_index = TargetDirectoryIndex(target_base_dir, create=not dry_run)
+    plan_writer = PlanWriter(plan_path, source_dir, target_base_dir) if dry_run else None
+    deferred_duplicates = []  # 重复文件的计划最后写出（需要保留文件的计划位置）
     
     # 自动计算合适的线程数
     worker_count = max_workers or min(32, max(4, int(len(media_files) / 100) + 1))
-    logger.info(f"🔧 使用 {worker_count} 个线程进行日期计算")
-    
-    # 创建计算进度条（固定在屏幕底部）
-    with FixedProgressBar(total=len(media_files), 
-                         desc="分析文件日期", 
-                         position='bottom') as compute_bar:
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=worker_count) as compute_executor:
-            # 提交所有计算任务
-            future_to_file = {}
-            for file_info in media_files:
-                future = compute_executor.submit(
-                    calculate_target_path, 
-                    file_info, 
-                    target_base_dir, 
-                    global_stats,
-                    compute_bar
+    if executor == 'process':
+        # 进程数不超过CPU核数（线程模式可超配，进程模式超配只增加开销）
+        worker_count = min(worker_count, os.cpu_count() or 1)
+        logger.info(f"🔧 使用 {worker_count} 个进程进行日期计算")
+    else:
+        logger.info(f"🔧 使用 {worker_count} 个线程进行日期计算")
+    
+    try:
+        # 创建计算进度条（固定在屏幕底部）
+        with FixedProgressBar(total=len(media_files), 
+                             desc="分析文件日期", 
+                             position='bottom') as compute_bar:
+        
+            if executor == 'process':
+                compute_tasks = compute_targets_in_processes(
+                    media_files, target_base_dir, global_stats,
+                    compute_bar, metadata_cache, worker_count, verbose, dry_run
                 )
-                future_to_file[future] = file_info[0]
+                if compute_tasks is None:
+                    return
+                if plan_writer is not None:
+                    for task in compute_tasks:
+                        if task.duplicate_of:
+                            deferred_duplicates.append(task)
+                        else:
+                            plan_writer.write(task)
+            else:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=worker_count) as compute_executor:
+                    analyze = phase_profiler.wrap('analyze', calculate_target_path)
+                    # 提交所有计算任务
+                    future_to_file = {}
+                    for record in media_files:
+                        future = compute_executor.submit(
+                            analyze, 
+                            record, 
+                            target_base_dir, 
+                            global_stats,
+                            compute_bar,
+                            metadata_cache,
+                            directory_index,
+                            content_catalog,
+                            dry_run
+                        )
+                        future_to_file[future] = record.name
             
-            # 批量等待结果
-            try:
-                for future in concurrent.futures.as_completed(future_to_file):
-                    filename = future_to_file[future]
+                    # 批量等待结果
                     try:
-                        task = future.result()
-                        if task:
-                            compute_tasks.append(task)
-                    except Exception as e:
-                        logger.debug(f"路径计算错误 {filename}: {str(e)}")
-            except KeyboardInterrupt:
-                logger.warning("用户中止计算任务!")
-                return
-            finally:
-                # 确保进度条更新到最新状态
-                compute_bar._update_display()
+                        for future in concurrent.futures.as_completed(future_to_file):
+                            filename = future_to_file[future]
+                            try:
+                                task = future.result()
+                                if task and plan_writer is not None:
+                                    # 计划逐条写出，不在内存中累积
+                                    if task.duplicate_of:
+                                        deferred_duplicates.append(task)
+                                    else:
+                                        plan_writer.write(task)
+                                elif task:
+                                    compute_tasks.append(task)
+                            except Exception as e:
+                                logger.debug(f"路径计算错误 {filename}: {str(e)}")
+                    except KeyboardInterrupt:
+                        logger.warning("用户中止计算任务!")
+                        return
+                    finally:
+                        # 确保进度条更新到最新状态
+                        compute_bar._update_display()
+        
+        if plan_writer is not None:
+            # 线程模式下分析结果直接填写在扫描记录中，进程模式下为返回的副本
+            planned = {r.path: r.target_path for r in (compute_tasks if executor == 'process' else media_files)
+                       if r.target_path and not r.duplicate_of}
+            for record in deferred_duplicates:
+                plan_writer.write(record, planned.get(record.duplicate_of))
+    
+    finally:
+        run_metrics.add_phase('analyze', time.time() - start_analyze)
+        # 写回缓存（中断时也保留已解析的结果）
+        close_metadata_cache(metadata_cache)
+        if plan_writer is not None:
+            plan_writer.close()
+    
+    if plan_writer is not None:
+        logger.info(
+            f"📝 计划已写入 {os.path.abspath(plan_path)}: 移动 {plan_writer.counts['move']:,} 个文件 "
+            f"({plan_writer.total_bytes/1024/1024:.1f} MB), 重复 {plan_writer.counts['duplicate']:,} 个"
+        )
+        logger.info(f"   审阅后执行: --apply {plan_path}")
+        return
     
     # 4. 处理无效/跳过的任务
     valid_tasks = [t for t in compute_tasks if t is not None]
@@ -807,71 +4278,26 @@ def organize_media(source_dir, target_base_dir=None, verbose=False, max_workers=
         
     logger.info(f"🚀 开始移动 {len(valid_tasks):,} 个文件...")
     
-    # 5. 并行处理文件移动
+    # 5. 并行处理文件移动（先写入移动日志，中断后可 --resume）
     # I/O操作使用较少线程
     io_workers = min(worker_count, 8)
-    
-    # 移动进度条
-    total_bytes = sum(t[3] for t in valid_tasks)
-    desc_text = f"移动文件 ({total_bytes/1024/1024:.1f} MB)"
-    
-    with FixedProgressBar(total=len(valid_tasks), 
-                         desc=desc_text, 
-                         position='bottom') as move_bar:
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=io_workers) as move_executor:
-            # 提交所有移动任务
-            io_futures = []
-            for task in valid_tasks:
-                future = move_executor.submit(
-                    process_file, 
-                    task, 
-                    global_stats,
-                    move_bar
-                )
-                io_futures.append(future)
-            
-            # 等待任务完成，同时每分钟记录一次详细状态
-            for future in concurrent.futures.as_completed(io_futures):
-                try:
-                    future.result()  # 触发异常（如果有）
-                except Exception:
-                    pass
-                
-                # 每分钟记录一次详细状态
-                if time.time() - global_stats.last_log_time >= 60:
-                    global_stats.log_progress(force=True)
+    journal_path = os.path.join(target_base_dir, JOURNAL_FILENAME)
+    if os.path.exists(journal_path):
+        logger.warning("⚠️ 上次运行未完成（可使用 --resume 继续），本次重新开始并覆盖移动日志")
+    journal = open_move_journal(target_base_dir)
+    finished = False
+    try:
+        if journal is not None:
+            journal.start(source_dir, target_base_dir)
+            journal.plan(valid_tasks)
+        total_bytes = run_move_phase(valid_tasks, global_stats, io_workers, target_dev, content_catalog, journal)
+        finished = True
+    finally:
+        if journal is not None:
+            journal.close(finished)
     
     # 6. 最终性能报告
-    stats = global_stats.get_stats()
-    elapsed = stats['elapsed']
-    
-    # 计算各种速率
-    file_rate = stats['processed'] / elapsed if elapsed > 0 else 0
-    mb_rate = total_bytes / (1024 * 1024) / elapsed if elapsed > 0 else 0
-    success_rate = (stats['moved'] / stats['processed']) * 100 if stats['processed'] > 0 else 0
-    
-    # 生成最终报告
-    summary = [
-        "=" * 70,
-        f"⭐ {Colors.OKGREEN}整理完成!{Colors.ENDC}",
-        "=" * 70,
-        f"📊 {Colors.PROGRESS_TEXT}统计数据:{Colors.ENDC}",
-        f"  总耗时: {Colors.PROGRESS_VALUE}{elapsed:.1f}秒{Colors.ENDC}",
-        f"  处理文件: {Colors.PROGRESS_VALUE}{stats['processed']}/{stats['total']}{Colors.ENDC} ({success_rate:.1f}% 成功率)",
-        f"  成功移动: {Colors.OKGREEN}{stats['moved']}{Colors.ENDC}个文件",
-        f"  跳过/重复: {Colors.WARNING}{stats['skipped']}{Colors.ENDC}个文件",
-        f"  处理失败: {Colors.FAIL}{stats['failed']}{Colors.ENDC}个文件",
-        "",
-        f"⚡ {Colors.PROGRESS_TEXT}性能指标:{Colors.ENDC}",
-        f"  速度: {Colors.PROGRESS_VALUE}{file_rate:.1f}文件/秒 | {mb_rate:.1f} MB/秒{Colors.ENDC}",
-        "",
-        f"🗂️ {Colors.PROGRESS_TEXT}目标位置:{Colors.ENDC} {Colors.PROGRESS_VALUE}{os.path.abspath(target_base_dir)}{Colors.ENDC}",
-        "=" * 70
-    ]
-    
-    for line in summary:
-        logger.info(line)
+    log_final_report(global_stats, total_bytes, target_base_dir)
 
 def run_cli():
     """命令行入口函数"""
@@ -889,6 +4315,32 @@ def run_cli():
     python organizer.py --target ~/Sorted_Photos
   高性能模式: 
     python organizer.py --workers 12
+  多进程分析（多核机器）: 
+    python organizer.py --executor process --workers 16
+  重建元数据缓存: 
+    python organizer.py --rebuild-cache
+  流式模式（超大目录）: 
+    python organizer.py --stream
+  继续上次中断的运行: 
+    python organizer.py --target ~/Sorted_Photos --resume
+  持续监视上传目录: 
+    python organizer.py --source ~/Upload --target ~/Sorted_Photos --watch
+  先生成计划，审阅后执行: 
+    python organizer.py --source ~/Photos --target ~/Sorted_Photos --plan plan.jsonl
+    python organizer.py --apply plan.jsonl
+  全局内容去重（删除内容相同但文件名不同的重复文件，建议先用 --plan 审阅）: 
+    python organizer.py --dedup
+  忽略目录快照，完整重新扫描: 
+    python organizer.py --full-rescan
+  输出运行报告（各环节延迟分布）: 
+    python organizer.py --report run.json
+  分阶段剖析（每5毫秒采样一次线程栈）: 
+    python organizer.py --profile prof --profile-interval 5
+  导出Prometheus指标（长时间监视）: 
+    python organizer.py --watch --metrics-port 9188
+    python organizer.py --metrics-textfile /var/lib/node_exporter/textfile/organize.prom
+  完整日志写入文件（控制台只采样显示逐文件记录）: 
+    python organizer.py --log-file organize.log
   调试模式: 
     python organizer.py --verbose""")
     
@@ -900,6 +4352,47 @@ def run_cli():
                         help="显示详细日志（调试用）")
     parser.add_argument("--workers", type=int, default=8,
                         help="并行工作线程数（默认8）", metavar="N")
+    parser.add_argument("--scan-workers", type=int, default=SCAN_WORKERS,
+                        help=f"并行扫描目录的线程数（默认{SCAN_WORKERS}）", metavar="N")
+    parser.add_argument("--executor", choices=("thread", "process"), default="thread",
+                        help="日期分析阶段的并行方式（process 使用多进程，适合多核机器）")
+    parser.add_argument("--stream", action="store_true",
+                        help="流式模式：扫描、分析和移动同时进行（适合超大目录）")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="不使用持久化元数据缓存和内容目录")
+    parser.add_argument("--rebuild-cache", action="store_true",
+                        help="清空并重建元数据缓存")
+    parser.add_argument("--cache-size", type=int, default=CACHE_MAX_ENTRIES,
+                        help=f"元数据缓存最大条目数（默认{CACHE_MAX_ENTRIES}）", metavar="N")
+    parser.add_argument("--full-rescan", action="store_true",
+                        help="忽略目录快照，重新读取源目录中的每个目录（--dedup时同时重新遍历目标库）")
+    parser.add_argument("--dedup", action="store_true",
+                        help="全局内容去重：删除与其他文件内容相同的文件（即使文件名不同），"
+                             "保留顺序为 目标库中已有的 > 已在日期文件夹中的 > 修改时间最早的 > 文件名最短的 > 路径，"
+                             "符号链接不参与；默认只跳过目标位置已有的同名同内容文件")
+    parser.add_argument("--no-xattr", action="store_true",
+                        help="不在文件扩展属性中读写内容哈希")
+    parser.add_argument("--report", default=None, metavar="FILE",
+                        help="把各阶段耗时、各环节延迟分布和日期来源统计写入JSON文件")
+    parser.add_argument("--profile", default=None, metavar="DIR",
+                        help="按阶段剖析各工作线程，把pstats和火焰图折叠栈写入DIR")
+    parser.add_argument("--profile-interval", type=float, default=0, metavar="MS",
+                        help="配合--profile，每隔MS毫秒采样所有线程的调用栈（可看到阻塞在ffprobe等处的时间）")
+    parser.add_argument("--metrics-textfile", default=None, metavar="FILE",
+                        help=f"以Prometheus文本格式每{METRICS_INTERVAL:.0f}秒重写指标文件（node_exporter textfile collector）")
+    parser.add_argument("--metrics-port", type=int, default=None, metavar="PORT",
+                        help="在 127.0.0.1:PORT/metrics 提供Prometheus指标（0表示由系统分配空闲端口）")
+    parser.add_argument("--log-file", default=None, metavar="FILE",
+                        help="完整日志（包括每个文件的移动记录）写入轮转日志文件，控制台只采样显示")
+    run_mode = parser.add_mutually_exclusive_group()
+    run_mode.add_argument("--resume", action="store_true",
+                          help="根据目标目录中的移动日志继续上次中断的运行（不重新扫描和分析）")
+    run_mode.add_argument("--plan", default=None, metavar="FILE",
+                          help="只扫描和分析，把移动计划写入FILE（JSON Lines，不移动任何文件）")
+    run_mode.add_argument("--apply", default=None, metavar="FILE",
+                          help="执行之前生成的计划文件（不重新分析）")
+    run_mode.add_argument("--watch", action="store_true",
+                          help="持续监视源目录，新文件写入完成后自动整理（Ctrl-C退出）")
     
     # 添加ASCII艺术欢迎界面
     banner = r"""
@@ -912,6 +4405,8 @@ def run_cli():
     """
     
     args = parser.parse_args()
+    if args.metrics_port is not None and not 0 <= args.metrics_port <= 65535:
+        parser.error(f"--metrics-port 必须在 0-65535 之间: {args.metrics_port}")
     
     print(f"\n\033[96m{banner}\033[0m")
     print(f"\033[96m{'='*70}\033[0m")
@@ -931,7 +4426,26 @@ def run_cli():
             source_dir=args.source,
             target_base_dir=args.target,
             verbose=args.verbose,
-            max_workers=args.workers
+            max_workers=args.workers,
+            use_cache=not args.no_cache,
+            rebuild_cache=args.rebuild_cache,
+            cache_max_entries=args.cache_size,
+            executor=args.executor,
+            stream=args.stream,
+            scan_workers=args.scan_workers,
+            dedup=args.dedup,
+            use_xattrs=not args.no_xattr,
+            resume=args.resume,
+            plan_path=args.plan,
+            apply_path=args.apply,
+            watch=args.watch,
+            full_rescan=args.full_rescan,
+            report_path=args.report,
+            profile_dir=args.profile,
+            profile_interval=args.profile_interval / 1000 if args.profile_interval > 0 else None,
+            metrics_textfile=args.metrics_textfile,
+            metrics_port=args.metrics_port,
+            log_file=args.log_file
         )
     except KeyboardInterrupt:
         print(f"\n{Colors.FAIL}操作被用户中断!{Colors.ENDC}")